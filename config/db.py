@@ -0,0 +1,58 @@
+# config/db.py
+"""
+DATABASE_URL から DATABASES["default"] を作る（settings / settings_prod 共通）。
+
+Postgres のときだけ以下を環境変数で調整できる：
+- DB_POOL=1            : psycopg 3 のコネクションプール（Django 5.1+ の OPTIONS["pool"]）
+  DB_POOL_MIN_SIZE / DB_POOL_MAX_SIZE / DB_POOL_TIMEOUT / DB_POOL_MAX_LIFETIME
+  ※ プール時は CONN_MAX_AGE=0 必須（Django の制約）。チェックアウト時に疎通確認する
+- DB_CONN_MAX_AGE      : プール無しのときの永続接続秒数
+- DB_STATEMENT_TIMEOUT_MS : Web ワーカーの statement_timeout（0 で無効）
+  接続時の startup パラメータで渡すので、クエリごとの往復は増えない。
+  Web ワーカー（config/wsgi.py が DN_WEB_WORKER=1 を立てる）だけに付け、
+  migrate・rebuild_* などの管理コマンドは既定で時間制限なし
+- DB_SSL_REQUIRE       : sslmode=require を付けるか
+"""
+import os
+
+import dj_database_url
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ("1", "true")
+
+
+def database_config(default_url: str, conn_max_age: int = 60, ssl_require: bool = True) -> dict:
+    url = os.getenv("DATABASE_URL") or default_url
+    use_pool = _env_flag("DB_POOL", "0")
+    is_postgres = url.startswith(("postgres://", "postgresql://", "pgsql://"))
+    cfg = dj_database_url.parse(
+        url,
+        conn_max_age=0 if use_pool else _env_int("DB_CONN_MAX_AGE", conn_max_age),
+        conn_health_checks=True,
+        # sslmode は SQLite に渡すと接続エラーになる
+        ssl_require=is_postgres and _env_flag("DB_SSL_REQUIRE", "1" if ssl_require else "0"),
+    )
+    if not is_postgres:
+        return cfg
+
+    options = cfg.setdefault("OPTIONS", {})
+    timeout_ms = _env_int("DB_STATEMENT_TIMEOUT_MS", 15000) if _env_flag("DN_WEB_WORKER", "0") else 0
+    if timeout_ms > 0:
+        # 集計クエリの暴走で gunicorn ワーカーを握り続けないように
+        params = f"-c statement_timeout={timeout_ms} -c idle_in_transaction_session_timeout={timeout_ms * 4}"
+        options["options"] = f"{options['options']} {params}" if options.get("options") else params
+
+    if use_pool:
+        options["pool"] = {
+            "min_size": _env_int("DB_POOL_MIN_SIZE", 1),
+            "max_size": _env_int("DB_POOL_MAX_SIZE", 4),
+            "timeout": _env_int("DB_POOL_TIMEOUT", 10),          # 空き待ちの上限秒
+            "max_lifetime": _env_int("DB_POOL_MAX_LIFETIME", 1800),
+            "max_idle": 300,
+        }
+    return cfg
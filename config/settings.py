@@ -17,7 +17,10 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
-    "rest_framework",
+    # rest_framework は INSTALLED_APPS に入れない（JSONRenderer だけなので不要）。
+    # 入れるとテンプレートエンジン初期化時に rest_framework.templatetags → compat 経由で
+    # yaml / pygments / django.contrib.postgres まで import され、各ワーカーの初回描画が ~150ms 遅れる。
+    # Browsable API を使う場合は戻すこと。
     "corsheaders",
     "core",
 ]
@@ -35,6 +38,10 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# 負荷試験（manage.py loadtest）用：各レスポンスに X-DB-Queries を付ける
+if os.getenv("DN_QUERY_COUNT_HEADER", "0") == "1":
+    MIDDLEWARE.insert(0, "core.middleware.QueryCountMiddleware")
+
 ROOT_URLCONF = "config.urls"
 
 # テンプレート
@@ -49,6 +56,7 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                "core.context_processors.dn_data",
             ],
         },
     },
@@ -57,20 +65,38 @@ TEMPLATES = [
 WSGI_APPLICATION = "config.wsgi.application"
 
 # ===== DB（DATABASE_URL があれば Postgres、無ければ SQLite）=====
+# プール / statement_timeout などは config/db.py の環境変数を参照
+from .db import database_config
+
 DATABASES = {
+    "default": database_config(
+        default_url=f"sqlite:///{BASE_DIR / 'db.sqlite3'}",
+        conn_max_age=60,
+        ssl_require=True,
+    )
+}
+
+# ===== キャッシュ =====
+# default : プロセス内（locmem）。core.singleflight の手前の層と、プロセス内で完結するキャッシュ用
+# shared  : 同じホストのワーカー間で共有（ファイル）。複数ホストなら DN_SHARED_CACHE=db
+#           （テーブルは boot_prepare が createcachetable で作る）
+# 計算結果の単一実行（stampede 対策）は core.singleflight を参照
+_SHARED_CACHE = os.getenv("DN_SHARED_CACHE", "file")
+CACHES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
-    }
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "dn-local",
+        "OPTIONS": {"MAX_ENTRIES": 5000},
+    },
+    "shared": (
+        {"BACKEND": "django.core.cache.backends.db.DatabaseCache", "LOCATION": "dn_cache",
+         "OPTIONS": {"MAX_ENTRIES": 50_000}}
+        if _SHARED_CACHE == "db" else
+        {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+         "LOCATION": os.getenv("DN_CACHE_DIR", str(BASE_DIR / ".cache")),
+         "OPTIONS": {"MAX_ENTRIES": 20_000}}
+    ),
 }
-DATABASE_URL = os.getenv("DATABASE_URL")
-if DATABASE_URL:
-    import dj_database_url
-    DATABASES["default"] = dj_database_url.config(
-        default=DATABASE_URL,
-        conn_max_age=int(os.getenv("DB_CONN_MAX_AGE", "60")),
-        ssl_require=os.getenv("DB_SSL_REQUIRE", "1").lower() == "1",
-    )
 
 LANGUAGE_CODE = "ja"
 TIME_ZONE = "Asia/Tokyo"
@@ -82,17 +108,22 @@ STATIC_URL = "/static/"
 STATIC_ROOT = BASE_DIR / "staticfiles"
 STATICFILES_DIRS = [BASE_DIR / "static"]  # 任意。core/static は自動検出
 
-# WhiteNoise（まずは安全モード。安定後に FORCE_STATIC_MANIFEST=1 で切替）
-if os.getenv("FORCE_STATIC_MANIFEST", "0").lower() == "1":
+# WhiteNoise：ハッシュ付きファイル名＋ .gz/.br を collectstatic 時に生成（既定ON）
+# ハッシュ付きファイルは WhiteNoise が Cache-Control: immutable（1年）で返す。
+# 問題があれば FORCE_STATIC_MANIFEST=0 で非ハッシュ（CompressedStaticFilesStorage）へ戻せる。
+if os.getenv("FORCE_STATIC_MANIFEST", "1").lower() == "1":
     STORAGES = {
-        "staticfiles": {"BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage"}
+        "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+        "staticfiles": {"BACKEND": "core.storage.ManifestStaticStorage"},
     }
 else:
     STORAGES = {
-        "staticfiles": {"BACKEND": "whitenoise.storage.CompressedStaticFilesStorage"}
+        "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+        "staticfiles": {"BACKEND": "whitenoise.storage.CompressedStaticFilesStorage"},
     }
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+AUTH_USER_MODEL = "core.User"
 
 # DRF
 REST_FRAMEWORK = {
@@ -1,7 +1,7 @@
 # config/settings_prod.py
 from .settings import *  # ベース設定を継承
 import os
-import dj_database_url
+from .db import database_config
 
 DEBUG = False
 
@@ -54,7 +54,9 @@ if whitenoise_mw not in MIDDLEWARE:
 
 STATIC_URL = "/static/"
 STATIC_ROOT = BASE_DIR / "staticfiles"
-STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
+# STORAGES["staticfiles"] は settings.py の core.storage.ManifestStaticStorage を継承
+# ハッシュ付きファイルは immutable（1年）。ハッシュ無しファイルだけこの max-age で CDN に載せる
+WHITENOISE_MAX_AGE = int(os.getenv("WHITENOISE_MAX_AGE", "3600"))
 
 # ===== Media（画像の保存先）=====
 # Koyeb のコンテナでは /app が read-only になることがあるため /tmp 配下をデフォルトに。
@@ -69,10 +71,10 @@ FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024   # 10 MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024   # 10 MB
 
 # ===== Database（Neon 想定：SSL強制）=====
+# 本番はワーカー当たりの永続接続を長めに。DB_POOL=1 でプールへ切替（config/db.py）
 DATABASES = {
-    "default": dj_database_url.config(
-        env="DATABASE_URL",
-        default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}",
+    "default": database_config(
+        default_url=f"sqlite:///{BASE_DIR / 'db.sqlite3'}",
         conn_max_age=600,
         ssl_require=True,  # ★ Neon などなら sslmode=require を強制
     )
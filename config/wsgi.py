@@ -12,5 +12,7 @@ import os
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+# DB の statement_timeout は Web ワーカーだけ（config/db.py）。settings を読む前に立てる
+os.environ.setdefault('DN_WEB_WORKER', '1')
 
 application = get_wsgi_application()
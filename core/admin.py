@@ -1,6 +1,70 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
-from .models import User, DeliveryRecord, EntranceInfo, OcrImport
+from django.core.paginator import Paginator
+from django.db import connection
+from django.utils.functional import cached_property
+from . import entrance_search
+from .models import User, DeliveryRecord, EntranceInfo, OcrImport, UserAiConsent
+
+
+# --- 大きいテーブル向けの共通部品 ---
+class EstimatedCountPaginator(Paginator):
+    """
+    COUNT(*) を避けるページャ。
+    - 絞り込み無し + Postgres: pg_class.reltuples の推定値
+    - それ以外: COUNT_CAP 件で打ち切った COUNT（LIMIT 付きサブクエリ）
+    """
+    COUNT_CAP = 10_000
+
+    @cached_property
+    def count(self):
+        qs = self.object_list
+        if connection.vendor == "postgresql" and not qs.query.where:
+            with connection.cursor() as cur:
+                cur.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                            [qs.model._meta.db_table])
+                row = cur.fetchone()
+            if row and row[0] > self.COUNT_CAP:
+                return row[0]
+        return qs.order_by()[:self.COUNT_CAP].count()
+
+
+class UsernameFilter(admin.SimpleListFilter):
+    """全ユーザーを並べる代わりに、ユーザー名の完全一致入力で絞る（username は unique index）。"""
+    title = "ユーザー名"
+    parameter_name = "username"
+    template = "admin/input_filter.html"
+
+    def lookups(self, request, model_admin):
+        return ((None, None),)  # 入力欄だけ出すためのダミー
+
+    def choices(self, changelist):
+        all_choice = next(super().choices(changelist))
+        all_choice["query_parts"] = [
+            (k, v)
+            for k, vals in changelist.get_filters_params().items() if k != self.parameter_name
+            for v in (vals if isinstance(vals, list) else [vals])
+        ]
+        yield all_choice
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(user__username=self.value())
+        return queryset
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False   # 「全 N 件」用の2回目の COUNT を出さない
+    list_per_page = 50
+    changelist_defer = ()            # 一覧では読まない大きい列
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        match = getattr(request, "resolver_match", None)
+        if self.changelist_defer and match and match.url_name.endswith("_changelist"):
+            qs = qs.defer(*self.changelist_defer)
+        return qs
 
 
 @admin.register(User)
@@ -9,19 +73,49 @@ class UserAdmin(DjangoUserAdmin):
 
 
 @admin.register(DeliveryRecord)
-class DeliveryRecordAdmin(admin.ModelAdmin):
-    list_display = ("user", "date", "orders_completed", "earnings", "hours_worked", "created_at")
-    list_filter = ("date", "user")
+class DeliveryRecordAdmin(ScalableAdmin):
+    list_display = ("user", "date", "orders_completed", "earnings", "hours_worked", "area_slug", "created_at")
+    list_select_related = ("user",)
+    list_filter = (UsernameFilter,)
+    date_hierarchy = "date"
+    ordering = ("-date", "-id")
+    search_fields = ("=user__username",)
+    autocomplete_fields = ("user",)
+    changelist_defer = ("note",)
 
 
 @admin.register(EntranceInfo)
 class EntranceInfoAdmin(admin.ModelAdmin):
     list_display = ("user", "address", "created_at")
+    list_select_related = ("user",)
     search_fields = ("address", "note")
+    autocomplete_fields = ("user",)
+
+    def get_search_results(self, request, queryset, search_term):
+        # icontains の全走査ではなく entrance_search の索引で候補を絞る
+        if not search_term:
+            return queryset, False
+        ids = [e.id for e in entrance_search.search(search_term, limit=entrance_search.CANDIDATES, min_score=0)]
+        return queryset.filter(id__in=ids), False
 
 
 @admin.register(OcrImport)
-class OcrImportAdmin(admin.ModelAdmin):
+class OcrImportAdmin(ScalableAdmin):
     list_display = ("id", "user", "status", "created_record", "created_at")
+    list_select_related = ("user", "created_record__user")
+    list_filter = ("status", UsernameFilter)
+    date_hierarchy = "created_at"
+    ordering = ("-id",)
     readonly_fields = ("raw_text", "parsed_json")
-    search_fields = ("raw_text",)
+    # raw_text の LIKE 全走査はしない。ID とユーザー名（どちらも索引あり）の完全一致のみ
+    search_fields = ("=id", "=user__username")
+    autocomplete_fields = ("user",)
+    raw_id_fields = ("created_record",)
+    changelist_defer = ("raw_text", "parsed_json", "message")
+
+
+@admin.register(UserAiConsent)
+class UserAiConsentAdmin(admin.ModelAdmin):
+    list_display = ("user", "share_aggregated", "updated_at")
+    list_filter = ("share_aggregated",)
+    raw_id_fields = ("user",)
@@ -1,6 +1,18 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def _ensure_entrance_index(sender, using, **kwargs):
+    # SQLite でテーブルを作り直すマイグレーションの後に FTS のトリガーを戻す
+    from django.db import connections
+    from . import entrance_search
+    entrance_search.ensure_index(connections[using])
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        post_migrate.connect(_ensure_entrance_index, sender=self)
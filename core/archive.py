@@ -0,0 +1,329 @@
+# core/archive.py
+"""
+古い DeliveryRecord / OcrImport の月次アーカイブ。
+- カットオフより古い行をホットテーブルから削除し、(種別, ユーザー, 月) ごとに
+  gzip 圧縮した JSON Lines として ArchiveChunk へ移す
+- 削除した DeliveryRecord の合計は DeliveryMonthlyStat に残す
+- 削除は通常の QuerySet.delete()（post_delete の受け手・SET_NULL はそのまま動く）を archiving() の中で行う。
+  受け手は is_archiving() を見て、同期の tombstone を出さず（端末に残った過去分はそのまま）、
+  補正の行ごとの引き算・順位のサンプルの行ごとの削除を省く（バッチごとに1回まとめて行う）
+- OCR 画像の削除はコミット後（transaction.on_commit）。ロールバックしたら元の画像は残る
+- delivery_history() でホット＋アーカイブを透過的に読む（過去分の参照はまれ）
+"""
+import contextlib
+import datetime
+import gzip
+import io
+import json
+import os
+import statistics
+import threading
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from . import calibration, rankings
+from .models import ArchiveChunk, DeliveryMonthlyStat, DeliveryRecord, OcrImport
+
+DELIVERY_FIELDS = (
+    "id", "date", "orders_completed", "earnings", "hours_worked",
+    "start_time", "end_time", "area_slug", "note", "created_at",
+)
+OCR_FIELDS = (
+    "id", "image", "raw_text", "parsed_json", "created_record_id",
+    "status", "message", "created_at",
+)
+OCR_IMAGE_MODES = ("prune", "recompress", "keep")
+
+
+def month_start(d: datetime.date) -> datetime.date:
+    return d.replace(day=1)
+
+
+# ---------- 圧縮 ----------
+def encode_rows(rows) -> bytes:
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode="wb", compresslevel=9, mtime=0) as gz:
+        for r in rows:
+            gz.write(json.dumps(r, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+            gz.write(b"\n")
+    return buf.getvalue()
+
+
+def decode_rows(payload) -> list:
+    raw = gzip.decompress(bytes(payload))
+    return [json.loads(line) for line in raw.splitlines() if line]
+
+
+def _restore_delivery(row: dict) -> dict:
+    """JSON 化で文字列になった型を DeliveryRecord.values() と同じ型へ戻す。"""
+    row["date"] = datetime.date.fromisoformat(row["date"])
+    for k in ("start_time", "end_time"):
+        if row.get(k):
+            row[k] = datetime.time.fromisoformat(row[k])
+    if row.get("created_at"):
+        row["created_at"] = datetime.datetime.fromisoformat(row["created_at"])
+    for k in ("earnings", "hours_worked"):
+        if row.get(k) is not None:
+            row[k] = Decimal(row[k])
+    row["archived"] = True
+    return row
+
+
+def _append_chunks(kind: str, grouped: dict):
+    """grouped: {(user_id, month): [row, ...]} を既存チャンクへ追記（無ければ作成）。"""
+    for (user_id, month), rows in grouped.items():
+        chunk = (ArchiveChunk.objects.select_for_update()
+                 .filter(kind=kind, user_id=user_id, month=month).first())
+        if chunk is None:
+            ArchiveChunk.objects.create(
+                kind=kind, user_id=user_id, month=month,
+                row_count=len(rows), payload=encode_rows(rows),
+            )
+        else:
+            merged = decode_rows(chunk.payload) + rows
+            chunk.payload = encode_rows(merged)
+            chunk.row_count = len(merged)
+            chunk.save(update_fields=["payload", "row_count", "updated_at"])
+
+
+def _add_monthly_stats(rows):
+    acc = defaultdict(lambda: [0, 0, Decimal("0"), Decimal("0")])
+    for r in rows:
+        key = (r["user_id"], month_start(r["date"]), r["area_slug"] or "")
+        a = acc[key]
+        a[0] += 1
+        a[1] += r["orders_completed"] or 0
+        a[2] += r["earnings"] or 0
+        a[3] += r["hours_worked"] or 0
+    for (user_id, month, slug), (n, orders, earn, hours) in acc.items():
+        stat, _ = DeliveryMonthlyStat.objects.get_or_create(user_id=user_id, month=month, area_slug=slug)
+        DeliveryMonthlyStat.objects.filter(pk=stat.pk).update(
+            records=F("records") + n,
+            orders_completed=F("orders_completed") + orders,
+            earnings=F("earnings") + earn,
+            hours_worked=F("hours_worked") + hours,
+        )
+
+
+_local = threading.local()
+
+
+@contextlib.contextmanager
+def archiving():
+    """この中の削除はアーカイブによるもの（signals の受け手が is_archiving() で見分ける）。"""
+    _local.active = True
+    try:
+        yield
+    finally:
+        _local.active = False
+
+
+def is_archiving() -> bool:
+    return getattr(_local, "active", False)
+
+
+# ---------- アーカイブ本体 ----------
+def archive_deliveries(cutoff: datetime.date, batch_size: int = 2000) -> int:
+    """date < cutoff の DeliveryRecord をアーカイブ。移動した件数を返す。"""
+    moved = 0
+    qs = DeliveryRecord.objects.filter(date__lt=cutoff).order_by("user_id", "date")
+    while True:
+        batch = list(qs.values("user_id", *DELIVERY_FIELDS)[:batch_size])
+        if not batch:
+            break
+        grouped = defaultdict(list)
+        by_user = defaultdict(list)
+        for r in batch:
+            row = {k: r[k] for k in DELIVERY_FIELDS}
+            grouped[(r["user_id"], month_start(r["date"]))].append(row)
+            by_user[r["user_id"]].append(r["id"])
+        ids = [r["id"] for r in batch]
+        with transaction.atomic(), archiving():
+            _append_chunks("delivery", grouped)
+            _add_monthly_stats(batch)
+            DeliveryRecord.objects.filter(id__in=ids).delete()
+            for user_id, rids in by_user.items():
+                calibration.apply_changes(user_id, removed=rids, create=False)
+            rankings.records_removed(ids)
+        moved += len(batch)
+    return moved
+
+
+def _recompress_image(name: str) -> str:
+    """OCR 画像をグレースケール・縮小 JPEG に置き換え、新しいパスを返す。"""
+    from PIL import Image
+
+    with default_storage.open(name, "rb") as f:
+        img = Image.open(f)
+        img = img.convert("L")
+        img.thumbnail((1280, 1280))
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=60, optimize=True)
+    base, _ = os.path.splitext(name)
+    return default_storage.save(f"ocr/archive/{os.path.basename(base)}.jpg", io.BytesIO(out.getvalue()))
+
+
+def _handle_images(rows, mode: str) -> list:
+    """行の image を書き換え、コミット後に消す元の画像のパスを返す。"""
+    old = []
+    for r in rows:
+        name = r.get("image")
+        if not name or mode == "keep":
+            continue
+        if mode == "prune":
+            r["image"] = None
+            old.append(name)
+        elif mode == "recompress":
+            try:
+                r["image"] = _recompress_image(name)
+                old.append(name)
+            except (OSError, ValueError):
+                # ファイルが既に無い・壊れている場合はパスだけ残す
+                pass
+    return old
+
+
+def _delete_files(names):
+    for name in names:
+        try:
+            default_storage.delete(name)
+        except OSError:
+            pass
+
+
+def archive_ocr_imports(cutoff_dt: datetime.datetime, batch_size: int = 500,
+                        image_mode: str = "prune") -> int:
+    """created_at < cutoff_dt の OcrImport をアーカイブ。画像は image_mode に従い処理。"""
+    if image_mode not in OCR_IMAGE_MODES:
+        raise ValueError(f"image_mode must be one of {OCR_IMAGE_MODES}")
+    moved = 0
+    qs = OcrImport.objects.filter(created_at__lt=cutoff_dt).order_by("user_id", "created_at")
+    while True:
+        batch = list(qs.values("user_id", *OCR_FIELDS)[:batch_size])
+        if not batch:
+            break
+        rows = [{k: r[k] for k in OCR_FIELDS} for r in batch]
+        # 縮小版はコミット前に作り、元の画像はコミット後に消す
+        old_images = _handle_images(rows, image_mode)
+        grouped = defaultdict(list)
+        for r, row in zip(batch, rows):
+            grouped[(r["user_id"], month_start(timezone.localdate(r["created_at"])))].append(row)
+        with transaction.atomic(), archiving():
+            _append_chunks("ocr", grouped)
+            OcrImport.objects.filter(id__in=[r["id"] for r in batch]).delete()
+            if old_images:
+                transaction.on_commit(lambda names=old_images: _delete_files(names))
+        moved += len(batch)
+    return moved
+
+
+# ---------- 透過的な読み出し ----------
+def delivery_history(user_id: int, since: datetime.date = None, until: datetime.date = None) -> list:
+    """
+    ホット＋アーカイブの配達実績を日付降順の dict リストで返す。
+    アーカイブ行には archived=True が付く。
+    """
+    hot = DeliveryRecord.objects.filter(user_id=user_id)
+    chunks = ArchiveChunk.objects.filter(kind="delivery", user_id=user_id)
+    if since:
+        hot = hot.filter(date__gte=since)
+        chunks = chunks.filter(month__gte=month_start(since))
+    if until:
+        hot = hot.filter(date__lte=until)
+        chunks = chunks.filter(month__lte=until)
+
+    rows = list(hot.values(*DELIVERY_FIELDS))
+    for chunk in chunks.only("payload"):
+        for r in decode_rows(chunk.payload):
+            r = _restore_delivery(r)
+            if (since and r["date"] < since) or (until and r["date"] > until):
+                continue
+            rows.append(r)
+    rows.sort(key=lambda r: r["date"], reverse=True)
+    return rows
+
+
+def iter_archived_deliveries(user_ids=None, since: datetime.date = None, until: datetime.date = None):
+    """
+    アーカイブ済み DeliveryRecord を (user_id, date) 昇順で1行ずつ返す（user_id 付き）。
+    チャンク単位でしか展開しないのでメモリは1ユーザー1か月分で済む。
+    user_ids=None で全ユーザー。
+    """
+    chunks = ArchiveChunk.objects.filter(kind="delivery").order_by("user_id", "month")
+    if user_ids is not None:
+        chunks = chunks.filter(user_id__in=user_ids)
+    if since:
+        chunks = chunks.filter(month__gte=month_start(since))
+    if until:
+        chunks = chunks.filter(month__lte=until)
+    for chunk in chunks.only("user_id", "payload").iterator(chunk_size=50):
+        rows = [_restore_delivery(r) for r in decode_rows(chunk.payload)]
+        rows.sort(key=lambda r: r["date"])
+        for r in rows:
+            if (since and r["date"] < since) or (until and r["date"] > until):
+                continue
+            r["user_id"] = chunk.user_id
+            yield r
+
+
+def monthly_summary(user_id: int) -> list:
+    """アーカイブ済み月次集計＋ホットテーブルの月次集計を合算して返す。"""
+    acc = defaultdict(lambda: {"records": 0, "orders_completed": 0,
+                               "earnings": Decimal("0"), "hours_worked": Decimal("0")})
+    for s in DeliveryMonthlyStat.objects.filter(user_id=user_id):
+        a = acc[(s.month, s.area_slug)]
+        a["records"] += s.records
+        a["orders_completed"] += s.orders_completed
+        a["earnings"] += s.earnings
+        a["hours_worked"] += s.hours_worked
+    for r in DeliveryRecord.objects.filter(user_id=user_id).values("date", "area_slug", "orders_completed",
+                                                                  "earnings", "hours_worked"):
+        a = acc[(month_start(r["date"]), r["area_slug"] or "")]
+        a["records"] += 1
+        a["orders_completed"] += r["orders_completed"] or 0
+        a["earnings"] += r["earnings"] or 0
+        a["hours_worked"] += r["hours_worked"] or 0
+    return [{"month": m, "area_slug": slug, **v} for (m, slug), v in sorted(acc.items(), reverse=True)]
+
+
+# ---------- 計測 ----------
+def table_sizes(tables=("core_deliveryrecord", "core_ocrimport", "core_archivechunk")) -> dict:
+    """{table: {"table_bytes": int|None, "index_bytes": int|None}}（Postgres / SQLite dbstat）"""
+    out = {}
+    with connection.cursor() as cur:
+        for t in tables:
+            tb = ib = None
+            try:
+                if connection.vendor == "postgresql":
+                    cur.execute("SELECT pg_relation_size(%s), pg_indexes_size(%s)", [t, t])
+                    tb, ib = cur.fetchone()
+                elif connection.vendor == "sqlite":
+                    cur.execute("SELECT COALESCE(SUM(pgsize), 0) FROM dbstat WHERE name = %s", [t])
+                    tb = cur.fetchone()[0]
+                    cur.execute(
+                        "SELECT COALESCE(SUM(pgsize), 0) FROM dbstat WHERE name IN "
+                        "(SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = %s)", [t])
+                    ib = cur.fetchone()[0]
+            except Exception:
+                pass  # dbstat 無効ビルドなど
+            out[t] = {"table_bytes": tb, "index_bytes": ib}
+    return out
+
+
+def hot_query_ms(days: int = 90, repeat: int = 5) -> float:
+    """直近 days 日のエリア別集計（ホット読み出しの代表）の中央値 ms。"""
+    since = datetime.date.today() - datetime.timedelta(days=days)
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        list(DeliveryRecord.objects.filter(date__gte=since)
+             .values("area_slug").annotate(n=Count("id"), earn=Sum("earnings")))
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
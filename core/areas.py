@@ -12,3 +12,14 @@ AREAS = [
 ]
 
 AREA_INDEX = {a["slug"]: a for a in AREAS}
+AREAS_BY_SLUG = AREA_INDEX  # ml / train_lgbm からの参照名
+
+
+def get_area(slug: str) -> dict:
+    """slug からエリア定義を返す（未知の slug は KeyError）。"""
+    return AREA_INDEX[slug]
+
+
+def area_choices() -> list:
+    """フォーム用の (slug, name) リスト。"""
+    return [(a["slug"], a["name"]) for a in AREAS]
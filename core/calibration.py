@@ -0,0 +1,324 @@
+# core/calibration.py
+"""
+ユーザー別の予測補正（共有の予測にユーザーごとのずれを足す）。
+- 残差 = 実績の円/h − 共有予測（forecast_for）。記録を時間帯ごとに按分し、稼働時間で重み付け
+- 統計はエリア別・時間帯（HOUR_BANDS）別の Σw, Σw·r, Σw·r²。DeliveryRecord の保存・削除ごとに
+  その記録の分だけ足し引きする（O(記録の時間数)）
+- 記録ごとに足した分（エリア, 時, 按分時間, 残差）を CalibrationResidual に持ち、編集・削除ではそれを引く
+  （いまの予測で計算し直さないので、予測が変わっても統計はずれない）。残差の無い記録は引かない
+- 保存時の更新は補正に関わる列（AFFECTING_FIELDS）を含むときだけ（note だけの編集などでは何もしない）
+- 縮小推定：ユーザー全体の平均 μ を K_USER 時間ぶん 0 へ、エリア・時間帯の効果を K_AREA / K_BAND 時間ぶん μ へ寄せる。
+  データの少ないユーザーはほぼ共有予測のまま
+- 補正はエリア×24時間のグリッド（array('f')）として保存時に作っておき、リクエスト時は
+  共有予測に grid[エリア*24+時] を足すだけ（numpy 不要）
+- 各ユーザーの行は残差を計算したときの共有予測の版（model_version）を持つ。モデル差し替え後は
+  manage.py rebuild_calibration --if_model_changed（run_jobs の定期ジョブも同じ）で古い版のユーザーだけ作り直す
+"""
+import json
+import math
+import threading
+import time
+from array import array
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import singleflight
+from .areas import AREAS
+from .models import CalibrationResidual, DeliveryRecord, UserCalibration
+
+SLUGS = [a["slug"] for a in AREAS]
+SLOT = {s: i for i, s in enumerate(SLUGS)}
+HOUR_BANDS = ((0, 6), (6, 11), (11, 14), (14, 17), (17, 21), (21, 24))  # 深夜・朝・昼・午後・夕・夜
+BAND_OF_HOUR = [next(b for b, (lo, hi) in enumerate(HOUR_BANDS) if lo <= h < hi) for h in range(24)]
+FIELDS = ("w", "s", "q")  # Σw, Σw·r, Σw·r²
+
+K_USER = 5.0        # 時間（擬似観測）。大きいほど共有予測に寄る
+K_AREA = 10.0
+K_BAND = 10.0
+MAX_ADJ_YEN = 1500
+MIN_HOURS = 1.0     # これ未満のユーザーには補正を出さない
+CACHE_TTL_SEC = 3600
+GRID_CACHE_MAX = 50_000
+
+RECORD_FIELDS = ("id", "user_id", "date", "start_time", "end_time", "earnings", "hours_worked", "area_slug")
+AFFECTING_FIELDS = frozenset(RECORD_FIELDS[1:]) | {"user"}  # save(update_fields=...) がこれを含むときだけ更新
+
+
+def hourly_portions(r: dict):
+    """(時, 按分時間, 円/h) を返す。按分は live.LiveStats.observe_record と同じ。"""
+    if r["start_time"] is None or r["end_time"] is None or not r["earnings"] or r["area_slug"] not in SLOT:
+        return
+    sh = r["start_time"].hour + r["start_time"].minute / 60.0
+    eh = r["end_time"].hour + r["end_time"].minute / 60.0
+    if eh <= sh:
+        eh = min(24.0, sh + float(r["hours_worked"] or 0))
+    dur = eh - sh
+    if dur <= 0:
+        return
+    yen = float(r["earnings"]) / dur
+    for h in range(int(sh), min(24, math.ceil(eh))):
+        portion = min(eh, h + 1) - max(sh, h)
+        if portion > 0:
+            yield h, portion, yen
+
+
+class Calibration:
+    """1ユーザー分の残差統計と補正グリッド。"""
+
+    def __init__(self):
+        for f in FIELDS:
+            setattr(self, "area_" + f, array("d", bytes(8 * len(SLUGS))))
+            setattr(self, "band_" + f, array("d", bytes(8 * len(HOUR_BANDS))))
+        self.grid = array("f", bytes(4 * len(SLUGS) * 24))
+
+    @property
+    def hours(self) -> float:
+        return sum(self.area_w)
+
+    # ---------- 更新 ----------
+    def add(self, slug: str, hour: int, weight: float, residual: float, sign: int = 1):
+        a, b = SLOT[slug], BAND_OF_HOUR[hour]
+        w = sign * weight
+        for stats, i in ((("area_w", "area_s", "area_q"), a), (("band_w", "band_s", "band_q"), b)):
+            ws, ss, qs = (getattr(self, n) for n in stats)
+            ws[i] += w
+            ss[i] += w * residual
+            qs[i] += w * residual * residual
+            if ws[i] <= 1e-9:  # 引き算で負・ゼロになったら空に戻す
+                ws[i] = ss[i] = qs[i] = 0.0
+
+    def apply(self, contrib, sign: int = 1):
+        """contributions() の並びを足す（sign=-1 で引く）。"""
+        for i in range(0, len(contrib), 4):
+            self.add(SLUGS[int(contrib[i])], int(contrib[i + 1]), contrib[i + 2], contrib[i + 3], sign)
+
+    def rebuild_grid(self):
+        """縮小推定した μ + エリア効果 + 時間帯効果をグリッドへ。"""
+        tot_w = sum(self.area_w)
+        mu = sum(self.area_s) / (tot_w + K_USER)
+        area = [(s - w * mu) / (w + K_AREA) for w, s in zip(self.area_w, self.area_s)]
+        band = [(s - w * mu) / (w + K_BAND) for w, s in zip(self.band_w, self.band_s)]
+        for a in range(len(SLUGS)):
+            for h in range(24):
+                v = mu + area[a] + band[BAND_OF_HOUR[h]]
+                self.grid[a * 24 + h] = max(-MAX_ADJ_YEN, min(MAX_ADJ_YEN, v))
+
+    # ---------- 参照 ----------
+    def area_std(self, slug: str):
+        i = SLOT[slug]
+        w = self.area_w[i]
+        if w <= 0:
+            return None
+        m = self.area_s[i] / w
+        return math.sqrt(max(0.0, self.area_q[i] / w - m * m))
+
+    # ---------- 保存 ----------
+    def to_bytes(self) -> bytes:
+        header = json.dumps({"slugs": SLUGS, "bands": HOUR_BANDS, "fields": FIELDS}).encode()
+        body = b"".join(getattr(self, p + f).tobytes() for p in ("area_", "band_") for f in FIELDS)
+        return header + b"\n" + body + self.grid.tobytes()
+
+    @classmethod
+    def from_bytes(cls, payload: bytes):
+        header, _, body = bytes(payload).partition(b"\n")
+        meta = json.loads(header)
+        cal = cls()
+        if meta["slugs"] != SLUGS or [tuple(b) for b in meta["bands"]] != list(HOUR_BANDS):
+            return cal  # エリア・時間帯の定義が変わった → 空から（rebuild_calibration で作り直す）
+        off = 0
+        for p, n in (("area_", len(SLUGS)), ("band_", len(HOUR_BANDS))):
+            for f in FIELDS:
+                getattr(cal, p + f)[:] = array("d", body[off:off + 8 * n])
+                off += 8 * n
+        cal.grid[:] = array("f", body[off:])
+        return cal
+
+
+# ---------- DeliveryRecord の保存・削除から ----------
+def forecasts_for(records) -> dict:
+    """{(date, 時): {slug: 円/h}}。共有予測は core.singleflight でキャッシュ済み。"""
+    from .page_data import forecast_for
+    out = {}
+    for r in records:
+        for h, _p, _y in hourly_portions(r):
+            key = (r["date"], h)
+            if key not in out:
+                out[key] = forecast_for(r["date"], h)
+    return out
+
+
+def contributions(r: dict, forecasts: dict) -> array:
+    """記録1件が足す分。(エリア番号, 時, 按分時間, 残差) の並び。forecasts は forecasts_for の形。"""
+    out = array("d")
+    for h, portion, yen in hourly_portions(r):
+        fc = forecasts.get((r["date"], h), {}).get(r["area_slug"])
+        if fc:
+            out.extend((SLOT[r["area_slug"]], h, portion, yen - fc))
+    return out
+
+
+def model_version() -> str:
+    """共有予測の版。ONNX モデルがあれば meta の trained_at、無ければ 'history'（過去平均）。"""
+    from .ml.predictor import MODEL_META, LgbmPredictor
+    if not LgbmPredictor.available():
+        return "history"
+    try:
+        with open(MODEL_META, encoding="utf-8") as f:
+            return str(json.load(f).get("trained_at", ""))[:64]
+    except (OSError, ValueError):
+        return ""
+
+
+def _cache_key(user_id) -> str:
+    return f"dn:calib:{user_id}"
+
+
+def _update(user_id, minus, plus, create: bool) -> bool:
+    """行をロックして minus を引き plus を足す。行が無く create=False なら何もせず False。"""
+    payload = (UserCalibration.objects.select_for_update().filter(user_id=user_id)
+               .values_list("payload", flat=True).first())
+    if payload is None and not create:
+        return False
+    cal = Calibration.from_bytes(payload) if payload is not None else Calibration()
+    for c in minus:
+        cal.apply(c, -1)
+    for c in plus:
+        cal.apply(c)
+    cal.rebuild_grid()
+    if payload is None:
+        UserCalibration.objects.create(user_id=user_id, payload=cal.to_bytes(), hours=cal.hours,
+                                       model_version=model_version())
+    else:  # ロック済みの行なので SELECT し直さない
+        UserCalibration.objects.filter(user_id=user_id).update(payload=cal.to_bytes(), hours=cal.hours,
+                                                               updated_at=timezone.now())
+    return True
+
+
+def apply_changes(user_id, added=(), removed=(), create: bool = True):
+    """
+    removed（記録 id）の保存済みの残差を引き、added（RECORD_FIELDS の dict）の残差を足して補正グリッドを作り直す。
+    編集は同じ id を removed と added の両方に入れる。残差は前の持ち主（所有者の付け替え）からも引く。
+    create=False のときは行が無ければ残差だけ消す（ユーザー削除の CASCADE 中に作り直さないため）。
+    """
+    added, removed = [r for r in added if r], list(removed)
+    if not added and not removed:
+        return
+    forecasts = forecasts_for(added)  # 予測の計算はトランザクションの外で
+    new = {r["id"]: contributions(r, forecasts) for r in added}
+    touched = {user_id}
+    with transaction.atomic():
+        minus = {}
+        if removed:
+            for uid, payload in CalibrationResidual.objects.filter(record_id__in=removed).values_list("user_id", "payload"):
+                minus.setdefault(uid, []).append(array("d", bytes(payload)))
+        for uid in minus.keys() - {user_id}:
+            _update(uid, minus[uid], [], create=False)
+            touched.add(uid)
+        plus = [c for c in new.values() if c]
+        if minus.get(user_id) or plus:
+            _update(user_id, minus.get(user_id, []), plus, create)
+        gone = set(removed) - {i for i, c in new.items() if c}
+        if gone:
+            CalibrationResidual.objects.filter(record_id__in=gone).delete()
+        if plus:
+            CalibrationResidual.objects.bulk_create(
+                [CalibrationResidual(record_id=i, user_id=user_id, payload=c.tobytes()) for i, c in new.items() if c],
+                update_conflicts=True, unique_fields=["record_id"], update_fields=["user_id", "payload"])
+    for uid in touched:
+        singleflight.invalidate(_cache_key(uid))
+        _forget_grid(uid)
+
+
+def record_fields(instance) -> dict:
+    return {f: getattr(instance, f) for f in RECORD_FIELDS}
+
+
+def rebuild(user_ids=None, since=None, log=None, stale_only: bool = False) -> int:
+    """
+    保存済みの記録から作り直す（モデル差し替え後など）。作り直したユーザー数。
+    stale_only=True なら model_version がいまの版と違う（または行の無い）ユーザーだけ。
+    予測はキャッシュを通さずに計算する（差し替え直後は古いモデルの予測がキャッシュに残っている）。
+    """
+    from .page_data import _compute_forecast
+    version = model_version()
+    qs = DeliveryRecord.objects.filter(area_slug__in=SLUGS)
+    if since is not None:
+        qs = qs.filter(date__gte=since)
+    if user_ids is not None:
+        qs = qs.filter(user_id__in=user_ids)
+    users = qs.order_by().values_list("user_id", flat=True).distinct()
+    if stale_only:
+        users = users.exclude(user__calibration__model_version=version)
+    forecasts, n = {}, 0  # (date, 時) → 予測。ユーザー間で使い回す
+    for uid in list(users):
+        with transaction.atomic():
+            UserCalibration.objects.select_for_update().filter(user_id=uid).first()  # 同時の保存を待たせる
+            rows = list(qs.filter(user_id=uid).values(*RECORD_FIELDS))
+            cal, residuals = Calibration(), []
+            for r in rows:
+                for h, _p, _y in hourly_portions(r):
+                    if (r["date"], h) not in forecasts:
+                        forecasts[(r["date"], h)] = _compute_forecast(r["date"], h)
+                c = contributions(r, forecasts)
+                if c:
+                    cal.apply(c)
+                    residuals.append(CalibrationResidual(record_id=r["id"], user_id=uid, payload=c.tobytes()))
+            cal.rebuild_grid()
+            CalibrationResidual.objects.filter(user_id=uid).delete()
+            CalibrationResidual.objects.bulk_create(residuals, batch_size=1000)
+            UserCalibration.objects.update_or_create(user_id=uid, defaults={
+                "payload": cal.to_bytes(), "hours": cal.hours, "model_version": version})
+        singleflight.invalidate(_cache_key(uid))
+        _forget_grid(uid)
+        n += 1
+        if log and n % 500 == 0:
+            log(f"  {n:,} users")
+    return n
+
+
+# ---------- リクエスト時 ----------
+# singleflight の locmem 層は値を pickle するので、その手前に配列そのものを置く
+# （寿命は singleflight.LOCAL_MAX_SEC と同じ。他ワーカーでの更新もその秒数で見える）
+_grids = {}  # user_id -> (grid or None, expires_at)
+_grids_lock = threading.Lock()
+
+
+def _forget_grid(user_id):
+    with _grids_lock:
+        _grids.pop(user_id, None)
+
+
+def _load_grid(user_id):
+    row = UserCalibration.objects.filter(user_id=user_id).values_list("payload", "hours").first()
+    if row is None or row[1] < MIN_HOURS:
+        return None
+    return Calibration.from_bytes(row[0]).grid
+
+
+def adjustment(user_id):
+    """補正グリッド（array('f')、エリア*24+時）。データの無いユーザーは None。"""
+    if not user_id:
+        return None
+    now = time.monotonic()
+    hit = _grids.get(user_id)
+    if hit is not None and hit[1] > now:
+        return hit[0]
+    grid = singleflight.get_or_compute(_cache_key(user_id), lambda: _load_grid(user_id), CACHE_TTL_SEC, stale_ttl=0)
+    with _grids_lock:
+        if len(_grids) >= GRID_CACHE_MAX:
+            _grids.clear()
+        _grids[user_id] = (grid, now + singleflight.LOCAL_MAX_SEC)
+    return grid
+
+
+def personalize(rates: dict, grid, hour: int) -> dict:
+    """共有予測 {slug: 円/h} に補正を足す。grid が None ならそのまま。"""
+    if grid is None:
+        return rates
+    return {slug: v + grid[SLOT[slug] * 24 + hour] if slug in SLOT else v for slug, v in rates.items()}
+
+
+def personal_forecast(user_id, day, hour: int) -> dict:
+    from .page_data import forecast_for
+    return personalize(forecast_for(day, hour), adjustment(user_id), hour)
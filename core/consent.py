@@ -0,0 +1,54 @@
+# core/consent.py
+"""
+AI学習への同意状態の参照。
+- has_ai_consent(user_id): リクエスト時チェック用。プロセス内キャッシュ（signals で無効化）
+- with_ai_consent(qs): 学習用クエリを DB 側の EXISTS サブクエリで絞り込む
+  （同意ユーザーIDを Python 側の set に展開して IN (...) に渡さない）
+"""
+import threading
+import time
+
+from django.db.models import Exists, OuterRef
+
+from .models import UserAiConsent
+
+# 他プロセスでの更新はシグナルが届かないので TTL で鮮度を担保
+CACHE_TTL_SEC = 60
+CACHE_MAX_ENTRIES = 50_000
+
+_cache = {}  # user_id -> (share: bool, expires_at: float)
+_lock = threading.Lock()
+
+
+def has_ai_consent(user_id) -> bool:
+    if user_id is None:
+        return False
+    now = time.monotonic()
+    hit = _cache.get(user_id)
+    if hit is not None and hit[1] > now:
+        return hit[0]
+
+    share = UserAiConsent.objects.filter(user_id=user_id, share_aggregated=True).exists()
+    with _lock:
+        if len(_cache) >= CACHE_MAX_ENTRIES:
+            _cache.clear()
+        _cache[user_id] = (share, now + CACHE_TTL_SEC)
+    return share
+
+
+def invalidate(user_id=None):
+    """user_id 指定でその1件、None で全件を破棄。"""
+    with _lock:
+        if user_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(user_id, None)
+
+
+def consent_exists(user_ref: str = "user_id"):
+    """OuterRef(user_ref) のユーザーが同意ONかどうかの EXISTS 式。"""
+    return Exists(UserAiConsent.objects.filter(user_id=OuterRef(user_ref), share_aggregated=True))
+
+
+def with_ai_consent(qs, user_ref: str = "user_id"):
+    return qs.filter(consent_exists(user_ref))
@@ -0,0 +1,14 @@
+# core/context_processors.py
+from django.utils.functional import SimpleLazyObject
+from django.utils.safestring import mark_safe
+
+from .page_data import dn_data_json
+
+
+def dn_data(request):
+    """
+    base.html の DN_DATA 用。テンプレートが実際に参照したときだけ組み立てる
+    （admin など DN_DATA を使わない画面ではコストゼロ）。
+    """
+    user = getattr(request, "user", None)
+    return {"dn_data_json": SimpleLazyObject(lambda: mark_safe(dn_data_json(user)))}
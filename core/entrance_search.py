@@ -0,0 +1,284 @@
+# core/entrance_search.py
+"""
+EntranceInfo の住所・メモ検索。
+- 保存時に正規化した address_key / search_text を持たせる（全角半角・丁目/番地/号・漢数字の揺れを吸収）
+- 索引は DB ごと：
+    SQLite   … FTS5（tokenize='trigram'）の外部コンテンツ表＋トリガー
+    Postgres … pg_trgm の GIN 索引（拡張が使えない環境では作らない）
+  どちらも無ければ search_text の LIKE 走査
+- 候補は「部分一致」→ 1件も無ければ「あいまい（トライグラム一致）」の順に DB から最大 CANDIDATES 件取り、
+  順位付けは Python 側の共通スコアで行う（DB によって順位が変わらないように）。
+  モデルにするのは返す limit 件だけ
+- SQLite でテーブルを作り直すマイグレーション（AddField・AlterField 等）はトリガーを消すので、
+  migrate の後（post_migrate → ensure_index）に表とトリガーが揃っているかを確かめ、欠けていれば作り直す。
+  揃っていない間は backend() が 'scan' を返す（古い索引から引かない）
+"""
+import math
+import re
+import unicodedata
+
+from django.db import DatabaseError, connection, transaction
+
+from .models import EntranceInfo
+
+CANDIDATES = 200
+FUZZY_MIN = 0.4        # あいまい一致：クエリのトライグラムのうち含むべき割合
+FUZZY_SCAN = 2000      # あいまい一致で索引から読む最大行数
+FTS_TABLE = "core_entranceinfo_fts"
+FTS_VOCAB = "core_entranceinfo_fts_vocab"
+TRGM_INDEX = "entranceinfo_search_trgm"
+
+# ---------- 正規化 ----------
+_KANJI_DIGITS = {"〇": 0, "一": 1, "二": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+_KANJI_NUM_RE = re.compile(r"[〇一二三四五六七八九十百]+(?=丁目|番地|番|号|の|-)")
+_DASH_RE = re.compile(r"(?<=\d)[‐‑‒–—―−－ｰー~〜の](?=\d)")
+_CHOME_RE = re.compile(r"(\d+)(?:丁目|番地|番)")
+_GO_RE = re.compile(r"(\d+)号(?!室)")
+_SPACE_RE = re.compile(r"[\s　]+")
+_MULTI_DASH_RE = re.compile(r"-{2,}")
+_LOOSE_DASH_RE = re.compile(r"-(?!\d)")   # 「2丁目 サン…」「3番地」末尾などの余ったハイフン
+
+
+def _kanji_to_int(s: str) -> int:
+    total, cur = 0, 0
+    for ch in s:
+        if ch == "百":
+            total += (cur or 1) * 100
+            cur = 0
+        elif ch == "十":
+            total += (cur or 1) * 10
+            cur = 0
+        else:
+            cur = cur * 10 + _KANJI_DIGITS[ch]
+    return total + cur
+
+
+def normalize_text(s: str) -> str:
+    """NFKC（全角英数→半角、半角カナ→全角）＋小文字化＋空白除去。"""
+    s = unicodedata.normalize("NFKC", s or "").lower()
+    return _SPACE_RE.sub("", s)
+
+
+def normalize_address(s: str) -> str:
+    """
+    住所の表記揺れを1つのキーへ。
+    例）「東京都渋谷区道玄坂二丁目３番１号 サン桜ハイツ502号室」→「東京都渋谷区道玄坂2-3-1サン桜ハイツ502号室」
+    """
+    s = normalize_text(s)
+    s = _KANJI_NUM_RE.sub(lambda m: str(_kanji_to_int(m.group(0))), s)
+    s = _DASH_RE.sub("-", s)
+    s = _CHOME_RE.sub(r"\1-", s)
+    s = _GO_RE.sub(r"\1", s)
+    s = _MULTI_DASH_RE.sub("-", s)
+    return _LOOSE_DASH_RE.sub("", s)
+
+
+def search_keys(address: str, note: str) -> tuple:
+    """(address_key, search_text)。search_text は住所キー＋区切り＋メモ。"""
+    key = normalize_address(address)
+    return key, key + "\n" + normalize_text(note)
+
+
+# ---------- 索引 ----------
+_backend_cache = {}
+
+
+def _pg_trgm_available(cur) -> bool:
+    cur.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+    return cur.fetchone() is not None
+
+
+def install_index(conn=None):
+    """DB ごとの索引を（冪等に）作る。マイグレーションと rebuild_entrance_index から呼ぶ。"""
+    conn = conn or connection
+    _backend_cache.clear()
+    with conn.cursor() as cur:
+        if conn.vendor == "sqlite":
+            for sql in (
+                f"DROP TABLE IF EXISTS {FTS_VOCAB}",
+                f"DROP TABLE IF EXISTS {FTS_TABLE}",
+                f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+                f"search_text, content='core_entranceinfo', content_rowid='id', tokenize='trigram')",
+                f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+                f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+                f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+                f"CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON core_entranceinfo BEGIN "
+                f"INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.id, new.search_text); END",
+                f"CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON core_entranceinfo BEGIN "
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text) VALUES ('delete', old.id, old.search_text); END",
+                f"CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF search_text ON core_entranceinfo BEGIN "
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text) VALUES ('delete', old.id, old.search_text); "
+                f"INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.id, new.search_text); END",
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+                f"DROP TABLE IF EXISTS {FTS_VOCAB}",
+                f"CREATE VIRTUAL TABLE {FTS_VOCAB} USING fts5vocab({FTS_TABLE}, 'row')",
+            ):
+                cur.execute(sql)
+        elif conn.vendor == "postgresql":
+            # マネージド DB で拡張を作れない場合はあきらめて LIKE 走査にする
+            try:
+                with transaction.atomic(using=conn.alias), conn.cursor() as c2:
+                    c2.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            except DatabaseError:
+                return
+            cur.execute(f"CREATE INDEX IF NOT EXISTS {TRGM_INDEX} ON core_entranceinfo "
+                        f"USING gin (search_text gin_trgm_ops)")
+
+
+def index_ok(conn=None) -> bool:
+    """索引が揃っているか。SQLite は FTS 表とトリガー3つ、Postgres は pg_trgm と GIN 索引。"""
+    conn = conn or connection
+    with conn.cursor() as cur:
+        if conn.vendor == "sqlite":
+            names = [FTS_TABLE, FTS_VOCAB] + [f"{FTS_TABLE}_{t}" for t in ("ai", "ad", "au")]
+            cur.execute(f"SELECT COUNT(*) FROM sqlite_master WHERE name IN ({', '.join(['%s'] * len(names))})", names)
+            return cur.fetchone()[0] == len(names)
+        if conn.vendor == "postgresql":
+            if not _pg_trgm_available(cur):
+                return False
+            cur.execute("SELECT 1 FROM pg_indexes WHERE indexname = %s", [TRGM_INDEX])
+            return cur.fetchone() is not None
+    return True
+
+
+def ensure_index(conn=None) -> bool:
+    """欠けていれば install_index。作り直したら True。"""
+    conn = conn or connection
+    if EntranceInfo._meta.db_table not in conn.introspection.table_names() or index_ok(conn):
+        return False
+    install_index(conn)
+    return True
+
+
+def uninstall_index(conn=None):
+    conn = conn or connection
+    _backend_cache.clear()
+    with conn.cursor() as cur:
+        if conn.vendor == "sqlite":
+            for t in ("ai", "ad", "au"):
+                cur.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{t}")
+            cur.execute(f"DROP TABLE IF EXISTS {FTS_VOCAB}")
+            cur.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+        elif conn.vendor == "postgresql":
+            cur.execute(f"DROP INDEX IF EXISTS {TRGM_INDEX}")
+
+
+def backend() -> str:
+    """'fts5' / 'trgm' / 'scan'（接続ごとに1回だけ判定）"""
+    key = connection.alias + ":" + connection.vendor
+    if key not in _backend_cache:
+        name = "scan"
+        with connection.cursor() as cur:
+            if connection.vendor == "sqlite":
+                # 表だけ残ってトリガーが消えていると新しい行が索引に載らないので走査にする
+                name = "fts5" if index_ok(connection) else "scan"
+            elif connection.vendor == "postgresql":
+                name = "trgm" if _pg_trgm_available(cur) else "scan"
+        _backend_cache[key] = name
+    return _backend_cache[key]
+
+
+# ---------- 候補取得 ----------
+# どれも (id, address_key, search_text) を新しい順に返す
+_COLS = "e.id, e.address_key, e.search_text"
+
+
+def _like_escape(s: str) -> str:
+    return s.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _fts_quote(s: str) -> str:
+    return '"' + s.replace('"', '""') + '"'
+
+
+def _grams(s: str, n: int = 3) -> list:
+    if len(s) < n:
+        return [s] if s else []
+    return list(dict.fromkeys(s[i:i + n] for i in range(len(s) - n + 1)))
+
+
+def _candidates_substring(key: str, limit: int) -> list:
+    with connection.cursor() as cur:
+        if backend() == "fts5" and len(key) >= 3:
+            cur.execute(f"SELECT {_COLS} FROM {FTS_TABLE} f JOIN core_entranceinfo e ON e.id = f.rowid "
+                        f"WHERE {FTS_TABLE} MATCH %s ORDER BY f.rowid DESC LIMIT %s", [_fts_quote(key), limit])
+        else:
+            # pg_trgm の GIN は LIKE '%...%' にも効く。3文字未満はどの DB でも走査
+            cur.execute(f"SELECT {_COLS} FROM core_entranceinfo e WHERE e.search_text LIKE %s ESCAPE '\\' "
+                        f"ORDER BY e.id DESC LIMIT %s", ["%" + _like_escape(key) + "%", limit])
+        return cur.fetchall()
+
+
+def _rarest_grams(cur, grams: list, k: int) -> list:
+    """fts5vocab の文書頻度で少ない順に k 個。"""
+    marks = ", ".join(["%s"] * len(grams))
+    cur.execute(f"SELECT term, doc FROM {FTS_VOCAB} WHERE term IN ({marks})", grams)
+    df = dict(cur.fetchall())
+    return sorted(grams, key=lambda g: df.get(g, 0))[:k]
+
+
+def _candidates_fuzzy(key: str, limit: int) -> list:
+    """
+    クエリのトライグラムの FUZZY_MIN 以上を含む行の候補。
+    m 個以上を含む行は「文書頻度の少ない n-m+1 個」のどれかを必ず含む（鳩の巣）ので、
+    その OR だけを索引で引いて Python 側で数える。
+    """
+    grams = _grams(key)
+    if len(key) < 3:
+        return []
+    with connection.cursor() as cur:
+        if backend() == "fts5":
+            need = math.ceil(FUZZY_MIN * len(grams))
+            probe = _rarest_grams(cur, grams, len(grams) - need + 1)
+            cur.execute(f"SELECT {_COLS} FROM {FTS_TABLE} f JOIN core_entranceinfo e ON e.id = f.rowid "
+                        f"WHERE {FTS_TABLE} MATCH %s ORDER BY f.rowid DESC LIMIT %s",
+                        [" OR ".join(_fts_quote(g) for g in probe), FUZZY_SCAN])
+            rows = cur.fetchall()
+            return [r for r in rows if sum(g in r[2] for g in grams) >= need][:limit]
+        if backend() == "trgm":
+            cur.execute(f"SELECT {_COLS} FROM core_entranceinfo e WHERE %s <%% e.search_text "
+                        f"ORDER BY word_similarity(%s, e.search_text) DESC, e.id DESC LIMIT %s", [key, key, limit])
+            return cur.fetchall()
+        return []
+
+
+# ---------- 順位付け ----------
+def _containment(grams: list, text: str) -> float:
+    return sum(g in text for g in grams) / len(grams) if grams else 0.0
+
+
+def score(key: str, address_key: str, search_text: str) -> float:
+    """
+    部分一致（住所 > メモ、前方一致を優遇）＋クエリの n-gram が含まれる割合。
+    割合はトライグラムとバイグラムの平均（短い住所の1文字違いでトライグラムだけだと同点になりやすい）。
+    """
+    note = search_text.partition("\n")[2]
+    s = 0.0
+    if key in address_key:
+        s += 2.0 + (0.5 if address_key.startswith(key) else 0.0)
+    elif key in note:
+        s += 1.0
+    tri, bi = _grams(key), _grams(key, 2)
+    s += max((_containment(tri, address_key) + _containment(bi, address_key)) / 2,
+             0.8 * (_containment(tri, note) + _containment(bi, note)) / 2)
+    return s
+
+
+def search(q: str, limit: int = 20, min_score: float = FUZZY_MIN) -> list:
+    """正規化したクエリで検索し、スコア順の EntranceInfo リストを返す（obj.score 付き）。"""
+    key = normalize_address(q)
+    if not key:
+        return []
+    rows = _candidates_substring(key, CANDIDATES)
+    if not rows:
+        rows = _candidates_fuzzy(key, CANDIDATES)  # 誤字・表記違いのときだけ
+    scored = sorted(((score(key, ak, st), i) for i, ak, st in rows), key=lambda t: (-t[0], -t[1]))
+    scored = [t for t in scored if t[0] >= min_score][:limit]
+    # モデルにするのは返す分だけ
+    objs = EntranceInfo.objects.select_related("user").defer("search_text").in_bulk([i for _, i in scored])
+    out = []
+    for sc, i in scored:
+        if i in objs:
+            objs[i].score = sc
+            out.append(objs[i])
+    return out
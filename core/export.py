@@ -0,0 +1,189 @@
+# core/export.py
+"""
+DeliveryRecord の逐次エクスポート（CSV / NDJSON / Parquet、任意で gzip）。
+行はサーバーサイドカーソル（.iterator()）から読み、エンコードしながら yield するので
+履歴の長さに関わらずメモリは一定・最初のバイトまでの時間も短い。
+アーカイブ済みの古い行（core.archive）も含める。アーカイブとホットはどちらも (user_id, date) 昇順なので
+heapq.merge で1本にし、複数ユーザーの出力でもユーザーごとの履歴が連続する。
+"""
+import csv
+import datetime
+import heapq
+import importlib.util
+import json
+import zlib
+
+from .archive import iter_archived_deliveries
+from .models import DeliveryRecord
+
+COLUMNS = (
+    "user_id", "date", "start_time", "end_time", "area_slug",
+    "orders_completed", "earnings", "hours_worked", "note", "created_at",
+)
+FORMATS = {
+    # format: (content_type, 拡張子)
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+ITER_CHUNK = 2000          # サーバーサイドカーソルの fetch 件数
+PARQUET_ROW_GROUP = 20_000  # Parquet の row group（= メモリに溜める最大行数）
+
+
+def parquet_available() -> bool:
+    # pyarrow は import だけで ~100ms（numpy 込み）かかるので、実際に使うまで読み込まない
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def _pyarrow():
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    return pa, pq
+
+
+def _row_key(r):
+    return r["user_id"], r["date"]
+
+
+def iter_rows(user_ids=None, since=None, until=None, area_slug=None):
+    """アーカイブとホットを (user_id, date) 順に合わせて dict を返す。user_ids=None で全ユーザー（staff 用）。"""
+    archived = iter_archived_deliveries(user_ids, since, until)
+    if area_slug is not None:
+        archived = (r for r in archived if r.get("area_slug") == area_slug)
+
+    qs = DeliveryRecord.objects.all()
+    if user_ids is not None:
+        qs = qs.filter(user_id__in=user_ids)
+    if since:
+        qs = qs.filter(date__gte=since)
+    if until:
+        qs = qs.filter(date__lte=until)
+    if area_slug:
+        qs = qs.filter(area_slug=area_slug)
+    hot = qs.order_by("user_id", "date").values(*COLUMNS).iterator(chunk_size=ITER_CHUNK)
+    yield from heapq.merge(archived, hot, key=_row_key)
+
+
+# ---------- エンコーダ（bytes のジェネレータ） ----------
+class _Echo:
+    """csv.writer の書き込み先。書いた文字列をそのまま返す。"""
+    def write(self, value):
+        return value
+
+
+def _cell(v):
+    if v is None:
+        return ""
+    if isinstance(v, (datetime.date, datetime.time)):
+        return v.isoformat()
+    return v
+
+
+def encode_csv(rows):
+    writer = csv.writer(_Echo())
+    yield "\ufeff".encode("utf-8")  # Excel で文字化けしないよう BOM
+    yield writer.writerow(COLUMNS).encode("utf-8")
+    buf = []
+    for r in rows:
+        buf.append(writer.writerow([_cell(r.get(c)) for c in COLUMNS]))
+        if len(buf) >= 500:
+            yield "".join(buf).encode("utf-8")
+            buf = []
+    if buf:
+        yield "".join(buf).encode("utf-8")
+
+
+def _json_default(v):
+    if isinstance(v, (datetime.date, datetime.time)):
+        return v.isoformat()
+    return str(v)  # Decimal
+
+
+def encode_ndjson(rows):
+    buf = []
+    for r in rows:
+        buf.append(json.dumps({c: r.get(c) for c in COLUMNS}, ensure_ascii=False,
+                              separators=(",", ":"), default=_json_default))
+        if len(buf) >= 500:
+            yield ("\n".join(buf) + "\n").encode("utf-8")
+            buf = []
+    if buf:
+        yield ("\n".join(buf) + "\n").encode("utf-8")
+
+
+class _DrainSink:
+    """ParquetWriter の出力先。書かれたバイト列を溜め、drain() で取り出す。"""
+    def __init__(self):
+        self.parts = []
+        self.closed = False
+        self.pos = 0
+
+    def write(self, b):
+        self.parts.append(bytes(b))
+        self.pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self.pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        out = b"".join(self.parts)
+        self.parts = []
+        return out
+
+
+def _parquet_schema(pa):
+    return pa.schema([
+        ("user_id", pa.int64()), ("date", pa.date32()),
+        ("start_time", pa.time64("us")), ("end_time", pa.time64("us")),
+        ("area_slug", pa.string()), ("orders_completed", pa.int32()),
+        ("earnings", pa.decimal128(10, 2)), ("hours_worked", pa.decimal128(5, 2)),
+        ("note", pa.string()), ("created_at", pa.timestamp("us", tz="UTC")),
+    ])
+
+
+def encode_parquet(rows, row_group: int = PARQUET_ROW_GROUP):
+    if not parquet_available():
+        raise RuntimeError("Parquet export requires pyarrow")
+    pa, pq = _pyarrow()
+    schema = _parquet_schema(pa)
+    sink = _DrainSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    cols = {c: [] for c in COLUMNS}
+    n = 0
+
+    def flush():
+        writer.write_table(pa.table(cols, schema=schema), row_group_size=row_group)
+        for v in cols.values():
+            v.clear()
+
+    for r in rows:
+        for c in COLUMNS:
+            cols[c].append(r.get(c))
+        n += 1
+        if n % row_group == 0:
+            flush()
+            yield sink.drain()
+    if n % row_group:
+        flush()
+    writer.close()
+    yield sink.drain()
+
+
+ENCODERS = {"csv": encode_csv, "ndjson": encode_ndjson, "parquet": encode_parquet}
+
+
+def gzip_stream(chunks, level: int = 6):
+    """bytes のジェネレータを gzip 形式で逐次圧縮する。"""
+    z = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        out = z.compress(chunk)
+        if out:
+            yield out
+    yield z.flush()
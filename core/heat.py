@@ -0,0 +1,279 @@
+# core/heat.py
+"""
+地図のヒートマップ用グリッドタイル（/api/heat/{z}/{x}/{y}）。
+- Web メルカトルのタイル（256px）を GRID×GRID のセルに分け、セルごとに
+  実績件数・稼働時間・売上・入口情報の件数を HeatCell に持つ
+- 最大ズーム Z_MAX で集計し、親セル (cx >> 1, cy >> 1) へ足し上げて Z_MIN まで全ズームを持つ（ピラミッド）。
+  1タイルの取得は (z, cy, cx) の範囲走査1回
+- 増分集計：records / entrances を id 昇順のテール（core.tail。遅れてコミットされた行も欠番として拾い直す）で読み、
+  INSERT ... ON CONFLICT DO UPDATE で加算する。世代番号の条件付き UPDATE を最初の書き込みにして、
+  複数ワーカーが同時に走っても二重加算しない（同意の切り替えも世代を進めるので同じ順序づけに乗る）
+- DeliveryRecord には座標が無いのでエリア中心に置く。同意ユーザーの記録のみ。同意は読んだ時点で Python 側で見て、
+  不同意の行もカーソルは進める。後から同意を切り替えたら、集計済みの範囲のその人の記録を足す / 引く（consent_changed）
+- 編集・削除は反映しない（manage.py build_heat_pyramid --rebuild で作り直す）
+- 集計は build()（manage.py build_heat_pyramid、run_jobs の定期ジョブ）だけが行い、タイルの GET は読むだけ
+- タイルはバイナリ（既定）か差分符号化 JSON。世代番号ごとにキャッシュし、内容のハッシュを ETag にする
+"""
+import hashlib
+import json
+import math
+import struct
+import time
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F
+
+from .areas import AREA_INDEX
+from .models import DeliveryRecord, EntranceInfo, HeatCell, HeatCursor, UserAiConsent
+from .tail import IdTail
+
+GRID = 32               # 1タイルのセル数（一辺）。256px タイルで 8px/セル
+Z_MIN, Z_MAX = 10, 16   # これ以外のズームは Leaflet 側で拡大縮小（min/maxNativeZoom）
+BATCH = 5000
+MIN_RECORDS = 3         # これ未満のセルは時給を出さない（個人の売上が読めないように）
+MAX_AGE_SEC = 60        # タイルの Cache-Control（build_heat_pyramid の間隔に合わせる）
+GENERATION_TTL_SEC = 5
+TILE_TTL_SEC = 3600
+
+MAGIC = b"DNHT"
+VERSION = 1
+_HEADER = struct.Struct("<4sBBBxI")   # magic, version, grid, z, pad, セル数
+# 続いてセルごとに varint（LEB128）×4：Δセル番号(row*GRID+col、直前との差), 円/h, 件数, 入口数
+
+CURSOR_RECORDS, CURSOR_ENTRANCES, CURSOR_GENERATION = "records", "entrances", "generation"
+
+
+# ---------- 座標 ----------
+def cell_of(lat: float, lng: float, z: int = Z_MAX) -> tuple:
+    """緯度経度 → ズーム z の全体セル座標 (cx, cy)。"""
+    n = (1 << z) * GRID
+    lat = max(-85.05112878, min(85.05112878, lat))
+    s = math.sin(math.radians(lat))
+    cx = int((lng + 180.0) / 360.0 * n)
+    cy = int((0.5 - math.log((1 + s) / (1 - s)) / (4 * math.pi)) * n)
+    return min(max(cx, 0), n - 1), min(max(cy, 0), n - 1)
+
+
+def _area_cells() -> dict:
+    return {slug: cell_of(a["lat"], a["lng"]) for slug, a in AREA_INDEX.items()}
+
+
+# ---------- 増分集計 ----------
+class _Lost(Exception):
+    """他のワーカーが先に同じ範囲を集計した。"""
+
+
+def _generation() -> int:
+    return HeatCursor.objects.get_or_create(name=CURSOR_GENERATION)[0].value
+
+
+def _tail(name: str) -> IdTail:
+    row = HeatCursor.objects.get_or_create(name=name)[0]
+    return IdTail(row.value, row.gaps)
+
+
+def _save_tail(name: str, tail: IdTail):
+    HeatCursor.objects.filter(name=name).update(value=tail.high, gaps=tail.gap_list())
+
+
+def _claim(gen: int):
+    if not HeatCursor.objects.filter(name=CURSOR_GENERATION, value=gen).update(value=gen + 1):
+        raise _Lost
+
+
+def _accumulate(records, entrances) -> dict:
+    """Z_MAX のセル → [件数, 時間, 売上, 入口数]。"""
+    area_cells = _area_cells()
+    delta = {}
+    for _id, slug, hours, earnings in records:
+        acc = delta.setdefault(area_cells[slug], [0, 0.0, 0.0, 0])
+        acc[0] += 1
+        acc[1] += float(hours or 0)
+        acc[2] += float(earnings or 0)
+    for _id, lat, lng in entrances:
+        delta.setdefault(cell_of(lat, lng), [0, 0.0, 0.0, 0])[3] += 1
+    return delta
+
+
+def _pyramid_rows(delta: dict) -> list:
+    """Z_MAX の差分を全ズームへ足し上げた (z, cx, cy, records, hours, earnings, entrances) の列。"""
+    rows, level = [], delta
+    for z in range(Z_MAX, Z_MIN - 1, -1):
+        rows += [(z, cx, cy, *v) for (cx, cy), v in level.items()]
+        parent = {}
+        for (cx, cy), v in level.items():
+            acc = parent.setdefault((cx >> 1, cy >> 1), [0, 0.0, 0.0, 0])
+            for i in range(4):
+                acc[i] += v[i]
+        level = parent
+    return rows
+
+
+_UPSERT = (
+    "INSERT INTO core_heatcell (z, cx, cy, records, hours, earnings, entrances) "
+    "VALUES (%s, %s, %s, %s, %s, %s, %s) "
+    "ON CONFLICT (z, cy, cx) DO UPDATE SET "
+    "records = core_heatcell.records + excluded.records, "
+    "hours = core_heatcell.hours + excluded.hours, "
+    "earnings = core_heatcell.earnings + excluded.earnings, "
+    "entrances = core_heatcell.entrances + excluded.entrances"
+)
+# 同意の取り消し用。集計後に編集された行はぴったり引けないので 0 で止める（CHECK 制約に当てない）
+_SUBTRACT = (
+    "UPDATE core_heatcell SET "
+    "records = CASE WHEN records > %s THEN records - %s ELSE 0 END, "
+    "hours = CASE WHEN hours > %s THEN hours - %s ELSE 0 END, "
+    "earnings = CASE WHEN earnings > %s THEN earnings - %s ELSE 0 END "
+    "WHERE z = %s AND cy = %s AND cx = %s"
+)
+
+
+def step(batch: int = BATCH) -> int:
+    """
+    テールを最大 batch 件ずつ読んでピラミッドに加算。読んだ行数（他ワーカーに先を越されたら 0）。
+    世代 → カーソル → 行の順に読む（世代を読んだ後にコミットされた集計・同意の切り替えがあれば _claim で負ける）。
+    """
+    gen = _generation()
+    tail_r, tail_e = _tail(CURSOR_RECORDS), _tail(CURSOR_ENTRANCES)
+    records = list(tail_r.filter(DeliveryRecord.objects.all())
+                   .values_list("id", "user_id", "area_slug", "hours_worked", "earnings")[:batch])
+    entrances = list(tail_e.filter(EntranceInfo.objects.all()).values_list("id", "latitude", "longitude")[:batch])
+    changed_r = tail_r.advance([r[0] for r in records])
+    changed_e = tail_e.advance([e[0] for e in entrances])
+    if not (changed_r or changed_e):
+        return 0
+    consenting = set(UserAiConsent.objects.filter(user_id__in={r[1] for r in records}, share_aggregated=True)
+                     .values_list("user_id", flat=True))
+    delta = _accumulate([(i, slug, hours, earnings) for i, uid, slug, hours, earnings in records
+                         if uid in consenting and slug in AREA_INDEX],
+                        [e for e in entrances if e[1] is not None and e[2] is not None])
+    try:
+        with transaction.atomic():
+            _claim(gen)
+            _save_tail(CURSOR_RECORDS, tail_r)
+            _save_tail(CURSOR_ENTRANCES, tail_e)
+            if delta:
+                with connection.cursor() as cur:
+                    cur.executemany(_UPSERT, _pyramid_rows(delta))
+    except _Lost:
+        return 0
+    _generation_cache["checked_at"] = 0.0
+    return len(records) + len(entrances)
+
+
+def build(batch: int = BATCH, log=None) -> int:
+    total = 0
+    while True:
+        n = step(batch)
+        if not n:
+            return total
+        total += n
+        if log:
+            log(f"  {total:,} rows")
+
+
+def rebuild(batch: int = BATCH, log=None) -> int:
+    """全セルを捨ててカーソル 0 から作り直す（編集・削除を反映したいとき）。"""
+    with transaction.atomic():
+        HeatCursor.objects.get_or_create(name=CURSOR_GENERATION)
+        HeatCursor.objects.filter(name=CURSOR_GENERATION).update(value=F("value") + 1)
+        HeatCell.objects.all().delete()
+        HeatCursor.objects.filter(name__in=[CURSOR_RECORDS, CURSOR_ENTRANCES]).update(value=0, gaps=[])
+    return build(batch, log)
+
+
+def consent_changed(user_id, share: bool):
+    """
+    同意の切り替え：集計済みの範囲（カーソル以前で欠番でない id）にあるその人の記録を足す / 引く。
+    まだ読んでいない行はテールがそのときの同意で扱う。同意の保存と同じトランザクションで呼ぶこと
+    （世代の行ロックで step と順序づけ、同意だけコミットされて集計が追いつかない隙間を作らない）。
+    """
+    if not DeliveryRecord.objects.filter(user_id=user_id).exists():
+        return
+    if not HeatCursor.objects.filter(name=CURSOR_GENERATION).update(value=F("value") + 1):
+        return  # まだ一度も集計していない
+    tail = _tail(CURSOR_RECORDS)
+    rows = [r for r in (DeliveryRecord.objects.filter(user_id=user_id, id__lte=tail.high, area_slug__in=AREA_INDEX)
+                        .values_list("id", "area_slug", "hours_worked", "earnings"))
+            if not tail.pending(r[0])]
+    if rows:
+        pyramid = _pyramid_rows(_accumulate(rows, ()))
+        with connection.cursor() as cur:
+            if share:
+                cur.executemany(_UPSERT, pyramid)
+            else:
+                cur.executemany(_SUBTRACT, [(n, n, h, h, e, e, z, cy, cx) for z, cx, cy, n, h, e, _ent in pyramid])
+    transaction.on_commit(lambda: _generation_cache.update(checked_at=0.0))
+
+
+# ---------- タイル ----------
+_generation_cache = {"value": None, "checked_at": 0.0}
+
+
+def generation() -> int:
+    mono = time.monotonic()
+    if _generation_cache["value"] is None or mono - _generation_cache["checked_at"] >= GENERATION_TTL_SEC:
+        row = HeatCursor.objects.filter(name=CURSOR_GENERATION).values_list("value", flat=True).first()
+        _generation_cache.update(value=row or 0, checked_at=mono)
+    return _generation_cache["value"]
+
+
+def valid_tile(z: int, x: int, y: int) -> bool:
+    return Z_MIN <= z <= Z_MAX and 0 <= x < (1 << z) and 0 <= y < (1 << z)
+
+
+def tile_cells(z: int, x: int, y: int) -> list:
+    """[(セル番号, 円/h or 0, 件数, 入口数)]（セル番号昇順）。"""
+    x0, y0 = x * GRID, y * GRID
+    rows = (HeatCell.objects
+            .filter(z=z, cy__gte=y0, cy__lt=y0 + GRID, cx__gte=x0, cx__lt=x0 + GRID)
+            .values_list("cx", "cy", "records", "hours", "earnings", "entrances"))
+    cells = []
+    for cx, cy, records, hours, earnings, entrances in rows:
+        wage = round(earnings / hours) if records >= MIN_RECORDS and hours > 0 else 0
+        cells.append(((cy - y0) * GRID + (cx - x0), wage, records, entrances))
+    cells.sort()
+    return cells
+
+
+def _varint(out: bytearray, v: int):
+    while v >= 0x80:
+        out.append((v & 0x7F) | 0x80)
+        v >>= 7
+    out.append(v)
+
+
+def encode_binary(z: int, cells: list) -> bytes:
+    out = bytearray(_HEADER.pack(MAGIC, VERSION, GRID, z, len(cells)))
+    prev = 0
+    for idx, wage, records, entrances in cells:
+        _varint(out, idx - prev)
+        _varint(out, wage)
+        _varint(out, records)
+        _varint(out, entrances)
+        prev = idx
+    return bytes(out)
+
+
+def encode_json(z: int, cells: list) -> bytes:
+    """{"grid", "z", "cells": [Δセル番号, 円/h, 件数, 入口数, ...]}（セル番号は直前との差分）。"""
+    flat, prev = [], 0
+    for idx, wage, records, entrances in cells:
+        flat += [idx - prev, wage, records, entrances]
+        prev = idx
+    return json.dumps({"v": VERSION, "grid": GRID, "z": z, "cells": flat}, separators=(",", ":")).encode()
+
+
+ENCODERS = {"bin": ("application/octet-stream", encode_binary), "json": ("application/json", encode_json)}
+
+
+def tile(z: int, x: int, y: int, fmt: str = "bin") -> tuple:
+    """(payload, etag)。世代が変わるまでキャッシュ。"""
+    key = f"heat:{generation()}:{fmt}:{z}:{x}:{y}"
+    hit = cache.get(key)
+    if hit is None:
+        payload = ENCODERS[fmt][1](z, tile_cells(z, x, y))
+        hit = (payload, '"%s"' % hashlib.blake2b(payload, digest_size=12).hexdigest())
+        cache.set(key, hit, TILE_TTL_SEC)
+    return hit
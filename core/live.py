@@ -0,0 +1,249 @@
+# core/live.py
+"""
+当日の実績からエリア別の「いまの」時給・注文ペースを逐次推定し、予測との乖離（サージ）を出す。
+- 状態はエリア×時間帯（8×24）の固定長 array('d')。1件の反映は O(1)、numpy 不要
+- 時間減衰つき指数加重（半減期 HALF_LIFE_MIN）。減衰は基準時刻 t0 からの成長係数で表し、
+  配列全体を毎回掛け直さない（読むときに exp(-λ(now - t0)) を掛ける）
+- 入力は DeliveryRecord の id 昇順のテール（OCR 取り込みも DeliveryRecord を作るので同じ経路）。
+  遅れてコミットされた行は core.tail の欠番として拾い直す。
+  各ワーカーが同じ列を読むのでワーカー間で状態が揃う。編集された既存行は反映しない
+- 同意ユーザーの記録のみ（起動時は consent.with_ai_consent、テールは読んだ行の同意を Python 側で見る）
+- LiveCheckpoint に定期保存し（欠番も一緒に）、再起動後はそこから続きを読む
+"""
+import datetime
+import json
+import math
+import threading
+import time
+from array import array
+
+from django.utils import timezone
+
+from .areas import AREAS
+from .consent import with_ai_consent
+from .models import DeliveryRecord, LiveCheckpoint, UserAiConsent
+from .page_data import forecast_for
+from .tail import GAP_WINDOW, IdTail
+
+HALF_LIFE_MIN = 45
+LAMBDA = math.log(2) / (HALF_LIFE_MIN * 60)   # 1/秒
+REBASE_SEC = 12 * 3600                         # 成長係数が大きくなりすぎる前に t0 を進める
+TAIL_INTERVAL_SEC = 2.0                        # DB テールを読む最短間隔
+TAIL_BATCH = 5000
+CHECKPOINT_SEC = 60
+CHECKPOINT_NAME = "live"
+
+MIN_WEIGHT_H = 1.0      # 現在時間帯に最低この時間数の実績が無ければ判定しない
+MIN_N_EFF = 2.0         # 実質1件だけでは判定しない
+SURGE_Z = 2.0
+SURGE_RATIO = 0.15      # 予測比 ±15% 以上かつ |z| >= SURGE_Z で surge / slump
+
+SLUGS = [a["slug"] for a in AREAS]
+SLOT = {s: i for i, s in enumerate(SLUGS)}
+N_SLOTS = len(SLUGS) * 24
+FIELDS = ("w", "w2", "s", "s2", "so")  # Σw, Σw², Σw·円/h, Σw·(円/h)², Σw·件/h
+
+
+class LiveStats:
+    """エリア×時間帯ごとの時間減衰つき加重和。"""
+
+    def __init__(self, t0: float = None):
+        self.t0 = time.time() if t0 is None else t0
+        for f in FIELDS:
+            setattr(self, f, array("d", bytes(8 * N_SLOTS)))
+        self.n_observed = 0
+
+    # ---------- 更新 ----------
+    def observe(self, slug: str, hour: int, ts: float, yen_per_h: float, orders_per_h: float, weight: float):
+        """1観測を O(1) で反映。ts は観測時刻（epoch 秒）、weight はその時間帯での稼働時間(h)。"""
+        a = SLOT.get(slug)
+        if a is None or weight <= 0:
+            return
+        if ts - self.t0 > REBASE_SEC:
+            self.rebase(ts)
+        g = math.exp(LAMBDA * (ts - self.t0))
+        i = a * 24 + hour
+        gw = g * weight
+        self.w[i] += gw
+        self.w2[i] += g * g * weight * weight
+        self.s[i] += gw * yen_per_h
+        self.s2[i] += gw * yen_per_h * yen_per_h
+        self.so[i] += gw * orders_per_h
+        self.n_observed += 1
+
+    def observe_record(self, r: dict):
+        """DeliveryRecord.values() の1行を時間帯ごとに按分して反映（iter_hourly_samples と同じ按分）。"""
+        if r["start_time"] is None or r["end_time"] is None or not r["earnings"]:
+            return
+        sh = r["start_time"].hour + r["start_time"].minute / 60.0
+        eh = r["end_time"].hour + r["end_time"].minute / 60.0
+        if eh <= sh:
+            eh = min(24.0, sh + float(r["hours_worked"] or 0))
+        dur = eh - sh
+        if dur <= 0:
+            return
+        yen = float(r["earnings"]) / dur
+        orders = float(r["orders_completed"] or 0) / dur
+        midnight = timezone.make_aware(datetime.datetime.combine(r["date"], datetime.time()))
+        base = midnight.timestamp()
+        for h in range(int(sh), min(24, math.ceil(eh))):
+            right = min(eh, h + 1)
+            portion = right - max(sh, h)
+            if portion > 0:
+                self.observe(r["area_slug"], h, base + right * 3600, yen, orders, portion)
+
+    def rebase(self, t: float):
+        k = math.exp(-LAMBDA * (t - self.t0))
+        k2 = k * k
+        for f in FIELDS:
+            arr = getattr(self, f)
+            m = k2 if f == "w2" else k
+            for i in range(N_SLOTS):
+                arr[i] *= m
+        self.t0 = t
+
+    # ---------- 参照 ----------
+    def slot(self, slug: str, hour: int, now: float) -> dict:
+        """{weight, n_eff, mean, std, orders_per_h}（重みは now 時点に減衰済み）。"""
+        i = SLOT[slug] * 24 + hour
+        d = math.exp(-LAMBDA * (now - self.t0))
+        w = self.w[i] * d
+        if w <= 0:
+            return {"weight": 0.0, "n_eff": 0.0, "mean": None, "std": None, "orders_per_h": None}
+        mean = self.s[i] / self.w[i]
+        var = max(0.0, self.s2[i] / self.w[i] - mean * mean)
+        n_eff = self.w[i] ** 2 / self.w2[i] if self.w2[i] > 0 else 0.0
+        return {"weight": w, "n_eff": n_eff, "mean": mean, "std": math.sqrt(var),
+                "orders_per_h": self.so[i] / self.w[i]}
+
+    # ---------- 保存 ----------
+    def to_bytes(self) -> bytes:
+        header = json.dumps({"t0": self.t0, "slugs": SLUGS, "fields": FIELDS}).encode()
+        return header + b"\n" + b"".join(getattr(self, f).tobytes() for f in FIELDS)
+
+    @classmethod
+    def from_bytes(cls, payload: bytes):
+        header, _, body = bytes(payload).partition(b"\n")
+        meta = json.loads(header)
+        if meta["slugs"] != SLUGS or list(meta["fields"]) != list(FIELDS) or len(body) != 8 * N_SLOTS * len(FIELDS):
+            return None  # エリア定義が変わった → 作り直し
+        stats = cls(meta["t0"])
+        for k, f in enumerate(FIELDS):
+            getattr(stats, f)[:] = array("d", body[k * 8 * N_SLOTS:(k + 1) * 8 * N_SLOTS])
+        return stats
+
+
+# ---------- プロセス内の状態（DB テール＋チェックポイント） ----------
+_lock = threading.Lock()
+_state = {"stats": None, "tail": None, "day": None, "tailed_at": 0.0, "saved_at": 0.0, "dirty": False}
+
+RECORD_FIELDS = ("id", "user_id", "date", "start_time", "end_time", "earnings", "orders_completed", "hours_worked",
+                 "area_slug")
+
+
+def _bootstrap(today):
+    """チェックポイントがあれば復元、無ければ当日分を読み直す。"""
+    cp = LiveCheckpoint.objects.filter(name=CHECKPOINT_NAME).first()
+    stats = LiveStats.from_bytes(cp.payload) if cp else None
+    if stats is not None and cp.day == today:
+        _state.update(stats=stats, tail=IdTail(cp.last_id, cp.gaps), day=today)
+        return
+    stats = LiveStats()
+    # 直近 GAP_WINDOW 件はまだコミットされていない行があるかもしれないので、その手前までを読み、
+    # 残りはテール（_tail）に任せて欠番として追わせる
+    start = max(0, (DeliveryRecord.objects.order_by("-id").values_list("id", flat=True).first() or 0) - GAP_WINDOW)
+    for r in (with_ai_consent(DeliveryRecord.objects.filter(area_slug__in=SLUGS, date=today, id__lte=start))
+              .order_by("id").values(*RECORD_FIELDS)):
+        stats.observe_record(r)
+    _state.update(stats=stats, tail=IdTail(start), day=today, dirty=True)
+
+
+def _tail(today):
+    """テールの新着（と欠番に後から現れた行）を読んで反映（当日分・同意ユーザーのみ）。"""
+    tail = _state["tail"]
+    while True:
+        batch = list(tail.filter(DeliveryRecord.objects.all()).values(*RECORD_FIELDS)[:TAIL_BATCH])
+        if tail.advance([r["id"] for r in batch]):
+            _state["dirty"] = True
+        rows = [r for r in batch if r["date"] == today and r["area_slug"] in SLOT]
+        consenting = set(UserAiConsent.objects.filter(user_id__in={r["user_id"] for r in rows}, share_aggregated=True)
+                         .values_list("user_id", flat=True)) if rows else ()
+        for r in rows:
+            if r["user_id"] in consenting:
+                _state["stats"].observe_record(r)
+        if len(batch) < TAIL_BATCH:
+            break
+
+
+def checkpoint(force: bool = False):
+    if not (_state["dirty"] or force) or _state["stats"] is None:
+        return
+    LiveCheckpoint.objects.update_or_create(name=CHECKPOINT_NAME, defaults={
+        "day": _state["day"], "last_id": _state["tail"].high, "gaps": _state["tail"].gap_list(),
+        "payload": _state["stats"].to_bytes(),
+    })
+    _state["dirty"] = False
+    _state["saved_at"] = time.monotonic()
+
+
+def current_stats(now=None) -> LiveStats:
+    """最新まで反映済みの LiveStats。テールは TAIL_INTERVAL_SEC に1回だけ読む。"""
+    today = timezone.localdate(now)
+    mono = time.monotonic()
+    with _lock:
+        if _state["stats"] is None or _state["day"] != today:
+            _bootstrap(today)
+            _tail(today)  # チェックポイント以降の新着
+            _state["tailed_at"] = mono
+        elif mono - _state["tailed_at"] >= TAIL_INTERVAL_SEC:
+            _tail(today)
+            _state["tailed_at"] = mono
+        if mono - _state["saved_at"] >= CHECKPOINT_SEC:
+            checkpoint()
+        return _state["stats"]
+
+
+def reset():
+    """テスト・ベンチ用：プロセス内の状態を捨てる。"""
+    with _lock:
+        _state.update(stats=None, tail=None, day=None, tailed_at=0.0, saved_at=0.0, dirty=False)
+
+
+# ---------- オーバーレイ ----------
+def classify(live: dict, forecast) -> tuple:
+    """(status, z, ratio)。status は surge / slump / normal / insufficient。"""
+    if (live["mean"] is None or live["weight"] < MIN_WEIGHT_H
+            or live["n_eff"] < MIN_N_EFF or not forecast):
+        return "insufficient", None, None
+    ratio = live["mean"] / forecast - 1.0
+    se = (live["std"] or 0.0) / math.sqrt(max(live["n_eff"], 1.0))
+    z = (live["mean"] - forecast) / se if se > 0 else (math.copysign(math.inf, ratio) if ratio else 0.0)
+    if z >= SURGE_Z and ratio >= SURGE_RATIO:
+        return "surge", z, ratio
+    if z <= -SURGE_Z and ratio <= -SURGE_RATIO:
+        return "slump", z, ratio
+    return "normal", z, ratio
+
+
+def overlay(now=None) -> dict:
+    now = timezone.localtime(now)
+    stats = current_stats(now)
+    forecast = forecast_for(now.date(), now.hour)
+    ts = now.timestamp()
+    areas = []
+    for a in AREAS:
+        live = stats.slot(a["slug"], now.hour, ts)
+        fc = forecast.get(a["slug"])
+        status, z, ratio = classify(live, fc)
+        areas.append({
+            "slug": a["slug"], "area": a["name"], "center": [a["lat"], a["lng"]],
+            "status": status,
+            "live_wage_per_h": round(live["mean"]) if live["mean"] is not None else None,
+            "forecast_wage_per_h": round(fc) if fc else None,
+            "ratio": round(ratio, 3) if ratio is not None else None,
+            "z": round(z, 2) if z is not None and math.isfinite(z) else None,
+            "orders_per_h": round(live["orders_per_h"], 2) if live["orders_per_h"] is not None else None,
+            "weight_h": round(live["weight"], 2),
+        })
+    return {"generated_at": now.isoformat(timespec="seconds"), "hour": now.hour,
+            "half_life_min": HALF_LIFE_MIN, "areas": areas}
@@ -0,0 +1,3 @@
+# core/loadtest
+# 負荷試験：合成データ生成（synthetic）と HTTP 負荷ドライバ（driver）。
+# 実行は manage.py generate_synthetic_data / manage.py loadtest から。
@@ -0,0 +1,221 @@
+# core/loadtest/driver.py
+"""
+複数プロセスの HTTP 負荷ドライバ（標準ライブラリのみ・ワーカーは Django を import しない）。
+- シナリオ（MIX）の重みに従ってリクエストを選び、各プロセスが duration 秒間クローズドループで叩く
+- auth=True のリクエストは合成ユーザーでログイン済みのセッションで送る
+- サーバーが X-DB-Queries を返せば（DN_QUERY_COUNT_HEADER=1）エンドポイント別のクエリ数も集計
+"""
+import datetime
+import http.cookiejar
+import json
+import multiprocessing
+import os
+import random
+import re
+import statistics
+import subprocess
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+
+# name / method / path / weight / auth / form（POST のフォーム）/ files（multipart のファイル）
+# path の {since_30d} などは実行時に置換
+DEFAULT_MIX = [
+    {"name": "page_home", "path": "/", "weight": 20},
+    {"name": "page_map", "path": "/map/", "weight": 10},
+    {"name": "page_records", "path": "/records/", "weight": 10, "auth": True},
+    {"name": "page_upload", "path": "/upload/", "weight": 4, "auth": True},
+    {"name": "api_live_overlay", "path": "/api/live/overlay", "weight": 20},
+    {"name": "api_export_csv_30d", "path": "/api/records/export?format=csv&since={since_30d}", "weight": 3, "auth": True},
+    {"name": "api_entrance_search", "path": "/api/entrances/search?q=道玄坂2-3", "weight": 5, "auth": True},
+    {"name": "api_sync_full", "path": "/api/sync", "weight": 2, "auth": True},
+    {"name": "healthz", "path": "/healthz", "weight": 2},
+    {"name": "post_login", "method": "POST", "path": "/login/", "weight": 2, "form": "login"},
+]
+PNG_1PX = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360f8cfc0f01f0005000201a5d4b7e50000000049454e44ae426082"
+)
+CSRF_RE = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """302 もそのまま1リクエストとして計測する。"""
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def load_mix(path: str = None) -> list:
+    if not path:
+        return DEFAULT_MIX
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _expand(path: str) -> str:
+    today = datetime.date.today()
+    path = path.format(today=today.isoformat(), since_30d=(today - datetime.timedelta(days=30)).isoformat())
+    return urllib.parse.quote(path, safe="/?&=%:+,")  # クエリ中の日本語
+
+
+def _multipart(fields: dict, files: dict):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for k, v in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{k}"\r\n\r\n{v}\r\n'.encode())
+    for k, name in files.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{k}"; filename="{name}"\r\n'
+                     f"Content-Type: image/png\r\n\r\n".encode() + PNG_1PX + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+class Session:
+    def __init__(self, base_url: str, timeout: float = 30.0):
+        self.base = base_url.rstrip("/")
+        self.timeout = timeout
+        self.jar = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.jar), _NoRedirect)
+
+    def csrf(self, path="/login/") -> str:
+        body = self.opener.open(self.base + path, timeout=self.timeout).read().decode("utf-8", "replace")
+        m = CSRF_RE.search(body)
+        return m.group(1) if m else next((c.value for c in self.jar if c.name == "csrftoken"), "")
+
+    def request(self, method: str, path: str, data: bytes = None, content_type: str = None):
+        """(status, latency_ms, bytes, db_queries or None)"""
+        req = urllib.request.Request(self.base + path, data=data, method=method)
+        req.add_header("Accept-Encoding", "identity")
+        if content_type:
+            req.add_header("Content-Type", content_type)
+        if method != "GET":
+            req.add_header("Referer", self.base + path)
+        t0 = time.perf_counter()
+        try:
+            resp = self.opener.open(req, timeout=self.timeout)
+            status = resp.status
+        except urllib.error.HTTPError as e:
+            resp, status = e, e.code
+        except (urllib.error.URLError, OSError):
+            return 0, (time.perf_counter() - t0) * 1000, 0, None
+        size = 0
+        while True:
+            chunk = resp.read(65536)
+            if not chunk:
+                break
+            size += len(chunk)
+        ms = (time.perf_counter() - t0) * 1000
+        q = resp.headers.get("X-DB-Queries")
+        return status, ms, size, (int(q) if q is not None else None)
+
+    def login(self, username: str, password: str):
+        token = self.csrf()
+        data = urllib.parse.urlencode({"username": username, "password": password,
+                                       "csrfmiddlewaretoken": token}).encode()
+        return self.request("POST", "/login/", data, "application/x-www-form-urlencoded")
+
+
+def _worker(args):
+    """1プロセス分：ログイン → duration 秒間ミックスを叩き、(name, status, ms, bytes, queries) のリストを返す。"""
+    base_url, mix, duration, warmup, username, password, seed = args
+    rng = random.Random(seed)
+    anon, authed = Session(base_url), Session(base_url)
+    authed.login(username, password)
+    weights = [m.get("weight", 1) for m in mix]
+    samples = []
+    t_end = time.monotonic() + warmup + duration
+    t_rec = time.monotonic() + warmup
+    while time.monotonic() < t_end:
+        m = rng.choices(mix, weights)[0]
+        sess = authed if m.get("auth") else anon
+        method = m.get("method", "GET")
+        data = ctype = None
+        if m.get("form") == "login":
+            sess = Session(base_url)  # 毎回新しいセッションでログイン
+            data = urllib.parse.urlencode({"username": username, "password": password,
+                                           "csrfmiddlewaretoken": sess.csrf()}).encode()
+            ctype = "application/x-www-form-urlencoded"
+        elif method != "GET":
+            fields = {"csrfmiddlewaretoken": sess.csrf(), **(m.get("form") or {})}
+            if m.get("files"):
+                data, ctype = _multipart(fields, m["files"])
+            else:
+                data, ctype = urllib.parse.urlencode(fields).encode(), "application/x-www-form-urlencoded"
+        status, ms, size, q = sess.request(method, _expand(m["path"]), data, ctype)
+        if time.monotonic() >= t_rec:
+            samples.append((m["name"], status, ms, size, q))
+    return samples
+
+
+def _pct(sorted_vals, p):
+    if not sorted_vals:
+        return None
+    k = min(len(sorted_vals) - 1, max(0, round(p / 100 * len(sorted_vals)) - 1))
+    return sorted_vals[k]
+
+
+def summarize(samples: list, duration: float) -> dict:
+    by_name = {}
+    for name, status, ms, size, q in samples:
+        by_name.setdefault(name, []).append((status, ms, size, q))
+    endpoints = {}
+    for name, rows in sorted(by_name.items()):
+        lat = sorted(r[1] for r in rows)
+        qs = sorted(r[3] for r in rows if r[3] is not None)
+        statuses = {}
+        for r in rows:
+            statuses[str(r[0])] = statuses.get(str(r[0]), 0) + 1
+        endpoints[name] = {
+            "count": len(rows),
+            "errors": sum(1 for r in rows if r[0] == 0 or r[0] >= 400),
+            "status": statuses,
+            "rps": len(rows) / duration,
+            "latency_ms": {"p50": _pct(lat, 50), "p95": _pct(lat, 95), "p99": _pct(lat, 99),
+                           "mean": statistics.fmean(lat), "max": lat[-1]},
+            "bytes_mean": statistics.fmean(r[2] for r in rows),
+            "db_queries": ({"mean": statistics.fmean(qs), "p50": _pct(qs, 50), "max": qs[-1]} if qs else None),
+        }
+    lat = sorted(s[2] for s in samples)
+    total = {
+        "count": len(samples),
+        "errors": sum(e["errors"] for e in endpoints.values()),
+        "rps": len(samples) / duration,
+        "latency_ms": {"p50": _pct(lat, 50), "p95": _pct(lat, 95), "p99": _pct(lat, 99)},
+    }
+    return {"total": total, "endpoints": endpoints}
+
+
+def run(base_url: str, mix: list, processes: int, duration: float, warmup: float,
+        usernames: list, password: str, seed: int = 0) -> dict:
+    args = [(base_url, mix, duration, warmup, usernames[i % len(usernames)], password, seed + i)
+            for i in range(processes)]
+    with multiprocessing.get_context("spawn").Pool(processes) as pool:
+        results = pool.map(_worker, args)
+    samples = [s for r in results for s in r]
+    return summarize(samples, duration)
+
+
+def compare(old: dict, new: dict) -> list:
+    """2つのレポートのエンドポイント別 rps / p95 の差分行。"""
+    lines = []
+    for name, e in new["endpoints"].items():
+        o = old.get("endpoints", {}).get(name)
+        if not o:
+            lines.append(f"{name:<24} (new)")
+            continue
+        d_rps = (e["rps"] / o["rps"] - 1) * 100 if o["rps"] else 0.0
+        d_p95 = (e["latency_ms"]["p95"] / o["latency_ms"]["p95"] - 1) * 100 if o["latency_ms"]["p95"] else 0.0
+        lines.append(f"{name:<24} rps {o['rps']:8.1f} → {e['rps']:8.1f} ({d_rps:+.0f}%)  "
+                     f"p95 {o['latency_ms']['p95']:7.1f} → {e['latency_ms']['p95']:7.1f} ms ({d_p95:+.0f}%)")
+    return lines
+
+
+def git_revision(cwd: str = None):
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=cwd or os.getcwd(), timeout=5)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
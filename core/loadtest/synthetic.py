@@ -0,0 +1,141 @@
+# core/loadtest/synthetic.py
+"""
+負荷試験用の合成データ。ユーザー名は prefix で始まるので flush() でまとめて消せる。
+- DeliveryRecord：ランチ / ディナー帯に寄せた開始・終了時刻、エリア別の時給差、[AREA:slug] タグ付きメモ
+- EntranceInfo：エリアの区・町名から作った住所（建物名・部屋番号つき）と近傍の座標
+- OcrImport：一部の記録に紐づく取り込み履歴（画像はパスのみ、ファイルは作らない）
+"""
+import datetime
+import random
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from core import sync
+from core.areas import AREAS
+from core.models import DeliveryRecord, EntranceInfo, OcrImport, User, UserAiConsent
+
+BATCH = 5000
+PLATFORMS = ["Uber Eats", "出前館", "Wolt", "menu"]
+
+# エリア → (区, 町名候補, 基準時給)
+AREA_ADDRESSES = {
+    "shibuya":   ("渋谷区", ["道玄坂", "宇田川町", "神南", "桜丘町", "円山町"], 1850),
+    "ebisu":     ("渋谷区", ["恵比寿", "恵比寿西", "恵比寿南", "広尾"], 1800),
+    "shinjuku":  ("新宿区", ["西新宿", "歌舞伎町", "新宿", "百人町", "大久保"], 1750),
+    "ikebukuro": ("豊島区", ["西池袋", "東池袋", "南池袋", "池袋本町"], 1650),
+    "ueno":      ("台東区", ["上野", "東上野", "上野桜木", "池之端"], 1600),
+    "asakusa":   ("台東区", ["浅草", "花川戸", "雷門", "西浅草"], 1550),
+    "kanda":     ("千代田区", ["神田須田町", "外神田", "神田佐久間町", "岩本町"], 1700),
+    "ginza":     ("中央区", ["銀座", "有楽町", "築地", "新富"], 1900),
+}
+BUILDINGS = ["ハイツ", "マンション", "レジデンス", "コーポ", "ビル", "タワー", "荘"]
+BUILDING_PREFIX = ["サン", "グラン", "パーク", "メゾン", "ライオンズ", "プラウド", "シティ", "第2"]
+ENTRANCE_NOTES = [
+    "オートロック。インターホンは入口左側", "裏口から入る。表は夜間施錠", "宅配ボックスあり",
+    "エレベーターは奥。階段は使えない", "置き配可。ドア前に置いて写真", "1階がコンビニ。入口は建物右側",
+]
+
+
+def _hour_rate(rng, base, hour):
+    peak = 1.25 if hour in (11, 12, 18, 19, 20) else (1.1 if hour in (13, 17, 21) else 0.9)
+    return max(600.0, rng.gauss(base * peak, base * 0.12))
+
+
+def _record(rng, user, day, slug):
+    lunch = rng.random() < 0.45
+    start = rng.randint(10 * 60 + 30, 12 * 60) if lunch else rng.randint(16 * 60 + 30, 20 * 60)
+    dur = rng.choice([60, 90, 120, 150, 180, 240, 300])
+    end = min(start + dur, 23 * 60 + 55)
+    hours = (end - start) / 60
+    rate = _hour_rate(rng, AREA_ADDRESSES[slug][2], start // 60)
+    label = "ランチ" if lunch else "ディナー"
+    return DeliveryRecord(
+        user=user, date=day, area_slug=slug,
+        start_time=datetime.time(start // 60, start % 60), end_time=datetime.time(end // 60, end % 60),
+        hours_worked=Decimal(f"{hours:.2f}"), earnings=Decimal(f"{rate * hours:.0f}"),
+        orders_completed=max(1, round(hours * rng.uniform(1.6, 2.8))),
+        note=f"[AREA:{slug}] {label}" + (" 雨" if rng.random() < 0.1 else ""),
+    )
+
+
+def address(rng, slug) -> str:
+    ward, towns, _ = AREA_ADDRESSES[slug]
+    addr = f"東京都{ward}{rng.choice(towns)}{rng.randint(1, 5)}-{rng.randint(1, 30)}-{rng.randint(1, 20)}"
+    if rng.random() < 0.7:
+        addr += f" {rng.choice(BUILDING_PREFIX)}{rng.choice(['桜', '青葉', '中央', '駅前', '本町', ''])}{rng.choice(BUILDINGS)}"
+        addr += f" {rng.randint(1, 12)}0{rng.randint(1, 9)}号室"
+    return addr
+
+
+def generate(n_users: int, days: int = 90, active_ratio: float = 0.4, entrances_per_user: float = 2.0,
+             ocr_ratio: float = 0.1, prefix: str = "lt_", password: str = "loadtest-pass",
+             seed: int = 0, log=None) -> dict:
+    """合成データを投入して件数を返す。"""
+    rng = random.Random(seed)
+    today = timezone.localdate()
+    pw_hash = make_password(password)  # ハッシュは1回だけ（ユーザー数ぶん PBKDF2 を回さない）
+    counts = {"users": 0, "records": 0, "entrances": 0, "ocr_imports": 0}
+
+    start = User.objects.filter(username__startswith=prefix).count()
+    for lo in range(0, n_users, 1000):
+        users = User.objects.bulk_create([
+            User(username=f"{prefix}{start + i:06d}", password=pw_hash, nickname=f"配達員{start + i}",
+                 platform=rng.choice(PLATFORMS))
+            for i in range(lo, min(n_users, lo + 1000))
+        ])
+        UserAiConsent.objects.bulk_create([UserAiConsent(user=u, share_aggregated=rng.random() < 0.85) for u in users])
+        counts["users"] += len(users)
+
+        records, entrances = [], []
+        for u in users:
+            home = rng.choice(AREAS)["slug"]
+            for d in range(days):
+                if rng.random() < active_ratio:
+                    slug = home if rng.random() < 0.7 else rng.choice(AREAS)["slug"]
+                    records.append(_record(rng, u, today - datetime.timedelta(days=d), slug))
+            for _ in range(int(entrances_per_user) + (rng.random() < entrances_per_user % 1)):
+                slug = home if rng.random() < 0.8 else rng.choice(AREAS)["slug"]
+                a = next(x for x in AREAS if x["slug"] == slug)
+                entrances.append(EntranceInfo(
+                    user=u, address=address(rng, slug),
+                    latitude=a["lat"] + rng.uniform(-0.01, 0.01), longitude=a["lng"] + rng.uniform(-0.01, 0.01),
+                    note=rng.choice(ENTRANCE_NOTES),
+                ))
+        for e in entrances:
+            e.refresh_search_keys()  # bulk_create は save() を通らない
+        with transaction.atomic():
+            sync.stamp_bulk(records + entrances)
+            DeliveryRecord.objects.bulk_create(records, batch_size=BATCH)
+            EntranceInfo.objects.bulk_create(entrances, batch_size=BATCH)
+        counts["records"] += len(records)
+        counts["entrances"] += len(entrances)
+
+        ocr = []
+        for r in records:
+            if rng.random() < ocr_ratio:
+                ok = rng.random() < 0.92
+                ocr.append(OcrImport(
+                    user=r.user, image=f"ocr/synthetic/{uuid.UUID(int=rng.getrandbits(128)).hex}.png",
+                    raw_text=f"{r.date:%m/%d} 売上 ¥{r.earnings} 配達 {r.orders_completed}件",
+                    parsed_json={"date": r.date.isoformat(), "earnings": str(r.earnings),
+                                 "orders_completed": r.orders_completed} if ok else {},
+                    created_record=r if ok else None,
+                    status="success" if ok else "failed", message=None if ok else "金額を読み取れませんでした",
+                ))
+        with transaction.atomic():
+            sync.stamp_bulk(ocr)
+            OcrImport.objects.bulk_create(ocr, batch_size=BATCH)
+        counts["ocr_imports"] += len(ocr)
+        if log:
+            log(f"  users {counts['users']:,}/{n_users:,}  records {counts['records']:,}")
+    return counts
+
+
+def flush(prefix: str = "lt_") -> int:
+    """prefix で始まる合成ユーザーを関連データごと削除（CASCADE）。"""
+    deleted, _ = User.objects.filter(username__startswith=prefix).delete()
+    return deleted
@@ -0,0 +1,62 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.archive import (
+    OCR_IMAGE_MODES, archive_deliveries, archive_ocr_imports, hot_query_ms, table_sizes,
+)
+
+
+def _fmt_bytes(n):
+    if n is None:
+        return "n/a"
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024:
+            return f"{n:.0f}{unit}"
+        n /= 1024
+    return f"{n:.1f}TB"
+
+
+class Command(BaseCommand):
+    help = "Move DeliveryRecord / OcrImport rows older than the cutoff into monthly compressed archive chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=90, help="これより古い行をアーカイブ（デフォ90日 = train_lgbm の lookback と同じ）")
+        parser.add_argument("--batch_size", type=int, default=2000, help="1トランザクションで移す行数")
+        parser.add_argument("--ocr_images", choices=OCR_IMAGE_MODES, default="prune",
+                            help="古いOCR画像の扱い（prune=削除 / recompress=縮小JPEG化 / keep）")
+        parser.add_argument("--stats", action="store_true", help="前後のテーブル/インデックスサイズとホットクエリ時間を表示")
+
+    def _report(self, label):
+        self.stdout.write(self.style.NOTICE(f"[{label}] hot query (90d area agg) = {hot_query_ms():.2f} ms"))
+        for t, s in table_sizes().items():
+            self.stdout.write(f"  {t}: table={_fmt_bytes(s['table_bytes'])} index={_fmt_bytes(s['index_bytes'])}")
+
+    def handle(self, *args, **opts):
+        days = opts["days"]
+        cutoff_dt = timezone.now() - datetime.timedelta(days=days)
+        cutoff = timezone.localdate(cutoff_dt)
+        self.stdout.write(self.style.NOTICE(f"[archive_old_data] cutoff={cutoff} ..."))
+
+        if opts["stats"]:
+            self._report("before")
+
+        # OCR を先に（DeliveryRecord 削除で created_record が NULL 化される前に ID を残す）
+        n_ocr = archive_ocr_imports(cutoff_dt, batch_size=max(1, opts["batch_size"] // 4),
+                                    image_mode=opts["ocr_images"])
+        n_rec = archive_deliveries(cutoff, batch_size=opts["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"archived DeliveryRecord={n_rec} OcrImport={n_ocr}"))
+
+        if opts["stats"]:
+            if n_rec or n_ocr:
+                from django.db import connection
+                if connection.vendor == "sqlite":
+                    with connection.cursor() as cur:
+                        cur.execute("VACUUM")
+                elif connection.vendor == "postgresql":
+                    with connection.cursor() as cur:
+                        cur.execute("VACUUM ANALYZE core_deliveryrecord")
+                        cur.execute("VACUUM ANALYZE core_ocrimport")
+            self._report("after")
+        self.stdout.write(self.style.SUCCESS("Done."))
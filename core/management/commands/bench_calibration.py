@@ -0,0 +1,125 @@
+import datetime
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from django.utils import timezone
+
+from core import calibration, page_data
+from core.areas import AREAS
+from core.models import DeliveryRecord, User, UserAiConsent, UserCalibration
+
+AREA_BASE = {a["slug"]: 1500 + 60 * i for i, a in enumerate(AREAS)}
+
+
+def _record(rng, user, day, bias):
+    """ユーザーごとのずれ（全体＋得意エリア＋ディナー）を持つ合成記録。"""
+    slug = rng.choice(AREAS)["slug"]
+    start = rng.randint(10 * 60, 20 * 60)
+    end = min(start + rng.choice([60, 90, 120, 180]), 23 * 60 + 30)
+    dinner = start >= 17 * 60
+    rate = AREA_BASE[slug] + bias["all"] + bias["area"].get(slug, 0) + (bias["dinner"] if dinner else 0)
+    rate = max(500, rng.gauss(rate, 250))
+    hours = (end - start) / 60
+    return DeliveryRecord(user=user, date=day, area_slug=slug,
+                          start_time=datetime.time(start // 60, start % 60), end_time=datetime.time(end // 60, end % 60),
+                          hours_worked=Decimal(f"{hours:.2f}"), earnings=Decimal(f"{rate * hours:.0f}"),
+                          orders_completed=max(1, round(hours * 2)))
+
+
+def _p(vals, q):
+    vals = sorted(vals)
+    return vals[min(len(vals) - 1, int(len(vals) * q))]
+
+
+class Command(BaseCommand):
+    help = "Benchmark per-user calibration: incremental update cost, request-time lookup+add latency and holdout MAE."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=300)
+        parser.add_argument("--days", type=int, default=60, help="ユーザーごとの学習用の日数（1日1件）")
+        parser.add_argument("--holdout", type=int, default=10, help="ユーザーごとの評価用の件数")
+        parser.add_argument("--lookups", type=int, default=100_000)
+
+    def handle(self, *args, **opts):
+        rng = random.Random(0)
+        today = timezone.localdate()
+        with transaction.atomic(), override_settings(DEBUG=False):
+            users = User.objects.bulk_create([User(username=f"bench_calib_{i}") for i in range(opts["users"])])
+            # 共有予測の代替（エリア平均）は同意ユーザーの記録から作る
+            UserAiConsent.objects.bulk_create([UserAiConsent(user=u) for u in users])
+            biases = {u.pk: {"all": rng.gauss(0, 250), "dinner": rng.gauss(0, 150),
+                             "area": {rng.choice(AREAS)["slug"]: rng.gauss(0, 300)}} for u in users}
+            DeliveryRecord.objects.bulk_create(
+                [_record(rng, u, today - datetime.timedelta(days=d + 1), biases[u.pk])
+                 for u in users for d in range(opts["days"])], batch_size=5000)
+
+            t0 = time.perf_counter()
+            n = calibration.rebuild()
+            dt = time.perf_counter() - t0
+            size = len(UserCalibration.objects.first().payload)
+            self.stdout.write(self.style.NOTICE(
+                f"[rebuild] {n:,} users / {n * opts['days']:,} records in {dt:.1f}s, payload {size} B/user"))
+
+            # 1) 保存1件ごとの増分更新（signals 経由の save 全体と、補正の更新だけ）
+            save_ms, apply_ms = [], []
+            for u in users[:200]:
+                rec = _record(rng, u, today, biases[u.pk])
+                t0 = time.perf_counter()
+                rec.save()
+                save_ms.append((time.perf_counter() - t0) * 1000)
+                t0 = time.perf_counter()
+                calibration.apply_changes(u.pk, added=[calibration.record_fields(rec)], removed=[rec.pk])  # 編集相当
+                apply_ms.append((time.perf_counter() - t0) * 1000)
+            note_ms = []
+            for rec in DeliveryRecord.objects.filter(user__in=users[:200], date=today):
+                rec.note = "メモ"
+                t0 = time.perf_counter()
+                rec.save(update_fields=["note"])  # 補正に関係しない編集（補正は触らない）
+                note_ms.append((time.perf_counter() - t0) * 1000)
+            self.stdout.write(f"[update] save()+signals p50={statistics.median(save_ms):.2f}ms "
+                              f"p99={_p(save_ms, .99):.2f}ms; calibration update alone p50={statistics.median(apply_ms):.2f}ms; "
+                              f"note-only edit p50={statistics.median(note_ms):.2f}ms")
+
+            # 2) リクエスト時：共有予測のみ vs 補正つき
+            now = timezone.localtime()
+            uid = users[0].pk
+            page_data.forecast_for(now.date(), now.hour)
+            calibration.adjustment(uid)
+            for label, fn in (
+                ("shared forecast_for", lambda: page_data.forecast_for(now.date(), now.hour)),
+                ("personal_forecast", lambda: calibration.personal_forecast(uid, now.date(), now.hour)),
+            ):
+                t0 = time.perf_counter()
+                for _ in range(opts["lookups"] // 10):
+                    fn()
+                per = (time.perf_counter() - t0) / (opts["lookups"] // 10) * 1e6
+                self.stdout.write(f"[request] {label:<22} {per:8.2f} µs/call")
+            rates, grid = page_data.forecast_for(now.date(), now.hour), calibration.adjustment(uid)
+            t0 = time.perf_counter()
+            for _ in range(opts["lookups"]):
+                calibration.personalize(rates, grid, now.hour)
+            self.stdout.write(f"[request] {'lookup+add only':<22} "
+                              f"{(time.perf_counter() - t0) / opts['lookups'] * 1e6:8.2f} µs/call ({len(rates)} areas)")
+
+            # 3) 評価：学習に使っていない記録で MAE（円/h）
+            err_shared, err_personal = [], []
+            for u in users:
+                grid = calibration.adjustment(u.pk)
+                for _ in range(opts["holdout"]):
+                    rec = calibration.record_fields(_record(rng, u, today - datetime.timedelta(days=1), biases[u.pk]))
+                    fc = calibration.forecasts_for([rec])
+                    for h, _portion, yen in calibration.hourly_portions(rec):
+                        shared = fc[(rec["date"], h)][rec["area_slug"]]
+                        mine = calibration.personalize({rec["area_slug"]: shared}, grid, h)[rec["area_slug"]]
+                        err_shared.append(abs(yen - shared))
+                        err_personal.append(abs(yen - mine))
+            m_s, m_p = statistics.fmean(err_shared), statistics.fmean(err_personal)
+            self.stdout.write(f"[holdout] MAE shared {m_s:.0f} yen/h → personal {m_p:.0f} yen/h "
+                              f"({(m_p / m_s - 1) * 100:+.1f}%, {len(err_shared):,} hourly samples)")
+            transaction.set_rollback(True)
+        self.stdout.write(self.style.SUCCESS("Done."))
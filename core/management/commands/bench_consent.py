@@ -0,0 +1,77 @@
+import datetime
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core.consent import has_ai_consent, invalidate, with_ai_consent
+from core.models import DeliveryRecord, User, UserAiConsent
+
+
+def _median_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+class Command(BaseCommand):
+    help = "Benchmark the consent-filtered training query (IN-list vs EXISTS) and the cached consent lookup. Rolls back its data."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100_000, help="同意ONユーザー数")
+        parser.add_argument("--opt_out_ratio", type=float, default=0.1, help="同意OFFにする割合")
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **opts):
+        n_users = opts["users"]
+        repeat = opts["repeat"]
+        today = timezone.localdate()
+
+        with transaction.atomic():
+            self.stdout.write(self.style.NOTICE(f"[bench_consent] creating {n_users} users ..."))
+            users = User.objects.bulk_create(
+                [User(username=f"bench_consent_{i}") for i in range(n_users)], batch_size=5000
+            )
+            n_out = int(n_users * opts["opt_out_ratio"])
+            UserAiConsent.objects.bulk_create(
+                [UserAiConsent(user=u, share_aggregated=(i >= n_out)) for i, u in enumerate(users)],
+                batch_size=5000,
+            )
+            DeliveryRecord.objects.bulk_create(
+                [DeliveryRecord(user=u, date=today - datetime.timedelta(days=i % 60),
+                                earnings=Decimal("3000"), hours_worked=Decimal("2"))
+                 for i, u in enumerate(users)],
+                batch_size=5000,
+            )
+            since = today - datetime.timedelta(days=90)
+
+            def old_in_list():
+                opted = set(UserAiConsent.objects.filter(share_aggregated=True).values_list("user_id", flat=True))
+                return list(DeliveryRecord.objects.filter(date__gte=since, user_id__in=opted).values_list("id", flat=True))
+
+            def new_exists():
+                return list(with_ai_consent(DeliveryRecord.objects.filter(date__gte=since)).values_list("id", flat=True))
+
+            assert sorted(old_in_list()) == sorted(new_exists())
+            try:
+                t_old = f"{_median_ms(old_in_list, repeat):.1f} ms"
+            except Exception as e:  # SQLite の変数上限など
+                t_old = f"failed ({e.__class__.__name__})"
+            t_new = _median_ms(new_exists, repeat)
+            self.stdout.write(f"training query  IN-list: {t_old}")
+            self.stdout.write(f"training query  EXISTS : {t_new:.1f} ms")
+
+            sample = [u.id for u in users[:1000]]
+            invalidate()
+            cold = _median_ms(lambda: [has_ai_consent(i) for i in sample], 1)
+            warm = _median_ms(lambda: [has_ai_consent(i) for i in sample], repeat)
+            self.stdout.write(f"has_ai_consent x1000  cold: {cold:.1f} ms  cached: {warm:.2f} ms")
+            invalidate()
+            transaction.set_rollback(True)
+        self.stdout.write(self.style.SUCCESS("Done."))
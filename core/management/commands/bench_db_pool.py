@@ -0,0 +1,74 @@
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections, connection
+
+
+def _pct(samples, p):
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(len(s) * p / 100))]
+
+
+class Command(BaseCommand):
+    help = ("Simulate request cycles (connect -> query -> request_finished) from N threads against the "
+            "configured DB. Run once per mode, e.g. DB_POOL=0 DB_CONN_MAX_AGE=0 / DB_POOL=1.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=6, help="同時リクエスト数（gunicorn ワーカー×スレッド相当）")
+        parser.add_argument("--requests", type=int, default=300, help="スレッド当たりのリクエスト数")
+        parser.add_argument("--queries", type=int, default=3, help="1リクエスト当たりのクエリ数")
+        parser.add_argument("--check_timeout", action="store_true", help="statement_timeout が効くか確認（Web と同じ設定にするには DN_WEB_WORKER=1 で実行）")
+
+    def _worker(self, n, n_queries, connect_ms, total_ms):
+        for _ in range(n):
+            t0 = time.perf_counter()
+            connection.ensure_connection()
+            t1 = time.perf_counter()
+            with connection.cursor() as cur:
+                for _ in range(n_queries):
+                    cur.execute("SELECT 1")
+                    cur.fetchone()
+            close_old_connections()  # request_finished と同じ後始末
+            t2 = time.perf_counter()
+            connect_ms.append((t1 - t0) * 1000)
+            total_ms.append((t2 - t0) * 1000)
+        connection.close()
+
+    def handle(self, *args, **opts):
+        s = connection.settings_dict
+        pool = s["OPTIONS"].get("pool")
+        self.stdout.write(self.style.NOTICE(
+            f"[bench_db_pool] vendor={connection.vendor} CONN_MAX_AGE={s['CONN_MAX_AGE']} pool={pool or 'off'} "
+            f"options={s['OPTIONS'].get('options', '')!r}"
+        ))
+        connect_ms, total_ms = [], []
+        threads = [
+            threading.Thread(target=self._worker, args=(opts["requests"], opts["queries"], connect_ms, total_ms))
+            for _ in range(opts["threads"])
+        ]
+        t0 = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - t0
+        self.stdout.write(
+            f"requests={len(total_ms)} rps={len(total_ms) / wall:.0f} "
+            f"connect avg={statistics.mean(connect_ms):.3f}ms p99={_pct(connect_ms, 99):.3f}ms | "
+            f"request p50={_pct(total_ms, 50):.3f}ms p99={_pct(total_ms, 99):.3f}ms"
+        )
+
+        if opts["check_timeout"] and connection.vendor == "postgresql":
+            try:
+                with connection.cursor() as cur:
+                    cur.execute("SHOW statement_timeout")
+                    limit = cur.fetchone()[0]
+                    t0 = time.perf_counter()
+                    cur.execute("SELECT pg_sleep(3600)")
+                self.stdout.write(self.style.WARNING("statement_timeout が効いていません"))
+            except OperationalError as e:
+                self.stdout.write(self.style.SUCCESS(
+                    f"statement_timeout={limit}: canceled after {time.perf_counter() - t0:.2f}s ({e.__class__.__name__})"))
+        connection.close()
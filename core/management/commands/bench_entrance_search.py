@@ -0,0 +1,102 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test import Client, override_settings
+
+from core import entrance_search
+from core.areas import AREAS
+from core.loadtest.synthetic import ENTRANCE_NOTES, address
+from core.models import EntranceInfo, User
+
+# (ラベル, クエリ)。表記揺れ・誤字を含む
+QUERIES = [
+    ("building", "グランレジデンス"),
+    ("town+chome", "道玄坂3-12"),
+    ("kanji/zenkaku", "道玄坂三丁目１２番"),
+    ("room", "プラウド桜ハイツ 803号室"),
+    ("note", "宅配ボックス"),
+    ("typo", "恵比須南2-5"),
+    ("rare", "池之端5-30-20"),
+    ("short", "築地"),
+]
+
+
+def _pct(vals, p):
+    vals = sorted(vals)
+    return vals[min(len(vals) - 1, int(len(vals) * p / 100))]
+
+
+class Command(BaseCommand):
+    help = "Benchmark EntranceInfo search (FTS5 / pg_trgm index) against icontains on a synthetic table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument("--repeat", type=int, default=20, help="クエリごとの反復回数")
+        parser.add_argument("--limit", type=int, default=20)
+
+    def _seed(self, n):
+        rng = random.Random(0)
+        users = User.objects.bulk_create([User(username=f"bench_entr_{i}") for i in range(1000)])
+        t0 = time.perf_counter()
+        batch = []
+        for i in range(n):
+            slug = AREAS[i % len(AREAS)]["slug"]
+            e = EntranceInfo(user=users[i % len(users)], address=address(rng, slug),
+                             note=rng.choice(ENTRANCE_NOTES) if rng.random() < 0.6 else "")
+            e.refresh_search_keys()
+            batch.append(e)
+            if len(batch) == 10_000:
+                EntranceInfo.objects.bulk_create(batch)
+                batch = []
+        EntranceInfo.objects.bulk_create(batch)
+        return time.perf_counter() - t0
+
+    def _time(self, fn, repeat):
+        fn()  # ウォームアップ
+        lat = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            out = fn()
+            lat.append((time.perf_counter() - t0) * 1000)
+        return lat, out
+
+    def handle(self, *args, **opts):
+        limit, repeat = opts["limit"], opts["repeat"]
+        with transaction.atomic(), override_settings(DEBUG=False, ALLOWED_HOSTS=["*"]):
+            dt = self._seed(opts["rows"])
+            self.stdout.write(self.style.NOTICE(
+                f"[seed] {opts['rows']:,} entrances in {dt:.0f}s ({opts['rows'] / dt:,.0f} rows/s incl. index), "
+                f"vendor={connection.vendor} backend={entrance_search.backend()}"))
+
+            self.stdout.write(f"{'query':<14} {'icontains p50/p99 ms':>22} {'hits':>5}   "
+                              f"{'index p50/p99 ms':>18} {'hits':>5}  top")
+            all_base, all_idx = [], []
+            for label, q in QUERIES:
+                def base():
+                    return list(EntranceInfo.objects.filter(Q(address__icontains=q) | Q(note__icontains=q))
+                                .order_by("-id").values_list("id", flat=True)[:limit])
+
+                def idx():
+                    return entrance_search.search(q, limit=limit)
+
+                lb, hb = self._time(base, repeat)
+                li, hi = self._time(idx, repeat)
+                all_base += lb
+                all_idx += li
+                top = hi[0].address if hi else "-"
+                self.stdout.write(f"{label:<14} {_pct(lb, 50):>10.1f} / {_pct(lb, 99):>8.1f} {len(hb):>5}   "
+                                  f"{_pct(li, 50):>8.1f} / {_pct(li, 99):>7.1f} {len(hi):>5}  {top}")
+            self.stdout.write(f"{'ALL':<14} {_pct(all_base, 50):>10.1f} / {_pct(all_base, 99):>8.1f}         "
+                              f"{_pct(all_idx, 50):>8.1f} / {_pct(all_idx, 99):>7.1f}  "
+                              f"(p50 x{_pct(all_base, 50) / _pct(all_idx, 50):.0f})")
+
+            client = Client()
+            client.force_login(User.objects.filter(username="bench_entr_0").first())
+            lat, _ = self._time(lambda: client.get("/api/entrances/search", {"q": "道玄坂3-12"}), repeat)
+            self.stdout.write(f"/api/entrances/search p50={statistics.median(lat):.1f}ms p99={_pct(lat, 99):.1f}ms")
+            transaction.set_rollback(True)
+        self.stdout.write(self.style.SUCCESS("Done."))
@@ -0,0 +1,92 @@
+import datetime
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from core.areas import AREAS
+from core.models import DeliveryRecord, User
+
+
+def _reset_peak_rss():
+    """VmHWM をリセット（Linux）。できなければ False。"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _rss_kb(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field):
+                return int(line.split()[1])
+    return 0
+
+
+class Command(BaseCommand):
+    help = "Benchmark /api/records/export throughput, time-to-first-byte and peak RSS. Rolls back its data."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=5_000_000)
+        parser.add_argument("--formats", default="csv,ndjson,parquet")
+        parser.add_argument("--gzip", action="store_true")
+
+    def _seed(self, n_rows):
+        days = 1000  # (user, date) が unique なので 1ユーザー最大1000日
+        n_users = max(1, -(-n_rows // days))
+        staff = User.objects.create(username="bench_export_staff", is_staff=True)
+        users = User.objects.bulk_create([User(username=f"bench_export_{i}") for i in range(n_users)])
+        today = timezone.localdate()
+        batch, done = [], 0
+        for u in users:
+            for d in range(min(days, n_rows - done)):
+                batch.append(DeliveryRecord(
+                    user=u, date=today - datetime.timedelta(days=d), orders_completed=d % 9,
+                    earnings=Decimal("3850.00"), hours_worked=Decimal("2.50"),
+                    start_time=datetime.time(11, 0), end_time=datetime.time(13, 30),
+                    area_slug=AREAS[d % len(AREAS)]["slug"], note="ランチピーク",
+                ))
+            done += min(days, n_rows - done)
+            if len(batch) >= 50_000:
+                DeliveryRecord.objects.bulk_create(batch, batch_size=5000)
+                batch = []
+        DeliveryRecord.objects.bulk_create(batch, batch_size=5000)
+        return staff
+
+    def handle(self, *args, **opts):
+        with transaction.atomic(), override_settings(DEBUG=False, ALLOWED_HOSTS=["*"]):
+            t0 = time.perf_counter()
+            staff = self._seed(opts["rows"])
+            self.stdout.write(self.style.NOTICE(
+                f"[bench_export] seeded {opts['rows']} rows in {time.perf_counter() - t0:.0f}s"))
+            client = Client()
+            client.force_login(staff)
+            for fmt in opts["formats"].split(","):
+                params = {"format": fmt, "user": "all"}
+                if opts["gzip"]:
+                    params["gzip"] = "1"
+                can_reset = _reset_peak_rss()
+                base = _rss_kb("VmRSS:")
+                t0 = time.perf_counter()
+                resp = client.get("/api/records/export", params)
+                ttfb = None
+                total = 0
+                for chunk in resp.streaming_content:
+                    if ttfb is None:
+                        ttfb = time.perf_counter() - t0
+                    total += len(chunk)
+                wall = time.perf_counter() - t0
+                peak = _rss_kb("VmHWM:") - base if can_reset else None
+                self.stdout.write(
+                    f"{fmt:<8} status={resp.status_code} bytes={total / 1e6:.1f}MB ttfb={ttfb * 1000:.1f}ms "
+                    f"wall={wall:.1f}s rows/s={opts['rows'] / wall:,.0f} "
+                    f"peak_rss_delta={'n/a' if peak is None else f'{peak / 1024:.1f}MB'}"
+                )
+            transaction.set_rollback(True)
+        self.stdout.write(self.style.SUCCESS("Done."))
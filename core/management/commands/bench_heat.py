@@ -0,0 +1,127 @@
+import datetime
+import gzip
+import json
+import math
+import random
+import statistics
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from core import heat
+from core.areas import AREA_INDEX, AREAS
+from core.management.commands.bench_live import _record
+from core.models import DeliveryRecord, EntranceInfo, HeatCell, User, UserAiConsent
+
+
+def _tile_bounds(z, x, y):
+    """(south, west, north, east)"""
+    n = 1 << z
+
+    def lat(t):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * t / n))))
+    return lat(y + 1), x / n * 360 - 180, lat(y), (x + 1) / n * 360 - 180
+
+
+def _tiles_around(z, lat, lng, radius):
+    cx, cy = heat.cell_of(lat, lng, z)
+    x, y = cx // heat.GRID, cy // heat.GRID
+    return [(z, x + dx, y + dy) for dx in range(-radius, radius + 1) for dy in range(-radius, radius + 1)]
+
+
+class Command(BaseCommand):
+    help = "Benchmark the heatmap pyramid: build throughput, tile generation time and payload size vs raw points."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--records", type=int, default=200_000)
+        parser.add_argument("--entrances", type=int, default=200_000)
+
+    def _raw_points(self, z, x, y):
+        """比較用：タイル範囲の生の点（入口＝座標、実績＝エリア中心＋円/h）をそのまま JSON で返す場合。"""
+        s, w, n, e = _tile_bounds(z, x, y)
+        pts = [[round(la, 6), round(lo, 6)] for la, lo in EntranceInfo.objects.filter(
+            latitude__gte=s, latitude__lt=n, longitude__gte=w, longitude__lt=e).values_list("latitude", "longitude")]
+        slugs = [slug for slug, a in AREA_INDEX.items() if s <= a["lat"] < n and w <= a["lng"] < e]
+        for slug, hours, earnings in (DeliveryRecord.objects.filter(area_slug__in=slugs)
+                                      .values_list("area_slug", "hours_worked", "earnings")):
+            a = AREA_INDEX[slug]
+            pts.append([a["lat"], a["lng"], round(float(earnings) / float(hours)) if hours else None])
+        return json.dumps(pts, separators=(",", ":")).encode()
+
+    def handle(self, *args, **opts):
+        rng = random.Random(0)
+        with transaction.atomic(), override_settings(DEBUG=False, ALLOWED_HOSTS=["*"]):
+            users = User.objects.bulk_create([User(username=f"bench_heat_{i}") for i in range(2000)])
+            UserAiConsent.objects.bulk_create([UserAiConsent(user=u) for u in users])
+            today = timezone.localdate()
+            # (user, date) は一意なのでユーザー数ごとに日付をずらす
+            DeliveryRecord.objects.bulk_create(
+                [DeliveryRecord(**_record(rng, today - datetime.timedelta(days=i // len(users)), users[i % len(users)], i))
+                 for i in range(opts["records"])], batch_size=5000)
+            ents = []
+            for i in range(opts["entrances"]):
+                a = AREAS[i % len(AREAS)]
+                ents.append(EntranceInfo(user=users[i % len(users)], address="bench",
+                                         latitude=rng.gauss(a["lat"], 0.012), longitude=rng.gauss(a["lng"], 0.015)))
+            EntranceInfo.objects.bulk_create(ents, batch_size=5000)
+
+            t0 = time.perf_counter()
+            n = heat.rebuild()
+            dt = time.perf_counter() - t0
+            self.stdout.write(self.style.NOTICE(
+                f"[build] {n:,} rows in {dt:.1f}s ({n / dt:,.0f} rows/s), {HeatCell.objects.count():,} cells "
+                f"over z{heat.Z_MIN}..{heat.Z_MAX}"))
+
+            # 増分：1,000 件追加して1ステップ
+            more = [EntranceInfo(user=users[0], address="bench", latitude=rng.gauss(35.66, 0.01),
+                                 longitude=rng.gauss(139.70, 0.01)) for _ in range(1000)]
+            EntranceInfo.objects.bulk_create(more)
+            t0 = time.perf_counter()
+            heat.step()
+            self.stdout.write(f"[incremental] 1,000 new entrances in {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+            self.stdout.write(f"{'z':>3} {'tiles':>5} {'gen ms':>8} {'bin B':>8} {'json B':>8} {'json.gz':>8}"
+                              f" | {'raw ms':>8} {'raw B':>10} {'raw.gz':>9}")
+            shibuya = AREA_INDEX["shibuya"]
+            for z in range(heat.Z_MIN, heat.Z_MAX + 1):
+                tiles = _tiles_around(z, shibuya["lat"], shibuya["lng"], 1)
+                gen, sb, sj, sjz, raw_ms, raw_b, raw_z = [], [], [], [], [], [], []
+                for t in tiles:
+                    cache.clear()
+                    t0 = time.perf_counter()
+                    payload, _ = heat.tile(*t)
+                    gen.append((time.perf_counter() - t0) * 1000)
+                    sb.append(len(payload))
+                    pj, _ = heat.tile(*t, fmt="json")
+                    sj.append(len(pj))
+                    sjz.append(len(gzip.compress(pj)))
+                    t0 = time.perf_counter()
+                    raw = self._raw_points(*t)
+                    raw_ms.append((time.perf_counter() - t0) * 1000)
+                    raw_b.append(len(raw))
+                    raw_z.append(len(gzip.compress(raw)))
+                m = statistics.fmean
+                self.stdout.write(f"{z:>3} {len(tiles):>5} {m(gen):>8.2f} {m(sb):>8.0f} {m(sj):>8.0f} {m(sjz):>8.0f}"
+                                  f" | {m(raw_ms):>8.1f} {m(raw_b):>10,.0f} {m(raw_z):>9,.0f}")
+
+            client = Client()
+            url = "/api/heat/13/{}/{}".format(*_tiles_around(13, shibuya["lat"], shibuya["lng"], 0)[0][1:])
+            first = client.get(url)
+            lat_hit, lat_304 = [], []
+            for _ in range(200):
+                t0 = time.perf_counter()
+                client.get(url)
+                lat_hit.append((time.perf_counter() - t0) * 1000)
+                t0 = time.perf_counter()
+                r304 = client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+                lat_304.append((time.perf_counter() - t0) * 1000)
+            self.stdout.write(f"{url} status={first.status_code} etag={first['ETag']} "
+                              f"cached p50={statistics.median(lat_hit):.2f}ms, "
+                              f"If-None-Match → {r304.status_code} p50={statistics.median(lat_304):.2f}ms")
+            transaction.set_rollback(True)
+        cache.clear()
+        self.stdout.write(self.style.SUCCESS("Done."))
@@ -0,0 +1,62 @@
+import os
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from core.ml import search
+from core.ml.features import FEATURE_ORDER
+
+
+def synthetic_dataset(n_rows: int, n_days: int = 120, n_areas: int = 8, seed: int = 0):
+    """FEATURE_ORDER と同じ列構成の合成データ（時給 = 曜日×時間帯×エリアの効果＋ノイズ）。"""
+    rng = np.random.default_rng(seed)
+    day_idx = np.sort(rng.integers(0, n_days, n_rows))
+    hour = rng.integers(0, 24, n_rows)
+    area = rng.integers(0, n_areas, n_rows)
+    dow = day_idx % 7
+    peak = np.exp(-((hour - 12) ** 2) / 8.0) + np.exp(-((hour - 19) ** 2) / 6.0)
+    area_eff = rng.normal(0, 150, n_areas)[area]
+    y = 1400 + 700 * peak + 120 * (dow >= 5) + area_eff + rng.normal(0, 200, n_rows)
+    avg = 1400 + area_eff + rng.normal(0, 30, n_rows)
+    lag = y + rng.normal(0, 250, n_rows)
+    cols = {"dow": dow, "hour": hour, "area_id": area, "is_holiday": (day_idx % 30 == 0),
+            "area_avg_28d": avg, "lag_7d": lag}
+    X = np.stack([np.asarray(cols[f], dtype=np.float32) for f in FEATURE_ORDER], axis=1)
+    w = rng.uniform(0.25, 1.0, n_rows)
+    return X, y, w, day_idx
+
+
+class Command(BaseCommand):
+    help = "Benchmark train_lgbm --search on a synthetic dataset: wall time and speedup vs worker count."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=200_000)
+        parser.add_argument("--folds", type=int, default=3)
+        parser.add_argument("--workers", default="", help="カンマ区切り（省略時 1,2,4,...,CPU数）")
+
+    def handle(self, *args, **opts):
+        X, y, w, day_idx = synthetic_dataset(opts["rows"])
+        cpus = os.cpu_count() or 1
+        if opts["workers"]:
+            counts = [int(c) for c in opts["workers"].split(",")]
+        else:
+            counts = sorted({1, cpus, *[2 ** i for i in range(1, 8) if 2 ** i < cpus]})
+        n_trials = len(search.expand_grid(search.DEFAULT_SPACE))
+        self.stdout.write(self.style.NOTICE(
+            f"[bench_lgbm_search] rows={len(y)} trials={n_trials} folds={opts['folds']} cpus={cpus}"))
+
+        base = None
+        for n in counts:
+            t0 = time.perf_counter()
+            results = search.run_search(X, y, w, day_idx, search.DEFAULT_SPACE,
+                                        n_folds=opts["folds"], workers=n)
+            wall = time.perf_counter() - t0
+            base = base or wall
+            best = results[0]
+            self.stdout.write(
+                f"workers={n:<3} wall={wall:.1f}s speedup={base / wall:.2f}x "
+                f"Σtrial={sum(r['wall_s'] for r in results):.1f}s best_mae={best['mae']:.1f} "
+                f"trees={best['n_estimators']}"
+            )
+        self.stdout.write(self.style.SUCCESS("Done."))
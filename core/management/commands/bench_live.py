@@ -0,0 +1,108 @@
+import datetime
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from core import live
+from core.areas import AREAS
+from core.models import DeliveryRecord, User, UserAiConsent
+
+
+def _record(rng, day, user=None, i=0):
+    start = rng.randint(9 * 60, 20 * 60)
+    dur = rng.randint(30, 180)
+    end = min(start + dur, 23 * 60 + 59)
+    slug = AREAS[i % len(AREAS)]["slug"]
+    # 渋谷だけ時給を高めにしてサージ判定が出ることも確認
+    rate = rng.gauss(2600 if slug == "shibuya" else 1700, 250)
+    return dict(
+        user=user, date=day, area_slug=slug,
+        start_time=datetime.time(start // 60, start % 60), end_time=datetime.time(end // 60, end % 60),
+        earnings=Decimal(f"{rate * (end - start) / 60:.2f}"), orders_completed=max(1, (end - start) // 20),
+        hours_worked=Decimal(f"{(end - start) / 60:.2f}"),
+    )
+
+
+class Command(BaseCommand):
+    help = "Benchmark core.live: in-memory update throughput, DB tail ingest, checkpoint and /api/live/overlay latency."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--records", type=int, default=20_000, help="当日分として投入する件数")
+        parser.add_argument("--updates", type=int, default=200_000, help="メモリ内更新の件数")
+        parser.add_argument("--requests", type=int, default=500)
+
+    def handle(self, *args, **opts):
+        rng = random.Random(0)
+        today = timezone.localdate()
+
+        # 1) メモリ内の更新（DB なし）
+        rows = [_record(rng, today, i=i) for i in range(min(opts["updates"], 50_000))]
+        stats = live.LiveStats()
+        t0 = time.perf_counter()
+        n = 0
+        while n < opts["updates"]:
+            for r in rows:
+                stats.observe_record(r)
+                n += 1
+                if n >= opts["updates"]:
+                    break
+        dt = time.perf_counter() - t0
+        self.stdout.write(f"observe_record  {n / dt:,.0f} records/s  ({stats.n_observed / dt:,.0f} slot updates/s)")
+
+        with transaction.atomic(), override_settings(DEBUG=False, ALLOWED_HOSTS=["*"]):
+            users = User.objects.bulk_create([User(username=f"bench_live_{i}") for i in range(opts["records"])])
+            UserAiConsent.objects.bulk_create([UserAiConsent(user=u) for u in users])
+            half = opts["records"] // 2
+            DeliveryRecord.objects.bulk_create(
+                [DeliveryRecord(**_record(rng, today, u, i)) for i, u in enumerate(users[:half])], batch_size=5000)
+
+            # 2) 起動時（チェックポイント無し）の当日分読み直し
+            live.reset()
+            t0 = time.perf_counter()
+            live.current_stats()
+            dt = time.perf_counter() - t0
+            self.stdout.write(f"bootstrap       {half:,} records in {dt * 1000:.0f} ms ({half / dt:,.0f} records/s)")
+
+            # 3) 新着のテール
+            DeliveryRecord.objects.bulk_create(
+                [DeliveryRecord(**_record(rng, today, u, i)) for i, u in enumerate(users[half:])], batch_size=5000)
+            live._state["tailed_at"] = 0.0
+            t0 = time.perf_counter()
+            live.current_stats()
+            dt = time.perf_counter() - t0
+            self.stdout.write(f"tail            {len(users) - half:,} records in {dt * 1000:.0f} ms "
+                              f"({(len(users) - half) / dt:,.0f} records/s)")
+
+            # 4) チェックポイント保存・復元
+            t0 = time.perf_counter()
+            live.checkpoint(force=True)
+            save_ms = (time.perf_counter() - t0) * 1000
+            size = len(live._state["stats"].to_bytes())
+            live.reset()
+            t0 = time.perf_counter()
+            live.current_stats()
+            self.stdout.write(f"checkpoint      {size:,} bytes, save {save_ms:.1f} ms, "
+                              f"restore+tail {(time.perf_counter() - t0) * 1000:.1f} ms")
+
+            # 5) API レイテンシ（テール間隔内はメモリのみ）
+            client = Client()
+            lat = []
+            for _ in range(opts["requests"]):
+                t0 = time.perf_counter()
+                resp = client.get("/api/live/overlay")
+                lat.append((time.perf_counter() - t0) * 1000)
+            lat.sort()
+            body = resp.json()
+            flagged = [f"{a['slug']}:{a['status']}" for a in body["areas"] if a["status"] in ("surge", "slump")]
+            self.stdout.write(
+                f"/api/live/overlay status={resp.status_code} p50={statistics.median(lat):.2f}ms "
+                f"p99={lat[int(len(lat) * 0.99) - 1]:.2f}ms  flagged={flagged or '-'}")
+            transaction.set_rollback(True)
+        live.reset()
+        self.stdout.write(self.style.SUCCESS("Done."))
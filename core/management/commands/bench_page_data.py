@@ -0,0 +1,59 @@
+import datetime
+import re
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from core.areas import AREAS
+from core.models import DeliveryRecord, User
+
+DN_DATA_RE = re.compile(r"window\.DN_DATA = (.*?);</script>", re.S)
+
+
+class Command(BaseCommand):
+    help = "Measure template render time and DN_DATA payload size per page (cold vs cached). Rolls back its data."
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="*", default=["/", "/map/", "/dashboard/", "/records/"])
+        parser.add_argument("--records", type=int, default=2000, help="ベンチ用ユーザーの記録数")
+        parser.add_argument("--repeat", type=int, default=50)
+
+    def handle(self, *args, **opts):
+        repeat = opts["repeat"]
+        today = timezone.localdate()
+        with transaction.atomic(), override_settings(DEBUG=False, ALLOWED_HOSTS=["*"]):
+            user = User.objects.create(username="bench_page_data")
+            DeliveryRecord.objects.bulk_create([
+                DeliveryRecord(user=user, date=today - datetime.timedelta(days=i),
+                               earnings=Decimal("4200"), hours_worked=Decimal("2.5"),
+                               start_time=datetime.time(11, 0), end_time=datetime.time(13, 30),
+                               area_slug=AREAS[i % len(AREAS)]["slug"], note="memo")
+                for i in range(opts["records"])
+            ])
+            client = Client()
+            client.force_login(user)
+            for path in opts["paths"]:
+                for alias in ("default", "shared"):  # core.singleflight の両方の層
+                    caches[alias].clear()
+                t0 = time.perf_counter()
+                resp = client.get(path)
+                cold = (time.perf_counter() - t0) * 1000
+                samples = []
+                for _ in range(repeat):
+                    t0 = time.perf_counter()
+                    resp = client.get(path)
+                    samples.append((time.perf_counter() - t0) * 1000)
+                m = DN_DATA_RE.search(resp.content.decode("utf-8"))
+                payload = len(m.group(1).encode("utf-8")) if m else 0
+                self.stdout.write(
+                    f"{path:<12} status={resp.status_code} cold={cold:.1f}ms "
+                    f"cached p50={statistics.median(samples):.2f}ms DN_DATA={payload}B"
+                )
+            transaction.set_rollback(True)
+        self.stdout.write(self.style.SUCCESS("Done."))
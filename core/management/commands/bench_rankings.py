@@ -0,0 +1,143 @@
+import bisect
+import datetime
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from django.utils import timezone
+
+from core import rankings, singleflight
+from core.areas import AREAS
+from core.calibration import RECORD_FIELDS, hourly_portions, record_fields
+from core.consent import with_ai_consent
+from core.models import DeliveryRecord, EarningsSketch, RankingDirty, User, UserAiConsent
+
+AREA_BASE = {a["slug"]: 1400 + 70 * i for i, a in enumerate(AREAS)}
+
+
+def _record(rng, user, day, bias):
+    slug = rng.choice(AREAS)["slug"]
+    start = rng.randint(7 * 60, 21 * 60)
+    end = min(start + rng.choice([60, 90, 120, 180, 240]), 23 * 60 + 30)
+    rate = AREA_BASE[slug] + bias + (250 if start >= 17 * 60 else 0) + (150 if day.weekday() >= 5 else 0)
+    rate = max(400, rng.lognormvariate(0, 0.25) * rate)
+    hours = (end - start) / 60
+    return DeliveryRecord(user=user, date=day, area_slug=slug,
+                          start_time=datetime.time(start // 60, start % 60), end_time=datetime.time(end // 60, end % 60),
+                          hours_worked=Decimal(f"{hours:.2f}"), earnings=Decimal(f"{rate * hours:.0f}"),
+                          orders_completed=max(1, round(hours * 2)))
+
+
+def _p(vals, q):
+    vals = sorted(vals)
+    return vals[min(len(vals) - 1, int(len(vals) * q))]
+
+
+def _exact_points(group):
+    """リクエストごとに全記録を並べ替える素朴な方法（比較用）。[(円/h, 時間)] を昇順で。"""
+    qs = with_ai_consent(DeliveryRecord.objects.filter(area_slug__in=group[0])).values(*RECORD_FIELDS)
+    return sorted((yen, w) for r in qs for h, w, yen in hourly_portions(r)
+                  if rankings._in_group(group, rankings.bucket_of(r, h)))
+
+
+def _cdf_errors(points, td):
+    """厳密な加重分位点（1..99%）での CDF の誤差（%ポイント）。"""
+    xs, cum, acc = [], [], 0.0
+    for x, w in points:
+        xs.append(x)
+        cum.append(acc + w / 2)
+        acc += w
+    errs = []
+    for q in range(1, 100):
+        i = min(len(xs) - 1, bisect.bisect_left(cum, q / 100 * acc))
+        errs.append(abs(td.cdf(xs[i]) - cum[i] / acc) * 100)
+    return errs
+
+
+class Command(BaseCommand):
+    help = ("Benchmark earnings quantile sketches: bytes per bucket, save-path and batched build cost, "
+            "accuracy and latency vs exact percentiles.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--days", type=int, default=60, help="ユーザーごとの記録数（1日1件）")
+        parser.add_argument("--consent", type=float, default=0.8, help="同意ユーザーの割合")
+        parser.add_argument("--updates", type=int, default=300)
+
+    def handle(self, *args, **opts):
+        rng = random.Random(0)
+        today = timezone.localdate()
+        with transaction.atomic(), override_settings(DEBUG=False):
+            users = User.objects.bulk_create([User(username=f"bench_rank_{i}") for i in range(opts["users"])])
+            UserAiConsent.objects.bulk_create([UserAiConsent(user=u, share_aggregated=rng.random() < opts["consent"])
+                                               for u in users])
+            bias = {u.pk: rng.gauss(0, 200) for u in users}
+            DeliveryRecord.objects.bulk_create(
+                [_record(rng, u, today - datetime.timedelta(days=d + 1), bias[u.pk])
+                 for u in users for d in range(opts["days"])], batch_size=5000)
+
+            t0 = time.perf_counter()
+            n = rankings.rebuild()
+            dt = time.perf_counter() - t0
+            sizes = [len(p) for p in EarningsSketch.objects.values_list("payload", flat=True)]
+            self.stdout.write(self.style.NOTICE(
+                f"[rebuild] {len(users) * opts['days']:,} records → {n} buckets in {dt:.1f}s; "
+                f"payload mean {statistics.fmean(sizes):.0f} B, max {max(sizes)} B, total {sum(sizes) / 1024:.0f} KB"))
+
+            # 1) 精度：バケット単体とマージしたまとまり
+            bucket_errs = []
+            for row in EarningsSketch.objects.filter(hours__gte=50):
+                group = ((row.area_slug,), (row.dow,), (row.band,))
+                bucket_errs += _cdf_errors(_exact_points(group), rankings.merged(group))
+            self.stdout.write(f"[accuracy] single buckets (>=50h): CDF error mean {statistics.fmean(bucket_errs):.2f} "
+                              f"p99 {_p(bucket_errs, .99):.2f} max {max(bucket_errs):.2f} pct-points")
+            groups = [("all", "all", "all"), (AREAS[0]["slug"], "weekday", "evening"),
+                      ("all", "weekend", "all"), ("all", "all", "lunch")]
+            for spec in groups:
+                group = rankings.parse_group(*spec)
+                t0 = time.perf_counter()
+                td = rankings.merged(group)
+                merge_ms = (time.perf_counter() - t0) * 1000
+                t0 = time.perf_counter()
+                pts = _exact_points(group)
+                exact_ms = (time.perf_counter() - t0) * 1000
+                errs = _cdf_errors(pts, td)
+                self.stdout.write(f"[accuracy] {'/'.join(spec):<28} {len(pts):>7,} samples, {len(td):>3} centroids: "
+                                  f"CDF error mean {statistics.fmean(errs):.2f} max {max(errs):.2f} pct-points; "
+                                  f"exact sort {exact_ms:.0f}ms vs merge {merge_ms:.1f}ms")
+
+            # 2) リクエスト時：キャッシュ済みのまとまりで順位を出す
+            group = rankings.parse_group("all", "weekday", "evening")
+            rankings.ranking(group, 1800)
+            loops = 20_000
+            t0 = time.perf_counter()
+            for i in range(loops):
+                rankings.ranking(group, 1200 + i % 1500)
+            self.stdout.write(f"[request] ranking() cached: {(time.perf_counter() - t0) / loops * 1e6:.1f} µs/call; "
+                              f"singleflight {singleflight.stats}")
+
+            # 3) 保存1件ごと：サンプルの差し替えと作り直し待ちの追記だけ（共有行のロック・再エンコードなし）
+            consenting = [u for u in users if UserAiConsent.objects.filter(user=u, share_aggregated=True).exists()]
+            save_ms, sample_ms = [], []
+            for u in consenting[:opts["updates"]]:
+                rec = _record(rng, u, today, bias[u.pk])
+                t0 = time.perf_counter()
+                rec.save()
+                save_ms.append((time.perf_counter() - t0) * 1000)
+                t0 = time.perf_counter()
+                rankings.record_changed(record_fields(rec))  # 編集相当
+                sample_ms.append((time.perf_counter() - t0) * 1000)
+            self.stdout.write(f"[update] save()+signals p50={statistics.median(save_ms):.2f}ms p99={_p(save_ms, .99):.2f}ms; "
+                              f"sample replace alone p50={statistics.median(sample_ms):.2f}ms "
+                              f"p99={_p(sample_ms, .99):.2f}ms")
+            pending = RankingDirty.objects.count()
+            t0 = time.perf_counter()
+            n = rankings.build()
+            self.stdout.write(f"[build] {pending:,} pending marks → {n} buckets rebuilt in "
+                              f"{(time.perf_counter() - t0) * 1000:.0f}ms (build_rankings, off the request path)")
+            transaction.set_rollback(True)
+        self.stdout.write(self.style.SUCCESS("Done."))
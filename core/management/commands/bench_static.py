@@ -0,0 +1,51 @@
+import re
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+ASSET_RE = re.compile(r'<(?:script[^>]*\ssrc|link[^>]*\shref)="([^"]+\.(?:js|css))"')
+
+
+def _body_len(resp):
+    if getattr(resp, "streaming", False):
+        return sum(len(c) for c in resp.streaming_content)
+    return len(resp.content)
+
+
+class Command(BaseCommand):
+    help = "Measure first / repeat page-load bytes and request counts (HTML + JS/CSS) for pages. Run collectstatic first."
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="*", default=["/", "/map/"])
+        parser.add_argument("--encoding", default="br, gzip", help="Accept-Encoding")
+
+    def handle(self, *args, **opts):
+        enc = opts["encoding"]
+        # WhiteNoise は DEBUG=False のとき STATIC_ROOT（collectstatic 済み）から配信する
+        with override_settings(DEBUG=False, ALLOWED_HOSTS=["*"]):
+            client = Client()
+            for path in opts["paths"]:
+                resp = client.get(path, HTTP_ACCEPT_ENCODING=enc)
+                html = resp.content.decode("utf-8", "replace")
+                first_bytes, first_reqs = len(resp.content), 1
+                repeat_bytes, repeat_reqs = len(resp.content), 1
+                external = 0
+                for url in dict.fromkeys(ASSET_RE.findall(html)):
+                    if not url.startswith(settings.STATIC_URL):
+                        external += 1
+                        first_reqs += 1
+                        repeat_reqs += 1  # 別オリジンは接続＋再検証が必要
+                        continue
+                    r = client.get(url, HTTP_ACCEPT_ENCODING=enc)
+                    n = _body_len(r)
+                    cc = r.get("Cache-Control", "")
+                    first_bytes += n
+                    first_reqs += 1
+                    if "immutable" not in cc:
+                        repeat_reqs += 1  # 条件付きGET（304想定、本文0）
+                    self.stdout.write(f"    {r.status_code} {url} {n}B enc={r.get('Content-Encoding', '-')} cc='{cc}'")
+                self.stdout.write(self.style.SUCCESS(
+                    f"{path}: first={first_bytes}B/{first_reqs}req repeat={repeat_bytes}B/{repeat_reqs}req "
+                    f"(external assets={external}, bytes not counted)"
+                ))
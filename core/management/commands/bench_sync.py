@@ -0,0 +1,117 @@
+import datetime
+import gzip
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client, override_settings
+
+from core.loadtest import synthetic
+from core.models import DeliveryRecord, EntranceInfo, OcrImport, User
+from core.serializers import DeliveryRecordSerializer, EntranceInfoSerializer
+
+PREFIX = "bench_sync_"
+
+
+def _p(vals, q):
+    vals = sorted(vals)
+    return vals[min(len(vals) - 1, int(len(vals) * q))]
+
+
+class Command(BaseCommand):
+    help = "Benchmark /api/sync: payload bytes and server time of typical delta resyncs vs full reloads."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--days", type=int, default=90)
+        parser.add_argument("--sample", type=int, default=50, help="計測するユーザー数")
+
+    def _get(self, client, params):
+        t0 = time.perf_counter()
+        resp = client.get("/api/sync", params)
+        return resp, (time.perf_counter() - t0) * 1000
+
+    def _full_sync(self, client):
+        """トークン無しから more が false になるまで。(最後の token, 合計バイト, 合計 gzip バイト, 合計 ms, ページ数)"""
+        token, size, gz, ms, pages = "", 0, 0, 0.0, 0
+        while True:
+            resp, dt = self._get(client, {"since": token} if token else {})
+            body = resp.content
+            size, gz, ms, pages = size + len(body), gz + len(gzip.compress(body)), ms + dt, pages + 1
+            data = json.loads(body)
+            token = data["token"]
+            if not data["more"]:
+                return token, size, gz, ms, pages
+
+    def _report(self, label, sizes, gzs, times, extra=""):
+        self.stdout.write(f"[{label:<22}] bytes p50={statistics.median(sizes):>9,.0f} (gzip {statistics.median(gzs):>8,.0f})  "
+                          f"server p50={statistics.median(times):7.2f}ms p95={_p(times, .95):7.2f}ms{extra}")
+
+    def handle(self, *args, **opts):
+        with transaction.atomic(), override_settings(DEBUG=False, ALLOWED_HOSTS=["*"]):
+            counts = synthetic.generate(opts["users"], days=opts["days"], prefix=PREFIX)
+            self.stdout.write(self.style.NOTICE(
+                f"[data] {counts['users']:,} users, {counts['records']:,} records, "
+                f"{counts['entrances']:,} entrances, {counts['ocr_imports']:,} ocr imports"))
+            users = list(User.objects.filter(username__startswith=PREFIX).order_by("id")[:opts["sample"]])
+            client = Client()
+            res = {k: ([], [], []) for k in ("rest", "full", "idle", "typical", "delete")}
+
+            def add(key, body, ms):
+                res[key][0].append(len(body))
+                res[key][1].append(len(gzip.compress(body)))
+                res[key][2].append(ms)
+
+            pages = []
+            for u in users:
+                client.force_login(u)
+                # 比較用：行オブジェクトの JSON で全件（差分の無い素朴な再読み込み）
+                t0 = time.perf_counter()
+                body = json.dumps({
+                    "records": DeliveryRecordSerializer(DeliveryRecord.objects.filter(user=u), many=True).data,
+                    "entrances": EntranceInfoSerializer(EntranceInfo.objects.filter(user=u), many=True).data,
+                    "ocr": list(OcrImport.objects.filter(user=u).values("id", "status", "message", "created_record_id",
+                                                                      "created_at")),
+                }, ensure_ascii=False, default=str).encode()
+                add("rest", body, (time.perf_counter() - t0) * 1000)
+
+                token, size, gz, ms, n = self._full_sync(client)
+                res["full"][0].append(size)
+                res["full"][1].append(gz)
+                res["full"][2].append(ms)
+                pages.append(n)
+
+                resp, ms = self._get(client, {"since": token})
+                add("idle", resp.content, ms)
+                token = resp.json()["token"]
+
+                # 典型的な再同期：新しい記録1件・既存の記録の編集1件・OCR 状態の変化1件
+                last = DeliveryRecord.objects.filter(user=u).order_by("-date").first()
+                day = (last.date if last else datetime.date.today()) + datetime.timedelta(days=1)
+                DeliveryRecord.objects.create(user=u, date=day, earnings=4200, hours_worked=3, area_slug="shibuya")
+                if last:
+                    last.note = (last.note or "") + " 追記"
+                    last.save(update_fields=["note"])
+                ocr = OcrImport.objects.filter(user=u).first()
+                if ocr:
+                    ocr.status, ocr.message = "failed", "再読取り"
+                    ocr.save(update_fields=["status", "message"])
+                resp, ms = self._get(client, {"since": token})
+                add("typical", resp.content, ms)
+                token = resp.json()["token"]
+
+                DeliveryRecord.objects.filter(user=u).order_by("date").first().delete()
+                resp, ms = self._get(client, {"since": token})
+                add("delete", resp.content, ms)
+
+            self._report("full reload (rows)", *res["rest"], "  (serializer dicts, no HTTP)")
+            self._report("full sync (compact)", *res["full"], f"  ({statistics.median(pages):.0f} pages of 500)")
+            self._report("resync: no change", *res["idle"])
+            self._report("resync: 1 new+2 edits", *res["typical"])
+            self._report("resync: 1 delete", *res["delete"])
+            full, typ = statistics.median(res["full"][0]), statistics.median(res["typical"][0])
+            self.stdout.write(self.style.NOTICE(f"[summary] typical resync is {full / typ:.0f}x smaller than a full sync"))
+            transaction.set_rollback(True)
+        self.stdout.write(self.style.SUCCESS("Done."))
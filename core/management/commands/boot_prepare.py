@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import time
+
+from django.conf import settings
+from django.contrib.staticfiles.finders import get_finders
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.recorder import MigrationRecorder
+from django.utils import timezone
+
+STAMP_NAME = ".build_stamp.json"
+
+
+def stamp_path() -> str:
+    # STATIC_ROOT に置くと WhiteNoise が配信してしまうのでプロジェクト直下
+    return os.path.join(settings.BASE_DIR, STAMP_NAME)
+
+
+def static_fingerprint() -> str:
+    """collectstatic の入力（ソースの静的ファイル＋ストレージ設定）のハッシュ。"""
+    h = hashlib.sha256()
+    h.update(settings.STORAGES["staticfiles"]["BACKEND"].encode())
+    h.update(settings.STATIC_URL.encode())
+    files = []
+    for finder in get_finders():
+        for path, storage in finder.list(["CVS", ".*", "*~"]):
+            files.append((path, storage.path(path)))
+    for path, full in sorted(files):
+        h.update(path.encode())
+        with open(full, "rb") as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+
+def disk_migrations() -> list:
+    loader = MigrationLoader(None, ignore_no_migrations=True)
+    return sorted([app, name] for app, name in loader.disk_migrations)
+
+
+def read_stamp() -> dict:
+    try:
+        with open(stamp_path(), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class Command(BaseCommand):
+    help = (
+        "Run collectstatic / migrate only when needed. "
+        "--build (at image build time) collects static files and writes a stamp; "
+        "at container start both steps are skipped when the stamp shows nothing changed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--build", action="store_true", help="ビルド時：collectstatic してスタンプを書く（DB には触らない）")
+        parser.add_argument("--force", action="store_true", help="スタンプを無視して collectstatic / migrate を実行")
+
+    def _step(self, label, fn):
+        t0 = time.perf_counter()
+        result = fn()
+        self.stdout.write(f"[boot_prepare] {label} ({(time.perf_counter() - t0) * 1000:.0f} ms)")
+        return result
+
+    def handle(self, *args, **opts):
+        t0 = time.perf_counter()
+        stamp = read_stamp()
+        before = dict(stamp)
+        fingerprint = self._step("static fingerprint", static_fingerprint)
+
+        collected = os.path.isdir(settings.STATIC_ROOT) and bool(os.listdir(settings.STATIC_ROOT))
+        if opts["force"] or opts["build"] or not collected or stamp.get("static") != fingerprint:
+            self._step("collectstatic", lambda: call_command("collectstatic", interactive=False, verbosity=0))
+            stamp["static"] = fingerprint
+            stamp["collected_at"] = timezone.now().isoformat()
+        else:
+            self.stdout.write("[boot_prepare] static files unchanged → skip collectstatic")
+
+        if opts["build"]:
+            stamp["migrations"] = disk_migrations()
+            self._write_stamp(stamp)
+            self.stdout.write(self.style.SUCCESS(f"Build stamp written to {stamp_path()}"))
+            return
+
+        if stamp != before:
+            self._write_stamp(stamp)
+        self._migrate_if_needed(stamp, opts["force"])
+        if any(c["BACKEND"].endswith("DatabaseCache") for c in settings.CACHES.values()):
+            # DN_SHARED_CACHE=db のときだけ。既にあれば何もしない
+            self._step("createcachetable", lambda: call_command("createcachetable", verbosity=0))
+        self.stdout.write(self.style.SUCCESS(f"Done in {(time.perf_counter() - t0) * 1000:.0f} ms."))
+
+    def _migrate_if_needed(self, stamp, force):
+        # スタンプのマイグレーション一覧が全て適用済みなら、グラフの読み込みも含めて丸ごと省略
+        wanted = {tuple(m) for m in stamp.get("migrations") or disk_migrations()}
+        try:
+            applied = set(MigrationRecorder(connection).applied_migrations())
+        except DatabaseError:
+            applied = set()  # django_migrations がまだ無い
+        pending = wanted - applied
+        if not force and not pending:
+            self.stdout.write("[boot_prepare] all migrations applied → skip migrate")
+            return
+        self.stdout.write(f"[boot_prepare] {len(pending)} unapplied migration(s)")
+        try:
+            self._step("migrate", lambda: call_command("migrate", interactive=False, verbosity=1))
+        except Exception as e:
+            # entrypoint の `migrate || true` と同じく、失敗しても起動は続ける
+            self.stderr.write(self.style.WARNING(f"migrate failed: {e}"))
+
+    def _write_stamp(self, stamp):
+        try:
+            tmp = stamp_path() + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(stamp, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, stamp_path())
+        except OSError as e:
+            # 読み取り専用の /app など。次回も collectstatic が走るだけ
+            self.stderr.write(self.style.WARNING(f"could not write stamp: {e}"))
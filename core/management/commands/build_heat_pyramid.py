@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import heat
+from core.models import HeatCell
+
+
+class Command(BaseCommand):
+    help = "Incrementally aggregate DeliveryRecord / EntranceInfo into the heatmap grid pyramid (core.heat)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rebuild", action="store_true", help="全セルを捨てて最初から作り直す（編集・削除の反映）")
+        parser.add_argument("--batch", type=int, default=heat.BATCH)
+
+    def handle(self, *args, **opts):
+        t0 = time.perf_counter()
+        log = lambda m: self.stdout.write(m)
+        if opts["rebuild"]:
+            n = heat.rebuild(opts["batch"], log)
+        else:
+            n = heat.build(opts["batch"], log)
+        self.stdout.write(self.style.NOTICE(
+            f"[build_heat_pyramid] {n:,} rows in {time.perf_counter() - t0:.1f}s, "
+            f"{HeatCell.objects.count():,} cells, generation {heat.generation()}"))
+        self.stdout.write(self.style.SUCCESS("Done."))
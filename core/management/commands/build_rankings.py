@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import rankings
+from core.models import RankingDirty
+
+
+class Command(BaseCommand):
+    help = "Rebuild the earnings quantile sketches (core.rankings) whose samples changed since the last run."
+
+    def handle(self, *args, **opts):
+        t0 = time.perf_counter()
+        n = rankings.build(log=lambda m: self.stdout.write(m))
+        self.stdout.write(self.style.NOTICE(
+            f"[build_rankings] {n:,} buckets in {time.perf_counter() - t0:.1f}s, "
+            f"{RankingDirty.objects.count():,} pending"))
+        self.stdout.write(self.style.SUCCESS("Done."))
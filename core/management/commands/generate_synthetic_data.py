@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.loadtest import synthetic
+
+
+class Command(BaseCommand):
+    help = "Generate synthetic users, DeliveryRecords, EntranceInfos and OcrImports for load testing."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000, help="作成するユーザー数")
+        parser.add_argument("--days", type=int, default=90, help="何日分の記録を作るか")
+        parser.add_argument("--active_ratio", type=float, default=0.4, help="1日あたり稼働するユーザーの割合")
+        parser.add_argument("--entrances_per_user", type=float, default=2.0, help="ユーザーあたりの入口情報（平均）")
+        parser.add_argument("--ocr_ratio", type=float, default=0.1, help="OCR 取り込み履歴を付ける記録の割合")
+        parser.add_argument("--prefix", default="lt_", help="合成ユーザー名の接頭辞")
+        parser.add_argument("--password", default="loadtest-pass", help="合成ユーザー共通のパスワード")
+        parser.add_argument("--seed", type=int, default=0, help="乱数シード")
+        parser.add_argument("--flush", action="store_true", help="先に同じ接頭辞の合成データを削除")
+
+    def handle(self, *args, **opts):
+        if opts["flush"]:
+            n = synthetic.flush(opts["prefix"])
+            self.stdout.write(self.style.WARNING(f"flushed {n} rows (prefix={opts['prefix']!r})"))
+        t0 = time.perf_counter()
+        counts = synthetic.generate(
+            opts["users"], days=opts["days"], active_ratio=opts["active_ratio"],
+            entrances_per_user=opts["entrances_per_user"], ocr_ratio=opts["ocr_ratio"],
+            prefix=opts["prefix"], password=opts["password"], seed=opts["seed"],
+            log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {counts} in {time.perf_counter() - t0:.1f}s"))
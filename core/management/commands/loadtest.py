@@ -0,0 +1,122 @@
+import datetime
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.loadtest import driver
+
+
+def _wait_ready(url: str, timeout: float):
+    t_end = time.monotonic() + timeout
+    while time.monotonic() < t_end:
+        try:
+            with urllib.request.urlopen(url, timeout=2) as r:
+                if r.status == 200:
+                    return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a weighted mix of page views, API reads and POSTs against a server with several processes "
+        "and write throughput, p50/p95/p99 latency and DB query counts per endpoint to a JSON report."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="", help="対象サーバー（省略時は --server でローカルに起動）")
+        parser.add_argument("--server", choices=["gunicorn", "runserver"], default="gunicorn",
+                            help="ローカル起動するサーバー（gunicorn が無ければ runserver）")
+        parser.add_argument("--port", type=int, default=8099)
+        parser.add_argument("--server_workers", type=int, default=3, help="gunicorn のワーカー数")
+        parser.add_argument("--processes", type=int, default=4, help="負荷をかけるプロセス数")
+        parser.add_argument("--duration", type=float, default=30.0, help="計測秒数")
+        parser.add_argument("--warmup", type=float, default=3.0, help="計測前のウォームアップ秒数")
+        parser.add_argument("--mix", default=None, help="シナリオ JSON（省略時は driver.DEFAULT_MIX）")
+        parser.add_argument("--prefix", default="lt_", help="ログインに使う合成ユーザーの接頭辞")
+        parser.add_argument("--password", default="loadtest-pass")
+        parser.add_argument("--out", default="loadtest_report.json", help="レポートの出力先（JSON）")
+        parser.add_argument("--compare", default=None, help="比較する過去のレポート")
+
+    def _start_server(self, opts):
+        env = {**os.environ, "DN_QUERY_COUNT_HEADER": "1", "DEBUG": os.environ.get("DEBUG", "False")}
+        bind = f"127.0.0.1:{opts['port']}"
+        use_gunicorn = opts["server"] == "gunicorn"
+        if use_gunicorn:
+            try:
+                import gunicorn  # noqa: F401
+            except ImportError:
+                self.stdout.write(self.style.WARNING("gunicorn が無いので runserver で起動します"))
+                use_gunicorn = False
+        if use_gunicorn:
+            cmd = [sys.executable, "-m", "gunicorn", "config.wsgi:application", "--bind", bind,
+                   "--workers", str(opts["server_workers"]), "--timeout", "120"]
+        else:
+            cmd = [sys.executable, "manage.py", "runserver", bind, "--noreload"]
+        proc = subprocess.Popen(cmd, env=env, cwd=settings.BASE_DIR,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return proc, f"http://{bind}", " ".join(cmd[2:] if use_gunicorn else cmd[1:3])
+
+    def handle(self, *args, **opts):
+        from core.models import User
+
+        usernames = list(User.objects.filter(username__startswith=opts["prefix"])
+                         .order_by("id").values_list("username", flat=True)[:max(1, opts["processes"])])
+        if not usernames:
+            raise CommandError(f"合成ユーザー（{opts['prefix']}*）がありません。先に generate_synthetic_data を実行してください")
+        mix = driver.load_mix(opts["mix"])
+
+        proc, server = None, opts["url"]
+        if not server:
+            proc, server, server_desc = self._start_server(opts)
+        else:
+            server_desc = "external"
+        try:
+            if not _wait_ready(server + "/healthz", 30):
+                raise CommandError(f"{server} が起動しませんでした")
+            self.stdout.write(self.style.NOTICE(
+                f"[loadtest] {server} ({server_desc}) processes={opts['processes']} "
+                f"duration={opts['duration']}s warmup={opts['warmup']}s"))
+            started = datetime.datetime.now(datetime.timezone.utc)
+            result = driver.run(server, mix, opts["processes"], opts["duration"], opts["warmup"],
+                                usernames, opts["password"])
+        finally:
+            if proc is not None:
+                proc.terminate()
+                proc.wait(timeout=10)
+
+        report = {
+            "revision": driver.git_revision(str(settings.BASE_DIR)),
+            "started_at": started.isoformat(timespec="seconds"),
+            "server": server_desc,
+            "database": settings.DATABASES["default"]["ENGINE"].rsplit(".", 1)[-1],
+            "processes": opts["processes"], "duration_s": opts["duration"], "warmup_s": opts["warmup"],
+            "mix": mix,
+            **result,
+        }
+        with open(opts["out"], "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+        t = result["total"]
+        self.stdout.write(f"{'endpoint':<24} {'n':>6} {'err':>4} {'rps':>7} {'p50':>7} {'p95':>7} {'p99':>7} {'queries':>7}")
+        for name, e in result["endpoints"].items():
+            lat, q = e["latency_ms"], e["db_queries"]
+            self.stdout.write(
+                f"{name:<24} {e['count']:>6} {e['errors']:>4} {e['rps']:>7.1f} {lat['p50']:>7.1f} "
+                f"{lat['p95']:>7.1f} {lat['p99']:>7.1f} {q['mean'] if q else float('nan'):>7.1f}")
+        self.stdout.write(f"{'TOTAL':<24} {t['count']:>6} {t['errors']:>4} {t['rps']:>7.1f} "
+                          f"{t['latency_ms']['p50']:>7.1f} {t['latency_ms']['p95']:>7.1f} {t['latency_ms']['p99']:>7.1f}")
+        if opts["compare"]:
+            with open(opts["compare"], encoding="utf-8") as f:
+                old = json.load(f)
+            self.stdout.write(self.style.NOTICE(f"vs {opts['compare']} (revision {old.get('revision')})"))
+            for line in driver.compare(old, result):
+                self.stdout.write(line)
+        self.stdout.write(self.style.SUCCESS(f"Report written to {opts['out']}"))
@@ -0,0 +1,119 @@
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+# 新しいプロセスで「ワーカー1つ分の起動 → 最初のリクエスト」を計測する。
+# 計測側（このコマンド）は既に Django を読み込んでいるので、必ず別プロセスで実行する。
+BOOT_SCRIPT = r"""
+import json, sys, time
+t0 = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+t_setup = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+t_urls = time.perf_counter()
+
+status = {}
+def start_response(s, headers, exc_info=None):
+    status["code"] = int(s.split()[0])
+
+def request(path):
+    environ = {
+        "REQUEST_METHOD": "GET", "PATH_INFO": path, "QUERY_STRING": "", "SERVER_NAME": sys.argv[2],
+        "SERVER_PORT": "80", "HTTP_HOST": sys.argv[2], "wsgi.url_scheme": "http",
+        "wsgi.input": __import__("io").BytesIO(), "wsgi.errors": sys.stderr,
+        "wsgi.multithread": False, "wsgi.multiprocess": True, "wsgi.run_once": False,
+    }
+    t = time.perf_counter()
+    body = b"".join(application(environ, start_response))
+    return status["code"], (time.perf_counter() - t) * 1000, len(body)
+
+code, first_ms, size = request(sys.argv[1])
+t_first = time.perf_counter()
+_, second_ms, _ = request(sys.argv[1])
+print("BOOT_RESULT " + json.dumps({
+    "setup_ms": (t_setup - t0) * 1000, "urlconf_ms": (t_urls - t_setup) * 1000,
+    "first_request_ms": first_ms, "second_request_ms": second_ms,
+    "first_200_ms": (t_first - t0) * 1000,
+    "status": code, "bytes": size, "modules": len(sys.modules),
+    "heavy": sorted(m for m in ("numpy", "onnxruntime", "pandas", "pyarrow", "PIL", "pytesseract") if m in sys.modules),
+}))
+"""
+
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def parse_importtime(stderr: str):
+    """-X importtime の出力 → [(module, self_us, cumulative_us, depth)]"""
+    rows = []
+    for line in stderr.splitlines():
+        m = IMPORTTIME_RE.match(line)
+        if m:
+            rows.append((m.group(4), int(m.group(1)), int(m.group(2)), (len(m.group(3)) - 1) // 2))
+    return rows
+
+
+class Command(BaseCommand):
+    help = "Profile worker boot: -X importtime breakdown by package, django.setup() and time to first 200."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", default="/", help="最初に叩く URL パス（デフォ /）")
+        parser.add_argument("--host", default="localhost", help="Host ヘッダ（ALLOWED_HOSTS に合わせる）")
+        parser.add_argument("--top", type=int, default=15, help="表示する上位件数")
+        parser.add_argument("--runs", type=int, default=3, help="計測回数（中央値を表示）")
+        parser.add_argument("--json", action="store_true", help="結果を JSON で出力")
+
+    def _run_once(self, path, host):
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "config.settings")}
+        env.pop("PYTHONDONTWRITEBYTECODE", None)
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", BOOT_SCRIPT, path, host],
+            capture_output=True, text=True, env=env, cwd=os.getcwd(),
+        )
+        line = next((ln for ln in proc.stdout.splitlines() if ln.startswith("BOOT_RESULT ")), None)
+        if line is None:
+            raise CommandError(f"boot failed:\n{proc.stderr[-2000:]}")
+        return json.loads(line[len("BOOT_RESULT "):]), parse_importtime(proc.stderr)
+
+    def handle(self, *args, **opts):
+        runs = [self._run_once(opts["path"], opts["host"]) for _ in range(max(1, opts["runs"]))]
+        # 2回目以降は .pyc が温まっているので中央値を採用
+        runs.sort(key=lambda r: r[0]["first_200_ms"])
+        result, imports = runs[len(runs) // 2]
+
+        by_package = defaultdict(int)
+        for mod, self_us, _, _ in imports:
+            by_package[mod.split(".")[0]] += self_us
+        total_us = sum(by_package.values())
+        top_packages = sorted(by_package.items(), key=lambda kv: -kv[1])[:opts["top"]]
+        top_modules = sorted(imports, key=lambda r: -r[2])[:opts["top"]]
+
+        if opts["json"]:
+            self.stdout.write(json.dumps({
+                **result, "import_total_ms": total_us / 1000,
+                "packages": [{"package": p, "self_ms": us / 1000} for p, us in top_packages],
+                "modules": [{"module": m, "cumulative_ms": c / 1000} for m, _, c, _ in top_modules],
+            }, ensure_ascii=False, indent=2))
+            return
+
+        self.stdout.write(self.style.NOTICE(
+            f"[profile_boot] {opts['path']} status={result['status']} modules={result['modules']}"))
+        self.stdout.write(f"  django.setup()     {result['setup_ms']:8.1f} ms")
+        self.stdout.write(f"  urlconf            {result['urlconf_ms']:8.1f} ms")
+        self.stdout.write(f"  first request      {result['first_request_ms']:8.1f} ms")
+        self.stdout.write(f"  second request     {result['second_request_ms']:8.1f} ms")
+        self.stdout.write(f"  boot → first 200   {result['first_200_ms']:8.1f} ms")
+        self.stdout.write(f"  imports (self Σ)   {total_us / 1000:8.1f} ms")
+        self.stdout.write(f"  heavy modules loaded: {', '.join(result['heavy']) or '-'}")
+        self.stdout.write(self.style.NOTICE("self time by package:"))
+        for pkg, us in top_packages:
+            self.stdout.write(f"  {us / 1000:8.1f} ms  {pkg}")
+        self.stdout.write(self.style.NOTICE("cumulative by module:"))
+        for mod, _, cum, depth in top_modules:
+            self.stdout.write(f"  {cum / 1000:8.1f} ms  {'  ' * depth}{mod}")
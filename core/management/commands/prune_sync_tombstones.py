@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core import sync
+
+
+class Command(BaseCommand):
+    help = "Delete old delta-sync tombstones (core.sync). Clients holding older tokens get a full reset."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=sync.TOMBSTONE_DAYS, help="これより古い tombstone を消す")
+
+    def handle(self, *args, **opts):
+        n = sync.prune_tombstones(opts["days"])
+        self.stdout.write(self.style.SUCCESS(f"Done. {n:,} tombstones pruned."))
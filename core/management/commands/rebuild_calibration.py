@@ -0,0 +1,22 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core import calibration
+
+
+class Command(BaseCommand):
+    help = "Rebuild per-user forecast calibration (core.calibration) from stored DeliveryRecords."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=0, help="直近何日分の記録から作るか（0 = 全期間）")
+        parser.add_argument("--user", type=int, action="append", help="対象ユーザー id（複数指定可、省略で全員）")
+        parser.add_argument("--if_model_changed", action="store_true",
+                            help="いまの共有予測と違う版で作ったユーザーだけ（モデル差し替え後の定期ジョブ用）")
+
+    def handle(self, *args, **opts):
+        since = timezone.localdate() - datetime.timedelta(days=opts["days"]) if opts["days"] else None
+        n = calibration.rebuild(opts["user"], since, log=lambda m: self.stdout.write(m),
+                                stale_only=opts["if_model_changed"])
+        self.stdout.write(self.style.SUCCESS(f"Done. {n:,} users calibrated."))
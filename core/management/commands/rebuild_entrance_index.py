@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from core import entrance_search
+from core.models import EntranceInfo
+
+
+class Command(BaseCommand):
+    help = "Recompute EntranceInfo search keys and (re)create the full-text / trigram index."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--keys", action="store_true", help="address_key / search_text も全件作り直す（正規化ルール変更時）")
+        parser.add_argument("--batch", type=int, default=2000)
+
+    def handle(self, *args, **opts):
+        if opts["keys"]:
+            n, last = 0, 0
+            qs = EntranceInfo.objects.order_by("id").only("id", "address", "note")
+            while True:
+                rows = list(qs.filter(id__gt=last)[:opts["batch"]])
+                if not rows:
+                    break
+                for r in rows:
+                    r.refresh_search_keys()
+                EntranceInfo.objects.bulk_update(rows, ["address_key", "search_text"])
+                n += len(rows)
+                last = rows[-1].id
+            self.stdout.write(self.style.NOTICE(f"[rebuild_entrance_index] keys recomputed: {n:,}"))
+        entrance_search.install_index()
+        self.stdout.write(self.style.SUCCESS(f"Done. backend={entrance_search.backend()}"))
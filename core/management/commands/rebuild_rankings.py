@@ -0,0 +1,16 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import rankings
+
+
+class Command(BaseCommand):
+    help = ("Rebuild per-record earnings samples and every quantile sketch (core.rankings) from DeliveryRecords "
+            "(use after bulk imports; day-to-day changes are applied by build_rankings).")
+
+    def handle(self, *args, **opts):
+        t0 = time.perf_counter()
+        n = rankings.rebuild(log=lambda m: self.stdout.write(m))
+        self.stdout.write(self.style.NOTICE(f"[rebuild_rankings] {n:,} buckets in {time.perf_counter() - t0:.1f}s"))
+        self.stdout.write(self.style.SUCCESS("Done."))
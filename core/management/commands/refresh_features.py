@@ -0,0 +1,40 @@
+import datetime
+import os
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.consent import with_ai_consent
+from core.ml.features import AVG_WINDOW_DAYS, STORE_PATH, FeatureStore, iter_hourly_samples
+from core.models import DeliveryRecord
+
+
+class Command(BaseCommand):
+    help = "Incrementally refresh the (area, date, hour) feature store (core/ml/feature_store.npz)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=2, help="直近何日分を DB から集計し直すか")
+        parser.add_argument("--keep_days", type=int, default=90 + AVG_WINDOW_DAYS,
+                            help="ストアに残す日数（学習 lookback + 特徴量の窓）")
+
+    def _samples(self, since):
+        qs = with_ai_consent(DeliveryRecord.objects.filter(date__gte=since))
+        return iter_hourly_samples(qs)
+
+    def handle(self, *args, **opts):
+        today = timezone.localdate()
+        keep_from = today - datetime.timedelta(days=opts["keep_days"])
+
+        if os.path.exists(STORE_PATH):
+            store = FeatureStore.load(STORE_PATH)
+            since = max(store.start, today - datetime.timedelta(days=opts["days"]))
+            store.refresh(self._samples(since), since, today)
+            self.stdout.write(self.style.NOTICE(f"[refresh_features] refreshed {since}..{today}"))
+        else:
+            store = FeatureStore.build(self._samples(keep_from), keep_from, today)
+            self.stdout.write(self.style.NOTICE(f"[refresh_features] built {keep_from}..{today}"))
+
+        store.trim_before(keep_from)
+        store.save(STORE_PATH)
+        self.stdout.write(self.style.SUCCESS(
+            f"Saved {STORE_PATH} ({store.start}..{store.end}, {len(store.slugs)} areas)"))
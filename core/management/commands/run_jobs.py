@@ -0,0 +1,115 @@
+import logging
+import os
+import time
+from collections import namedtuple
+
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core import calibration, heat, rankings
+from core.ml.predictor import MODEL_ONNX
+from core.singleflight import SHARED_ALIAS
+
+logger = logging.getLogger("core.jobs")
+
+# name: ジョブ名 / env, default: 間隔（秒）の環境変数と既定値（0 で無効）
+# at_start: 起動直後に1回走らせる / cluster: DB 全体に効くジョブ（共有キャッシュで間隔内1回に絞る）
+Job = namedtuple("Job", "name env default at_start cluster")
+
+JOBS = (
+    # 予測補正：共有予測の版（デプロイ・train_lgbm で変わる）と違う版で作ったユーザーだけ作り直す
+    Job("calibration", "FEATURE_REFRESH_SEC", 3600, True, True),
+    # 特徴量ストア：このコンテナのファイル。推論側は mtime の変化で読み直すので各レプリカで回す
+    Job("features", "FEATURE_REFRESH_SEC", 3600, False, False),
+    # ヒートマップの集計ピラミッド：新着を増分で足す
+    Job("heat", "HEAT_BUILD_SEC", 60, True, True),
+    # 順位のスケッチ：保存・編集・削除・同意の変更で積まれたバケットを作り直す
+    Job("rankings", "HEAT_BUILD_SEC", 60, True, True),
+)
+
+
+def _interval(job) -> int:
+    return int(os.getenv(job.env, job.default))
+
+
+def _run_features():
+    if not os.path.exists(MODEL_ONNX):
+        return
+    call_command("refresh_features", stdout=_LogStream())
+
+
+RUNNERS = {
+    "calibration": lambda: calibration.rebuild(log=logger.debug, stale_only=True),
+    "features": _run_features,
+    "heat": lambda: heat.build(log=logger.debug),
+    "rankings": lambda: rankings.build(log=logger.debug),
+}
+
+
+class _LogStream:
+    """call_command の stdout をロガーへ流す。"""
+
+    def write(self, msg):
+        if msg.strip():
+            logger.debug(msg.rstrip())
+
+    def flush(self):
+        pass
+
+
+class Command(BaseCommand):
+    help = ("Run the periodic jobs (calibration, feature store, heatmap pyramid, rankings) in one long-lived process. "
+            "Intervals come from FEATURE_REFRESH_SEC / HEAT_BUILD_SEC (0 disables a job).")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="各ジョブを1回ずつ走らせて終わる（cron・動作確認用）")
+        parser.add_argument("--only", action="append", choices=[j.name for j in JOBS],
+                            help="走らせるジョブ（複数指定可、省略で全部）")
+
+    def _claim(self, job, interval: int) -> bool:
+        """
+        DB 全体に効くジョブは共有キャッシュに印を置いて、同じ間隔のうちに走らせるのを1プロセスに絞る。
+        複数ホストで絞るには DN_SHARED_CACHE=db（ファイルキャッシュだとホストごとに1回）。
+        """
+        if not job.cluster:
+            return True
+        return caches[SHARED_ALIAS].add(f"jobs:{job.name}", os.getpid(), max(interval - 1, 1))
+
+    def _run(self, job, interval: int):
+        if not self._claim(job, interval):
+            logger.debug("%s: claimed by another process, skipped", job.name)
+            return
+        t0 = time.perf_counter()
+        try:
+            n = RUNNERS[job.name]()
+        except Exception:
+            # 1つのジョブが落ちてもループは止めない（次の周期でやり直す）
+            logger.exception("%s failed", job.name)
+        else:
+            logger.info("%s: %s in %.1fs", job.name, "done" if n is None else f"{n:,}", time.perf_counter() - t0)
+        finally:
+            # 長寿命プロセスなので、切れた・寿命を過ぎた接続を周期ごとに捨てる
+            close_old_connections()
+
+    def handle(self, *args, **opts):
+        jobs = [(j, _interval(j)) for j in JOBS if not opts["only"] or j.name in opts["only"]]
+        jobs = [(j, sec) for j, sec in jobs if sec > 0]
+        if opts["once"]:
+            for job, sec in jobs:
+                self._run(job, sec)
+            return
+        if not jobs:
+            logger.info("no jobs enabled")
+            return
+
+        logger.info("started: %s", ", ".join(f"{j.name}/{sec}s" for j, sec in jobs))
+        now = time.monotonic()
+        due = {j.name: now if j.at_start else now + sec for j, sec in jobs}
+        while True:
+            for job, sec in jobs:
+                if time.monotonic() >= due[job.name]:
+                    self._run(job, sec)
+                    due[job.name] = time.monotonic() + sec
+            time.sleep(max(min(due.values()) - time.monotonic(), 1))
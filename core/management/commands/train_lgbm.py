@@ -1,5 +1,7 @@
 import json
 import math
+import os
+import time
 import re
 import datetime
 from decimal import Decimal
@@ -10,79 +12,31 @@ from django.core.management.base import BaseCommand
 from django.utils import timezone
 from django.db.models import Q
 
-from core.models import DeliveryRecord, UserAiConsent
-from core.areas import AREAS, AREAS_BY_SLUG
+from core.models import DeliveryRecord
+from core.consent import with_ai_consent
+from core.ml.features import (
+    AVG_WINDOW_DAYS, FEATURE_ORDER, STORE_PATH, FeatureStore, iter_hourly_samples,
+)
+from core.ml import search
+from core.ml.predictor import MODEL_META, MODEL_ONNX
 
 # 学習
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_absolute_error
+import lightgbm as lgb
 from lightgbm import LGBMRegressor
 
-# ONNX 変換
+# ONNX 変換（skl2onnx は LightGBM を知らないので onnxmltools の変換器を登録する）
 import skl2onnx
+from skl2onnx import update_registered_converter
 from skl2onnx.common.data_types import FloatTensorType
-import onnx
-
-
-AREA_TAG_RE = re.compile(r"\[AREA:([a-z0-9\-]+)\]")
-
-
-def extract_area_slug(note: str) -> str | None:
-    if not note:
-        return None
-    m = AREA_TAG_RE.search(note)
-    return m.group(1) if m else None
-
-
-def iter_hourly_samples(qs):
-    """
-    DeliveryRecord から 1時間粒度の学習サンプルを生成。
-    1レコードを「跨いだ各時間枠」に比例配分し、時給(円/h)を目的変数として返す。
-    戻り値: dict のジェネレータ
-    """
-    from math import floor, ceil
-
-    for r in qs.only("date", "earnings", "hours_worked", "start_time", "end_time", "note"):
-        if (r.start_time is None) or (r.end_time is None) or (r.earnings is None):
-            continue
-
-        slug = extract_area_slug(getattr(r, "note", ""))
-        if not slug or (slug not in AREAS_BY_SLUG):
-            continue
-
-        sh = r.start_time.hour + r.start_time.minute / 60.0
-        eh = r.end_time.hour + r.end_time.minute / 60.0
-        if eh <= sh:
-            dur = float(r.hours_worked or 0) or 0.0
-            if dur <= 0:
-                continue
-            eh = min(24.0, sh + dur)
-
-        dur = max(0.0, eh - sh)
-        if dur <= 0:
-            continue
-
-        # そのレコードの平均時給（全時間帯で一定とみなす）
-        earn = float(r.earnings)
-        hourly_rate = (earn / dur) if dur > 0 else 0.0
-        if hourly_rate <= 0:
-            continue
-
-        for h in range(max(0, floor(sh)), min(24, ceil(eh))):
-            left = max(sh, h)
-            right = min(eh, h + 1)
-            portion = max(0.0, right - left)
-            if portion <= 0:
-                continue
-
-            yield {
-                "date": r.date,
-                "dow": r.date.weekday(),     # 0=Mon
-                "hour": h,                   # 0..23
-                "area_slug": slug,
-                "y_hourly": hourly_rate,     # 目的変数（時給）
-                "portion": portion           # この時間枠への寄与（重み）
-            }
+from skl2onnx.common.shape_calculator import calculate_linear_regressor_output_shapes
+from onnxmltools.convert.lightgbm.operator_converters.LightGbm import convert_lightgbm
+
+update_registered_converter(LGBMRegressor, "LightGbmLGBMRegressor",
+                            calculate_linear_regressor_output_shapes, convert_lightgbm,
+                            options={"split": None})
+TARGET_OPSET = {"": 12, "ai.onnx.ml": 2}
 
 
 class Command(BaseCommand):
@@ -93,6 +47,14 @@ class Command(BaseCommand):
         parser.add_argument("--min_samples", type=int, default=200, help="最低サンプル数（これ未満なら学習スキップ）")
         parser.add_argument("--test_size", type=float, default=0.2, help="検証データの割合")
         parser.add_argument("--seed", type=int, default=42, help="乱数シード")
+        # ハイパーパラメータ探索
+        parser.add_argument("--search", action="store_true", help="探索空間を時系列 fold で並列評価し、最良設定で学習")
+        parser.add_argument("--search_space", default=None, help="探索空間 JSON（{param: [候補...]}）。省略時は既定グリッド")
+        parser.add_argument("--folds", type=int, default=3, help="時系列 fold 数")
+        parser.add_argument("--workers", type=int, default=0, help="並列プロセス数（0 = CPU コア数）")
+        parser.add_argument("--early_stopping_rounds", type=int, default=50, help="early stopping の待ちラウンド数")
+        parser.add_argument("--leaderboard", default=None,
+                            help="leaderboard の出力先（省略時はモデルと同じディレクトリの lgbm_leaderboard.json）")
 
     def handle(self, *args, **opts):
         lookback_days = opts["lookback_days"]
@@ -103,67 +65,107 @@ class Command(BaseCommand):
         since = (timezone.now() - datetime.timedelta(days=lookback_days)).date()
         self.stdout.write(self.style.NOTICE(f"[train_lgbm] since={since} ..."))
 
-        # 同意ONのユーザーのみ
-        opted_ids = set(UserAiConsent.objects.filter(share_aggregated=True).values_list("user_id", flat=True))
-        if not opted_ids:
-            self.stdout.write(self.style.WARNING("同意ONユーザーがいません。学習スキップ。"))
-            return
-
-        qs = DeliveryRecord.objects.filter(date__gte=since, user_id__in=opted_ids).order_by("-date")
-        rows = list(iter_hourly_samples(qs))
+        # 同意ONのユーザーのみ（EXISTS サブクエリで DB 側に絞らせる）
+        # 特徴量（28日平均・7日ラグ）のため lookback より AVG_WINDOW_DAYS 日前から集計
+        today = timezone.localdate()
+        store_start = since - datetime.timedelta(days=AVG_WINDOW_DAYS)
+        qs = with_ai_consent(DeliveryRecord.objects.filter(date__gte=store_start)).order_by("-date")
+        all_rows = list(iter_hourly_samples(qs))
+        rows = [r for r in all_rows if r["date"] >= since]
         if len(rows) < min_samples:
             self.stdout.write(self.style.WARNING(f"サンプル不足: {len(rows)} < {min_samples}. 学習スキップ。"))
             return
 
+        # 特徴量ストア（推論でも同じものを読む）
+        store = FeatureStore.build(all_rows, store_start, today)
         df = pd.DataFrame(rows)
-        # ここではシンプルに3特徴量
-        # area_slug -> area_id (整数エンコード)
-        slugs = sorted(set(df["area_slug"]))
-        slug_to_id = {s:i for i,s in enumerate(slugs)}
-        df["area_id"] = df["area_slug"].map(slug_to_id).astype(np.int32)
-        df["dow"] = df["dow"].astype(np.int32)
-        df["hour"] = df["hour"].astype(np.int32)
-
-        X = df[["dow", "hour", "area_id"]].values
+        X = store.training_matrix(df["date"], df["hour"], df["area_slug"])
         y = df["y_hourly"].values
         w = df["portion"].values  # レコードの寄与で重み付け
 
-        X_train, X_val, y_train, y_val, w_train, w_val = train_test_split(
-            X, y, w, test_size=test_size, random_state=seed
-        )
-
-        model = LGBMRegressor(
-            n_estimators=600,
-            learning_rate=0.05,
-            max_depth=-1,
-            num_leaves=63,
-            subsample=0.9,
-            colsample_bytree=0.9,
-            random_state=seed,
-        )
-        model.fit(X_train, y_train, sample_weight=w_train, eval_set=[(X_val, y_val)], verbose=False)
-
-        pred_val = model.predict(X_val)
-        mae = mean_absolute_error(y_val, pred_val, sample_weight=w_val)
-        self.stdout.write(self.style.SUCCESS(f"validation MAE = {mae:.2f} 円/h"))
-
-        # ONNX へ変換
+        if opts["search"]:
+            day_idx = np.fromiter((d.toordinal() for d in df["date"]), dtype=np.int64)
+            model, mae = self._search(X, y, w, day_idx, opts)
+        else:
+            X_train, X_val, y_train, y_val, w_train, w_val = train_test_split(
+                X, y, w, test_size=test_size, random_state=seed
+            )
+
+            model = LGBMRegressor(
+                n_estimators=600,
+                learning_rate=0.05,
+                max_depth=-1,
+                num_leaves=63,
+                subsample=0.9,
+                colsample_bytree=0.9,
+                random_state=seed,
+                verbose=-1,
+            )
+            model.fit(X_train, y_train, sample_weight=w_train, eval_set=[(X_val, y_val)],
+                      callbacks=[lgb.log_evaluation(0)])  # LightGBM 4 で fit(verbose=) は廃止
+
+            pred_val = model.predict(X_val)
+            mae = mean_absolute_error(y_val, pred_val, sample_weight=w_val)
+            self.stdout.write(self.style.SUCCESS(f"validation MAE = {mae:.2f} 円/h"))
+
+        # 特徴量ストアを先に保存（モデルだけ新しくなって古いストアと組み合わさらないように）
+        store.save(STORE_PATH)
+
+        # ONNX へ変換（一時ファイルから置き換え。推論側は mtime の変化で読み直す）
         initial_types = [('x', FloatTensorType([None, X.shape[1]]))]
-        onnx_model = skl2onnx.convert_sklearn(model, initial_types=initial_types, target_opset=12)
-        onnx_path = "core/ml/model_lgbm.onnx"
-        with open(onnx_path, "wb") as f:
+        onnx_model = skl2onnx.convert_sklearn(model, initial_types=initial_types, target_opset=TARGET_OPSET)
+        # 既定ドメインは Identity だけなので opset 1 と刻まれる（onnxruntime は 7 未満を警告する）。対象の版に揃える
+        for imp in onnx_model.opset_import:
+            if imp.domain == "":
+                imp.version = max(imp.version, TARGET_OPSET[""])
+        onnx_path = MODEL_ONNX
+        with open(onnx_path + ".tmp", "wb") as f:
             f.write(onnx_model.SerializeToString())
+        os.replace(onnx_path + ".tmp", onnx_path)
 
         # メタデータ（エンコード辞書など）
         meta = {
-            "area_slugs": slugs,
-            "feature_order": ["dow", "hour", "area_id"],
+            "area_slugs": store.slugs,
+            "feature_order": FEATURE_ORDER,
             "trained_at": timezone.now().isoformat(),
             "lookback_days": lookback_days,
             "mae_val": float(mae),
         }
-        with open("core/ml/model_lgbm.meta.json", "w", encoding="utf-8") as f:
+        with open(MODEL_META + ".tmp", "w", encoding="utf-8") as f:
             json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(MODEL_META + ".tmp", MODEL_META)
 
         self.stdout.write(self.style.SUCCESS(f"Saved ONNX to {onnx_path}"))
         self.stdout.write(self.style.SUCCESS("Done."))
+
+    def _search(self, X, y, w, day_idx, opts):
+        """時系列 fold で探索 → leaderboard 保存 → 最良設定で全データを学習し直す。"""
+        space = search.load_space(opts["search_space"])
+        leaderboard = opts["leaderboard"] or os.path.join(os.path.dirname(MODEL_ONNX), search.LEADERBOARD_NAME)
+        n_trials = len(search.expand_grid(space))
+        self.stdout.write(self.style.NOTICE(
+            f"[train_lgbm] search: {n_trials} trials x {opts['folds']} folds, workers={opts['workers'] or 'all'}"))
+        t0 = time.perf_counter()
+        results = search.run_search(
+            X, y, w, day_idx, space, n_folds=opts["folds"], workers=opts["workers"] or None,
+            early_stopping_rounds=opts["early_stopping_rounds"], seed=opts["seed"],
+        )
+        wall = time.perf_counter() - t0
+        search.write_leaderboard(results, leaderboard, meta={
+            "created_at": timezone.now().isoformat(), "n_samples": int(len(y)),
+            "folds": opts["folds"], "wall_s": wall,
+        })
+        for r in results[:5]:
+            self.stdout.write(f"  #{r['rank']} MAE={r['mae']:.2f} trees={r['n_estimators']} "
+                              f"{r['wall_s']:.1f}s {r['params']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"search done in {wall:.1f}s (Σtrial {sum(r['wall_s'] for r in results):.1f}s) → {leaderboard}"))
+
+        # 最良設定・fold 平均の木の本数で全データを学習（ONNX 出力用）
+        best = results[0]
+        params = {**search.BASE_PARAMS, **best["params"], "n_estimators": best["n_estimators"],
+                  "n_jobs": -1, "random_state": opts["seed"]}
+        model = LGBMRegressor(**params)
+        model.fit(X, y, sample_weight=w)
+        self.stdout.write(self.style.SUCCESS(f"CV MAE (best) = {best['mae']:.2f} 円/h"))
+        return model, best["mae"]
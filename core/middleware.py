@@ -0,0 +1,30 @@
+# core/middleware.py
+from contextlib import ExitStack
+
+from django.db import connections
+
+
+class QueryCountMiddleware:
+    """
+    レスポンスに X-DB-Queries（そのリクエストで実行した SQL 数）を付ける。
+    負荷試験（loadtest）用。settings の DN_QUERY_COUNT_HEADER=1 のときだけ MIDDLEWARE に入る。
+    DEBUG に依存しないよう execute_wrapper で数える。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        count = [0]
+
+        def counter(execute, sql, params, many, context):
+            count[0] += 1
+            return execute(sql, params, many, context)
+
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(counter))
+            response = self.get_response(request)
+        # StreamingHttpResponse は本文を流す前に数えるので、ヘッダはそこまでの件数
+        response["X-DB-Queries"] = str(count[0])
+        return response
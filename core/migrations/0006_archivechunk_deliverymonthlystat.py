@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_remove_useraiconsent_user_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('delivery', 'delivery'), ('ocr', 'ocr')], max_length=16)),
+                ('month', models.DateField()),
+                ('row_count', models.PositiveIntegerField(default=0)),
+                ('payload', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archive_chunks', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('kind', 'user', 'month')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DeliveryMonthlyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('area_slug', models.CharField(blank=True, default='', max_length=64)),
+                ('records', models.PositiveIntegerField(default=0)),
+                ('orders_completed', models.PositiveIntegerField(default=0)),
+                ('earnings', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('hours_worked', models.DecimalField(decimal_places=2, default=0, max_digits=8)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'month', 'area_slug')},
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_archivechunk_deliverymonthlystat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserAiConsent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('share_aggregated', models.BooleanField(default=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ai_consent', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
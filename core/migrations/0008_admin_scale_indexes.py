@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_useraiconsent'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ocrimport',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AddIndex(
+            model_name='deliveryrecord',
+            index=models.Index(fields=['-date', '-id'], name='deliveryrecord_date_idx'),
+        ),
+    ]
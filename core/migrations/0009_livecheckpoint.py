@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_admin_scale_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LiveCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=32, unique=True)),
+                ('day', models.DateField()),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('payload', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:21
+
+from django.db import migrations, models
+
+from core.entrance_search import install_index, search_keys, uninstall_index
+
+
+def backfill(apps, schema_editor):
+    EntranceInfo = apps.get_model("core", "EntranceInfo")
+    qs = EntranceInfo.objects.order_by("id").only("id", "address", "note")
+    last = 0
+    while True:
+        rows = list(qs.filter(id__gt=last)[:2000])
+        if not rows:
+            break
+        for r in rows:
+            r.address_key, r.search_text = search_keys(r.address, r.note)
+        EntranceInfo.objects.bulk_update(rows, ["address_key", "search_text"])
+        last = rows[-1].id
+
+
+def create_index(apps, schema_editor):
+    install_index(schema_editor.connection)
+
+
+def drop_index(apps, schema_editor):
+    uninstall_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_livecheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entranceinfo',
+            name='address_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='entranceinfo',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+        migrations.RunPython(create_index, drop_index),
+    ]
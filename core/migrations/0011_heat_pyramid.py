@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_entranceinfo_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HeatCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=32, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='HeatCell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('z', models.PositiveSmallIntegerField()),
+                ('cx', models.IntegerField()),
+                ('cy', models.IntegerField()),
+                ('records', models.PositiveIntegerField(default=0)),
+                ('hours', models.FloatField(default=0)),
+                ('earnings', models.FloatField(default=0)),
+                ('entrances', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('z', 'cy', 'cx')},
+            },
+        ),
+    ]
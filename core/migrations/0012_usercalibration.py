@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_heat_pyramid'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserCalibration',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='calibration', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('payload', models.BinaryField()),
+                ('hours', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
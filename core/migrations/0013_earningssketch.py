@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_usercalibration'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EarningsSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('area_slug', models.CharField(max_length=64)),
+                ('dow', models.PositiveSmallIntegerField()),
+                ('band', models.PositiveSmallIntegerField()),
+                ('payload', models.BinaryField()),
+                ('hours', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('area_slug', 'dow', 'band')},
+            },
+        ),
+    ]
@@ -0,0 +1,113 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:48
+
+from django.db import migrations, models
+from django.db.models import F
+
+from core.entrance_search import install_index
+
+# 既存の行にユーザーごとの変更番号を振る（記録 → 入口 → OCR の順、id 順）
+_COUNTS = "SELECT user_id, COUNT(*) AS n FROM ({}) AS t GROUP BY user_id"
+_RECORDS = "SELECT user_id FROM core_deliveryrecord"
+_ENTRANCES = "SELECT user_id FROM core_entranceinfo"
+_OCR = "SELECT user_id FROM core_ocrimport"
+_NUMBER = (
+    "UPDATE {table} SET sync_seq = s.rn + COALESCE(c.n, 0) "
+    "FROM (SELECT id, user_id, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY id) AS rn FROM {table}) AS s "
+    "LEFT JOIN ({offsets}) AS c ON c.user_id = s.user_id "
+    "WHERE {table}.id = s.id"
+)
+_EMPTY = "SELECT user_id, 0 AS n FROM core_deliveryrecord WHERE 1 = 0"
+
+
+def backfill(apps, schema_editor):
+    for name in ("DeliveryRecord", "EntranceInfo", "OcrImport"):
+        apps.get_model("core", name).objects.update(updated_at=F("created_at"))
+    with schema_editor.connection.cursor() as cur:
+        cur.execute(_NUMBER.format(table="core_deliveryrecord", offsets=_EMPTY))
+        cur.execute(_NUMBER.format(table="core_entranceinfo", offsets=_COUNTS.format(_RECORDS)))
+        cur.execute(_NUMBER.format(table="core_ocrimport",
+                                   offsets=_COUNTS.format(f"{_RECORDS} UNION ALL {_ENTRANCES}")))
+        cur.execute("INSERT INTO core_syncstate (user_id, seq, pruned_seq) SELECT user_id, n, 0 FROM ("
+                    + _COUNTS.format(f"{_RECORDS} UNION ALL {_ENTRANCES} UNION ALL {_OCR}") + ") AS a")
+
+
+def reinstall_entrance_index(apps, schema_editor):
+    # SQLite では entranceinfo への AddField がテーブルを作り直し、FTS のトリガーが消える
+    install_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_earningssketch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncState',
+            fields=[
+                ('user_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('seq', models.BigIntegerField(default=0)),
+                ('pruned_seq', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SyncTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.BigIntegerField()),
+                ('kind', models.CharField(max_length=16)),
+                ('object_id', models.BigIntegerField()),
+                ('seq', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='deliveryrecord',
+            name='sync_seq',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='deliveryrecord',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='entranceinfo',
+            name='sync_seq',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='entranceinfo',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='ocrimport',
+            name='sync_seq',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='ocrimport',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='deliveryrecord',
+            index=models.Index(fields=['user', 'sync_seq'], name='deliveryrecord_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='entranceinfo',
+            index=models.Index(fields=['user', 'sync_seq'], name='entranceinfo_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ocrimport',
+            index=models.Index(fields=['user', 'sync_seq'], name='ocrimport_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='synctombstone',
+            index=models.Index(fields=['user_id', 'seq'], name='synctombstone_seq_idx'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+        migrations.RunPython(reinstall_entrance_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_sync'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalibrationResidual',
+            fields=[
+                ('record_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('user_id', models.BigIntegerField(db_index=True)),
+                ('payload', models.BinaryField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='usercalibration',
+            name='model_version',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_heatcursor_gaps'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='livecheckpoint',
+            name='gaps',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:28
+
+from django.db import migrations, models
+
+from core.calibration import RECORD_FIELDS, SLUGS
+from core.rankings import sample_values
+
+
+def fill_samples(apps, schema_editor):
+    """既存の記録のサンプルを作り、サンプルのある全バケットを作り直し待ちにする（次の build_rankings で揃う）。"""
+    DeliveryRecord = apps.get_model("core", "DeliveryRecord")
+    EarningsSample = apps.get_model("core", "EarningsSample")
+    RankingDirty = apps.get_model("core", "RankingDirty")
+    rows, buckets = [], set()
+    for r in DeliveryRecord.objects.filter(area_slug__in=SLUGS).order_by().values(*RECORD_FIELDS).iterator(chunk_size=5000):
+        for v in sample_values(r):
+            rows.append(EarningsSample(**v))
+            buckets.add((v["area_slug"], v["dow"], v["band"]))
+        if len(rows) >= 5000:
+            EarningsSample.objects.bulk_create(rows)
+            rows = []
+    EarningsSample.objects.bulk_create(rows)
+    RankingDirty.objects.bulk_create([RankingDirty(area_slug=s, dow=d, band=b) for s, d, b in sorted(buckets)])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_livecheckpoint_gaps'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RankingDirty',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('area_slug', models.CharField(max_length=64)),
+                ('dow', models.PositiveSmallIntegerField()),
+                ('band', models.PositiveSmallIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EarningsSample',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('record_id', models.BigIntegerField(db_index=True)),
+                ('user_id', models.BigIntegerField(db_index=True)),
+                ('area_slug', models.CharField(max_length=64)),
+                ('dow', models.PositiveSmallIntegerField()),
+                ('band', models.PositiveSmallIntegerField()),
+                ('yen', models.FloatField()),
+                ('hours', models.FloatField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['area_slug', 'dow', 'band'], name='core_earnin_area_sl_a63ecc_idx')],
+            },
+        ),
+        migrations.RunPython(fill_samples, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,238 @@
+# core/ml/features.py
+"""
+(area_slug, date, hour) 単位の特徴量。学習（train_lgbm）と推論（LgbmPredictor）で共通。
+
+- 実績は FeatureStore に「日×時×エリア」の密な配列（加重和と重み）として持ち、
+  core/ml/feature_store.npz に保存。refresh() で直近の日だけ差し替える
+- 特徴量は必ず FeatureStore.matrix() で作る（学習・推論で同じ関数 → skew しない）
+- 祝日は同梱の jp_holidays.csv（ネットワーク不要）
+"""
+import csv
+import datetime
+import os
+import re
+from functools import lru_cache
+from math import ceil, floor
+
+import numpy as np
+
+from core.areas import AREAS_BY_SLUG
+
+BASE_DIR = os.path.dirname(__file__)
+STORE_PATH = os.path.join(BASE_DIR, "feature_store.npz")
+HOLIDAYS_CSV = os.path.join(BASE_DIR, "jp_holidays.csv")
+
+FEATURE_ORDER = ["dow", "hour", "area_id", "is_holiday", "area_avg_28d", "lag_7d"]
+AVG_WINDOW_DAYS = 28
+LAG_DAYS = 7
+
+AREA_TAG_RE = re.compile(r"\[AREA:([a-z0-9\-]+)\]")
+
+
+def extract_area_slug(note: str) -> str | None:
+    if not note:
+        return None
+    m = AREA_TAG_RE.search(note)
+    return m.group(1) if m else None
+
+
+def iter_hourly_samples(qs):
+    """
+    DeliveryRecord から 1時間粒度の学習サンプルを生成。
+    1レコードを「跨いだ各時間枠」に比例配分し、時給(円/h)を目的変数として返す。
+    戻り値: dict のジェネレータ
+    """
+    for r in qs.only("date", "earnings", "hours_worked", "start_time", "end_time", "area_slug", "note"):
+        if (r.start_time is None) or (r.end_time is None) or (r.earnings is None):
+            continue
+
+        slug = r.area_slug or extract_area_slug(getattr(r, "note", ""))
+        if not slug or (slug not in AREAS_BY_SLUG):
+            continue
+
+        sh = r.start_time.hour + r.start_time.minute / 60.0
+        eh = r.end_time.hour + r.end_time.minute / 60.0
+        if eh <= sh:
+            dur = float(r.hours_worked or 0) or 0.0
+            if dur <= 0:
+                continue
+            eh = min(24.0, sh + dur)
+
+        dur = max(0.0, eh - sh)
+        if dur <= 0:
+            continue
+
+        # そのレコードの平均時給（全時間帯で一定とみなす）
+        earn = float(r.earnings)
+        hourly_rate = (earn / dur) if dur > 0 else 0.0
+        if hourly_rate <= 0:
+            continue
+
+        for h in range(max(0, floor(sh)), min(24, ceil(eh))):
+            left = max(sh, h)
+            right = min(eh, h + 1)
+            portion = max(0.0, right - left)
+            if portion <= 0:
+                continue
+
+            yield {
+                "date": r.date,
+                "dow": r.date.weekday(),     # 0=Mon
+                "hour": h,                   # 0..23
+                "area_slug": slug,
+                "y_hourly": hourly_rate,     # 目的変数（時給）
+                "portion": portion           # この時間枠への寄与（重み）
+            }
+
+
+@lru_cache(maxsize=1)
+def holiday_ordinals() -> np.ndarray:
+    with open(HOLIDAYS_CSV, encoding="utf-8") as f:
+        days = [datetime.date.fromisoformat(r["date"]).toordinal() for r in csv.DictReader(f)]
+    return np.array(sorted(days), dtype=np.int64)
+
+
+class FeatureStore:
+    """
+    earn[d, h, a]   : Σ 時給×寄与
+    weight[d, h, a] : Σ 寄与
+    d は start からの日数、a は slugs のインデックス（= 学習時の area_id）。
+    """
+
+    def __init__(self, start: datetime.date, slugs: list, earn: np.ndarray, weight: np.ndarray):
+        self.start = start
+        self.slugs = list(slugs)
+        self.area_index = {s: i for i, s in enumerate(self.slugs)}
+        self.earn = earn
+        self.weight = weight
+        self._derive()
+
+    # ---------- 生成・保存 ----------
+    @classmethod
+    def empty(cls, start: datetime.date, end: datetime.date, slugs=None):
+        slugs = sorted(AREAS_BY_SLUG) if slugs is None else slugs
+        n_days = max(1, (end - start).days + 1)
+        shape = (n_days, 24, len(slugs))
+        return cls(start, slugs, np.zeros(shape), np.zeros(shape))
+
+    @classmethod
+    def build(cls, samples, start: datetime.date, end: datetime.date, slugs=None):
+        store = cls.empty(start, end, slugs)
+        store._add(samples)
+        return store
+
+    @classmethod
+    def load(cls, path: str = STORE_PATH):
+        z = np.load(path, allow_pickle=False)
+        start = datetime.date.fromordinal(int(z["start_ordinal"]))
+        return cls(start, [str(s) for s in z["slugs"]], z["earn"], z["weight"])
+
+    def save(self, path: str = STORE_PATH):
+        tmp = path + ".tmp.npz"
+        np.savez_compressed(tmp, start_ordinal=np.int64(self.start.toordinal()),
+                            slugs=np.array(self.slugs), earn=self.earn, weight=self.weight)
+        os.replace(tmp, path)
+
+    @property
+    def end(self) -> datetime.date:
+        return self.start + datetime.timedelta(days=self.earn.shape[0] - 1)
+
+    def refresh(self, samples, since: datetime.date, end: datetime.date):
+        """since 以降の日をゼロに戻して samples（since〜end の実績）で埋め直す。"""
+        n_days = (end - self.start).days + 1
+        if n_days > self.earn.shape[0]:
+            pad = ((0, n_days - self.earn.shape[0]), (0, 0), (0, 0))
+            self.earn = np.pad(self.earn, pad)
+            self.weight = np.pad(self.weight, pad)
+        i0 = max(0, (since - self.start).days)
+        self.earn[i0:] = 0.0
+        self.weight[i0:] = 0.0
+        self._add(samples)
+
+    def trim_before(self, day: datetime.date):
+        """day より前の日を捨てる（ファイルサイズを一定に保つ）。"""
+        k = (day - self.start).days
+        if k <= 0:
+            return
+        k = min(k, self.earn.shape[0] - 1)
+        self.start += datetime.timedelta(days=k)
+        self.earn = self.earn[k:].copy()
+        self.weight = self.weight[k:].copy()
+        self._derive()
+
+    def _add(self, samples):
+        d, h, a, y, w = [], [], [], [], []
+        for s in samples:
+            ai = self.area_index.get(s["area_slug"])
+            di = (s["date"] - self.start).days
+            if ai is None or not (0 <= di < self.earn.shape[0]):
+                continue
+            d.append(di); h.append(s["hour"]); a.append(ai)
+            y.append(s["y_hourly"]); w.append(s["portion"])
+        if d:
+            idx = (np.array(d), np.array(h), np.array(a))
+            w = np.array(w)
+            np.add.at(self.earn, idx, np.array(y) * w)
+            np.add.at(self.weight, idx, w)
+        self._derive()
+
+    def _derive(self):
+        """ローリング平均を O(1) で引くための日別累積和。"""
+        day_e = self.earn.sum(axis=1)
+        day_w = self.weight.sum(axis=1)
+        zero = np.zeros((1, len(self.slugs)))
+        self._cum_e = np.concatenate([zero, np.cumsum(day_e, axis=0)])
+        self._cum_w = np.concatenate([zero, np.cumsum(day_w, axis=0)])
+
+    # ---------- 特徴量 ----------
+    def matrix(self, day_idx, hour, area_idx, feature_order=FEATURE_ORDER) -> np.ndarray:
+        """
+        day_idx / hour / area_idx（同じ長さの整数配列）から [N, len(feature_order)] の float32 行列。
+        学習・推論とも必ずここを通す。
+        """
+        day_idx = np.asarray(day_idx, dtype=np.int64)
+        hour = np.asarray(hour, dtype=np.int64)
+        area_idx = np.asarray(area_idx, dtype=np.int64)
+        n_days = self.earn.shape[0]
+        cols = {}
+
+        ordinal = self.start.toordinal() + day_idx
+        cols["dow"] = (ordinal - 1) % 7  # date.fromordinal(1) は月曜
+        cols["hour"] = hour
+        cols["area_id"] = area_idx
+        if "is_holiday" in feature_order:
+            cols["is_holiday"] = np.isin(ordinal, holiday_ordinals())
+
+        if "area_avg_28d" in feature_order or "lag_7d" in feature_order:
+            # [day-28, day) の加重平均（当日を含めない → 学習時のリークなし）
+            d1 = np.clip(day_idx, 0, n_days)
+            d0 = np.clip(day_idx - AVG_WINDOW_DAYS, 0, n_days)
+            e = self._cum_e[d1, area_idx] - self._cum_e[d0, area_idx]
+            w = self._cum_w[d1, area_idx] - self._cum_w[d0, area_idx]
+            # そのエリアに実績が無ければ同じ窓の全エリア平均（それも無ければ 0）
+            ge = self._cum_e[d1].sum(axis=1) - self._cum_e[d0].sum(axis=1)
+            gw = self._cum_w[d1].sum(axis=1) - self._cum_w[d0].sum(axis=1)
+            fallback = np.where(gw > 0, ge / np.where(gw > 0, gw, 1.0), 0.0)
+            avg = np.where(w > 0, e / np.where(w > 0, w, 1.0), fallback)
+            cols["area_avg_28d"] = avg
+
+            li = day_idx - LAG_DAYS
+            ok = (li >= 0) & (li < n_days)
+            lc = np.clip(li, 0, n_days - 1)
+            lw = np.where(ok, self.weight[lc, hour, area_idx], 0.0)
+            le = self.earn[lc, hour, area_idx]
+            cols["lag_7d"] = np.where(lw > 0, le / np.where(lw > 0, lw, 1.0), avg)
+
+        return np.stack([np.asarray(cols[f], dtype=np.float32) for f in feature_order], axis=1)
+
+    def training_matrix(self, dates, hours, slugs, feature_order=FEATURE_ORDER) -> np.ndarray:
+        start = self.start.toordinal()
+        day_idx = np.fromiter((d.toordinal() - start for d in dates), dtype=np.int64)
+        area_idx = np.fromiter((self.area_index[s] for s in slugs), dtype=np.int64)
+        return self.matrix(day_idx, np.asarray(hours), area_idx, feature_order)
+
+    def inference_matrix(self, day: datetime.date, hour: int, feature_order=FEATURE_ORDER) -> np.ndarray:
+        """全エリア分の [n_areas, F]。配列参照だけなので O(エリア数)。"""
+        n = len(self.slugs)
+        di = day.toordinal() - self.start.toordinal()
+        return self.matrix(np.full(n, di), np.full(n, hour), np.arange(n), feature_order)
@@ -1,60 +1,100 @@
 import os
 import json
-import numpy as np
-
-try:
-    import onnxruntime as ort
-except Exception:
-    ort = None  # onnxruntime 未インストール時は None
+import time
+import datetime
+import importlib.util
 
 from core.areas import AREAS_BY_SLUG
 
+# numpy / onnxruntime は import だけで数十 ms かかるため、モデルを実際に読むまで import しない
+# （モデル未配置の環境ではワーカーが一度も読み込まない）
 MODEL_ONNX = os.path.join(os.path.dirname(__file__), "model_lgbm.onnx")
 MODEL_META = os.path.join(os.path.dirname(__file__), "model_lgbm.meta.json")
+LEGACY_FEATURES = ["dow", "hour", "area_id"]
+RELOAD_CHECK_SEC = 30  # モデル / 特徴量ストアのファイルが差し替わったかを見る間隔
 
 
 class LgbmPredictor:
     """
     ONNX LightGBM 推論（lazy-load）
-    - predict_for_all(dow:int, hour:int) -> {slug: float_hourly}
+    - predict_for_all(dow:int, hour:int, day:date=None) -> {slug: float_hourly}
+    特徴量は学習と同じ FeatureStore.matrix() で作る（meta の feature_order 順）。
+    train_lgbm / refresh_features がファイルを差し替えたら（mtime が変わったら）読み直す。
     """
     _session = None
     _slug_list = None
+    _feature_order = None
+    _store = None
+    _stamp = None
+    _checked_at = 0.0
 
     @classmethod
     def available(cls) -> bool:
-        return ort is not None and os.path.exists(MODEL_ONNX) and os.path.exists(MODEL_META)
+        return (os.path.exists(MODEL_ONNX) and os.path.exists(MODEL_META)
+                and importlib.util.find_spec("onnxruntime") is not None)
+
+    @staticmethod
+    def _files_stamp() -> tuple:
+        from core.ml.features import STORE_PATH
+        return tuple(os.stat(p).st_mtime_ns if os.path.exists(p) else None
+                     for p in (MODEL_ONNX, MODEL_META, STORE_PATH))
 
     @classmethod
     def _ensure_loaded(cls):
+        now = time.monotonic()
         if cls._session is not None:
-            return
+            if now - cls._checked_at < RELOAD_CHECK_SEC:
+                return
+            cls._checked_at = now
+            if cls._files_stamp() == cls._stamp:
+                return
         if not cls.available():
             raise RuntimeError("ONNX model or meta not available")
+        import onnxruntime as ort
+        from core.ml.features import STORE_PATH, FeatureStore
+
+        stamp = cls._files_stamp()  # 読む前に取る（読んでいる間の差し替えは次の確認で拾う）
         with open(MODEL_META, "r", encoding="utf-8") as f:
             meta = json.load(f)
-        cls._slug_list = meta["area_slugs"]
+        slug_list = meta["area_slugs"]
+        feature_order = meta.get("feature_order", LEGACY_FEATURES)
+        if os.path.exists(STORE_PATH):
+            store = FeatureStore.load(STORE_PATH)
+        elif feature_order != LEGACY_FEATURES:
+            raise RuntimeError("feature store not available")
+        else:
+            today = datetime.date.today()
+            store = FeatureStore.empty(today, today, slug_list)
+        if store.slugs != slug_list:
+            raise RuntimeError("feature store areas do not match the model")
         providers = ["CPUExecutionProvider"]
-        cls._session = ort.InferenceSession(MODEL_ONNX, providers=providers)
+        session = ort.InferenceSession(MODEL_ONNX, providers=providers)
+        cls._session, cls._slug_list, cls._feature_order, cls._store = session, slug_list, feature_order, store
+        cls._stamp, cls._checked_at = stamp, now
 
     @classmethod
-    def predict_for_all(cls, dow: int, hour: int) -> dict:
+    def reload(cls):
+        """次の予測で読み直す（通常はファイルの mtime で自動的に読み直す）。"""
+        cls._session = cls._store = cls._stamp = None
+
+    @staticmethod
+    def _day_for(dow: int) -> datetime.date:
+        """day 未指定時：今日以前で直近の曜日 dow の日。"""
+        today = datetime.date.today()
+        return today - datetime.timedelta(days=(today.weekday() - dow) % 7)
+
+    @classmethod
+    def predict_for_all(cls, dow: int, hour: int, day: datetime.date = None) -> dict:
         """
         すべてのエリア slug に対して予測値（円/h）を返す。
         """
         cls._ensure_loaded()
-        slugs = cls._slug_list
-        area_ids = np.arange(len(slugs), dtype=np.float32)
-
-        X = np.stack([
-            np.full_like(area_ids, float(dow), dtype=np.float32),
-            np.full_like(area_ids, float(hour), dtype=np.float32),
-            area_ids.astype(np.float32)
-        ], axis=1)
+        day = day or cls._day_for(dow)
+        X = cls._store.inference_matrix(day, hour, cls._feature_order)
 
         outputs = cls._session.run(None, {"x": X})[0].reshape(-1)
         result = {}
-        for i, slug in enumerate(slugs):
+        for i, slug in enumerate(cls._slug_list):
             if slug in AREAS_BY_SLUG:
                 result[slug] = float(outputs[i])
         return result
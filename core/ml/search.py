@@ -0,0 +1,139 @@
+# core/ml/search.py
+"""
+LightGBM のハイパーパラメータ探索（train_lgbm --search）。
+- 時系列の fold（expanding window）で評価。各 fold は検証側で early stopping
+- 学習データは一時ディレクトリの .npy に書き、ワーカーは mmap で読む（pickle コピーしない）
+- 試行はプロセスプールで並列。各モデルは n_jobs=1（コア数はプール側で使う）
+"""
+import itertools
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+DEFAULT_SPACE = {
+    "learning_rate": [0.03, 0.1],
+    "num_leaves": [15, 31, 63],
+    "min_child_samples": [10, 40],
+    "colsample_bytree": [0.8, 1.0],
+}
+BASE_PARAMS = {
+    "n_estimators": 2000,  # 上限。実際の本数は early stopping で決まる
+    "max_depth": -1,
+    "subsample": 0.9,
+    "subsample_freq": 1,
+    "metric": "l1",
+    "n_jobs": 1,
+    "verbose": -1,
+}
+LEADERBOARD_NAME = "lgbm_leaderboard.json"  # 既定の出力先はモデル（core/ml/model_lgbm.onnx）と同じディレクトリ
+
+# ワーカープロセス内の共有データ（initializer で mmap を開く）
+_DATA = {}
+
+
+def load_space(path: str = None) -> dict:
+    """{param: [候補, ...]}。path 無しなら DEFAULT_SPACE。"""
+    if not path:
+        return DEFAULT_SPACE
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def expand_grid(space: dict) -> list:
+    keys = sorted(space)
+    return [dict(zip(keys, vals)) for vals in itertools.product(*(space[k] for k in keys))]
+
+
+def time_folds(day_idx: np.ndarray, n_folds: int) -> list:
+    """
+    日付順に (n_folds + 1) ブロックへ分け、fold k は ブロック[0..k] で学習・ブロック[k+1] で検証。
+    戻り値: [(train_idx, val_idx), ...]
+    """
+    days = np.unique(day_idx)
+    if len(days) < n_folds + 1:
+        raise ValueError(f"日数 {len(days)} が fold 数 {n_folds} に対して少なすぎます")
+    edges = np.array_split(days, n_folds + 1)
+    folds = []
+    for k in range(n_folds):
+        cut, end = edges[k + 1][0], edges[k + 1][-1]
+        train = np.flatnonzero(day_idx < cut)
+        val = np.flatnonzero((day_idx >= cut) & (day_idx <= end))
+        folds.append((train, val))
+    return folds
+
+
+# ---------- 共有データ ----------
+def dump_shared(X, y, w, day_idx, dirpath: str) -> dict:
+    paths = {}
+    for name, arr in (("X", X), ("y", y), ("w", w), ("day_idx", day_idx)):
+        paths[name] = os.path.join(dirpath, f"{name}.npy")
+        np.save(paths[name], np.ascontiguousarray(arr))
+    return paths
+
+
+def _init_worker(paths: dict, n_folds: int):
+    for name, p in paths.items():
+        _DATA[name] = np.load(p, mmap_mode="r")
+    _DATA["folds"] = time_folds(np.asarray(_DATA["day_idx"]), n_folds)
+
+
+def _run_trial(args):
+    """1試行 = 全 fold を学習・評価。戻り値は leaderboard の1行。"""
+    trial_id, params, early_stopping_rounds, seed = args
+    import lightgbm as lgb
+    from sklearn.metrics import mean_absolute_error
+
+    X, y, w = _DATA["X"], _DATA["y"], _DATA["w"]
+    t0 = time.perf_counter()
+    maes, iters = [], []
+    for train, val in _DATA["folds"]:
+        model = lgb.LGBMRegressor(**{**BASE_PARAMS, **params, "random_state": seed})
+        model.fit(
+            X[train], y[train], sample_weight=w[train],
+            eval_set=[(X[val], y[val])], eval_sample_weight=[w[val]],
+            callbacks=[lgb.early_stopping(early_stopping_rounds, verbose=False)],
+        )
+        pred = model.predict(X[val], num_iteration=model.best_iteration_)
+        maes.append(float(mean_absolute_error(y[val], pred, sample_weight=w[val])))
+        iters.append(int(model.best_iteration_ or model.n_estimators))
+    return {
+        "trial": trial_id,
+        "params": params,
+        "mae": float(np.mean(maes)),
+        "fold_mae": maes,
+        "best_iterations": iters,
+        "n_estimators": int(round(np.mean(iters))),
+        "wall_s": time.perf_counter() - t0,
+        "pid": os.getpid(),
+    }
+
+
+# ---------- 探索本体 ----------
+def run_search(X, y, w, day_idx, space: dict, n_folds: int = 3, workers: int = None,
+               early_stopping_rounds: int = 50, seed: int = 42) -> list:
+    """グリッド全体を評価し、MAE 昇順の leaderboard（dict のリスト）を返す。"""
+    workers = workers or os.cpu_count() or 1
+    trials = [(i, p, early_stopping_rounds, seed) for i, p in enumerate(expand_grid(space))]
+    with tempfile.TemporaryDirectory(prefix="lgbm_search_") as tmp:
+        paths = dump_shared(X, y, w, day_idx, tmp)
+        if workers == 1:
+            _init_worker(paths, n_folds)
+            results = [_run_trial(t) for t in trials]
+            _DATA.clear()
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(paths, n_folds)) as pool:
+                results = list(pool.map(_run_trial, trials))
+    results.sort(key=lambda r: r["mae"])
+    for rank, r in enumerate(results, 1):
+        r["rank"] = rank
+    return results
+
+
+def write_leaderboard(results: list, path: str, meta: dict = None):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({**(meta or {}), "trials": results}, f, ensure_ascii=False, indent=2)
@@ -1,7 +1,30 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator
 
+
+# --- 0. 差分同期の共通部分（core.sync） ---
+class SyncTracked(models.Model):
+    """
+    保存のたびに持ち主ユーザーの変更番号（SyncState.seq）を1つ進めて sync_seq に入れる。
+    番号の確保と行の保存を同じトランザクションにして、同じユーザーの変更が番号順にコミットされるようにする。
+    bulk_create / QuerySet.update() は通らない（core.sync.stamp_bulk を使う）。
+    """
+    updated_at = models.DateTimeField(auto_now=True)
+    sync_seq = models.BigIntegerField(default=0, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        from .sync import next_seq
+        with transaction.atomic():
+            self.sync_seq = next_seq(self.user_id)
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "sync_seq", "updated_at"}
+            super().save(*args, **kwargs)
+
 # --- 1. ユーザー ---
 class User(AbstractUser):
     nickname = models.CharField(max_length=50, blank=True, null=True)
@@ -12,7 +35,7 @@ class User(AbstractUser):
 
 
 # --- 2. 配達実績 ---
-class DeliveryRecord(models.Model):
+class DeliveryRecord(SyncTracked):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="delivery_records")
     date = models.DateField()
     orders_completed = models.PositiveIntegerField(validators=[MinValueValidator(0)], default=0)
@@ -30,13 +53,17 @@ class DeliveryRecord(models.Model):
 
     class Meta:
         unique_together = ("user", "date")
+        indexes = [
+            models.Index(fields=["-date", "-id"], name="deliveryrecord_date_idx"),
+            models.Index(fields=["user", "sync_seq"], name="deliveryrecord_sync_idx"),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.date}"
 
 
 # --- 3. 入口共有 ---
-class EntranceInfo(models.Model):
+class EntranceInfo(SyncTracked):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="entrances")
     address = models.CharField(max_length=255)
     latitude = models.FloatField(blank=True, null=True)
@@ -46,13 +73,30 @@ class EntranceInfo(models.Model):
     photo2 = models.ImageField(upload_to="entrances/", blank=True, null=True)
     photo3 = models.ImageField(upload_to="entrances/", blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # 検索用（core.entrance_search）。保存時に address / note から作る
+    address_key = models.CharField(max_length=255, blank=True, default="", editable=False)
+    search_text = models.TextField(blank=True, default="", editable=False)
+
+    class Meta:
+        indexes = [models.Index(fields=["user", "sync_seq"], name="entranceinfo_sync_idx")]
 
     def __str__(self):
         return f"Entrance - {self.address}"
 
+    def refresh_search_keys(self):
+        from .entrance_search import search_keys
+        self.address_key, self.search_text = search_keys(self.address, self.note)
+
+    def save(self, *args, **kwargs):
+        self.refresh_search_keys()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"address", "note"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "address_key", "search_text"}
+        super().save(*args, **kwargs)
+
 
 # --- 4. OCRインポート履歴 ---
-class OcrImport(models.Model):
+class OcrImport(SyncTracked):
     STATUS_CHOICES = (("success", "success"), ("failed", "failed"))
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="ocr_imports")
     image = models.ImageField(upload_to="ocr/")
@@ -63,7 +107,207 @@ class OcrImport(models.Model):
     )
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="success")
     message = models.TextField(blank=True, null=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["user", "sync_seq"], name="ocrimport_sync_idx")]
 
     def __str__(self):
         return f"OCR #{self.id} by {self.user.username}"
+
+
+# --- 5. AI学習への同意 ---
+class UserAiConsent(models.Model):
+    """集計データを予測モデルの学習に使ってよいか。行が無いユーザーは不同意扱い。"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="ai_consent")
+    share_aggregated = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def save(self, *args, **kwargs):
+        # 切り替えをヒートマップの集計済みセルへ反映する処理（signals → core.heat.consent_changed）と同じトランザクションにする
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.user_id} share={self.share_aggregated}"
+
+
+# --- 6. アーカイブ（90日より古いデータの月次圧縮保管） ---
+class ArchiveChunk(models.Model):
+    """
+    (種別, ユーザー, 月) 単位で古い行を gzip 圧縮 JSON Lines として保持する。
+    読み出しは core.archive.delivery_history() 経由で透過的に行う。
+    """
+    KIND_CHOICES = (("delivery", "delivery"), ("ocr", "ocr"))
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="archive_chunks")
+    month = models.DateField()  # 月初日
+    row_count = models.PositiveIntegerField(default=0)
+    payload = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("kind", "user", "month")
+
+    def __str__(self):
+        return f"{self.kind} {self.user_id} {self.month:%Y-%m} ({self.row_count})"
+
+
+class DeliveryMonthlyStat(models.Model):
+    """アーカイブ済み DeliveryRecord の月次集計（ユーザー×月×エリア）。"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="monthly_stats")
+    month = models.DateField()
+    area_slug = models.CharField(max_length=64, blank=True, default="")
+    records = models.PositiveIntegerField(default=0)
+    orders_completed = models.PositiveIntegerField(default=0)
+    earnings = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    hours_worked = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ("user", "month", "area_slug")
+
+    def __str__(self):
+        return f"{self.user_id} {self.month:%Y-%m} {self.area_slug or '-'}"
+
+
+# --- 7. ライブ統計のチェックポイント ---
+class LiveCheckpoint(models.Model):
+    """core.live の状態（エリア×時間帯の加重和）と、どの DeliveryRecord まで反映したか。"""
+    name = models.CharField(max_length=32, unique=True)
+    day = models.DateField()
+    last_id = models.BigIntegerField(default=0)
+    gaps = models.JSONField(default=list, blank=True)  # last_id より下でまだ読めていない id（core.tail）
+    payload = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} {self.day} last_id={self.last_id}"
+
+
+# --- 8. ヒートマップの集計ピラミッド ---
+class HeatCell(models.Model):
+    """
+    core.heat のグリッドセル（ズーム z、全体座標 cx, cy）ごとの合計。
+    最大ズームで集計し、親セル (cx >> 1, cy >> 1) へ順に足し上げて全ズームを持つ。
+    """
+    z = models.PositiveSmallIntegerField()
+    cx = models.IntegerField()
+    cy = models.IntegerField()
+    records = models.PositiveIntegerField(default=0)
+    hours = models.FloatField(default=0)
+    earnings = models.FloatField(default=0)
+    entrances = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        # タイル取得は (z, cy 範囲, cx 範囲) の範囲走査
+        unique_together = ("z", "cy", "cx")
+
+    def __str__(self):
+        return f"z{self.z} ({self.cx},{self.cy}) rec={self.records} ent={self.entrances}"
+
+
+class HeatCursor(models.Model):
+    """core.heat の増分集計の位置（records / entrances の最終 id と欠番、core.tail）と世代番号。"""
+    name = models.CharField(max_length=32, unique=True)
+    value = models.BigIntegerField(default=0)
+    gaps = models.JSONField(default=list, blank=True)  # [[id, 欠番と見た時刻], ...]
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}={self.value}"
+
+
+# --- 9. ユーザー別の予測補正 ---
+class UserCalibration(models.Model):
+    """core.calibration の残差統計（エリア別・時間帯別）と補正グリッド（エリア×24時間）。"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="calibration")
+    payload = models.BinaryField()
+    hours = models.FloatField(default=0)  # 反映済みの稼働時間（h）
+    model_version = models.CharField(max_length=64, blank=True, default="")  # 残差を計算したときの共有予測
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user_id} hours={self.hours:.1f}"
+
+
+class CalibrationResidual(models.Model):
+    """記録1件が補正に足した分（エリア, 時, 按分時間, 残差）。編集・削除ではこの値をそのまま引く。"""
+    record_id = models.BigIntegerField(primary_key=True)  # FK にしない（記録の削除後に引くため）
+    user_id = models.BigIntegerField(db_index=True)
+    payload = models.BinaryField()
+
+    def __str__(self):
+        return f"record {self.record_id} (user {self.user_id})"
+
+
+# --- 10. 時給の分位スケッチ（順位表示用） ---
+class EarningsSketch(models.Model):
+    """
+    core.rankings の (エリア, 曜日, 時間帯) ごとの 円/h の t-digest（core.tdigest）。
+    同意ユーザーの記録を時間帯ごとに按分し、稼働時間で重み付けしたもの。
+    """
+    area_slug = models.CharField(max_length=64)
+    dow = models.PositiveSmallIntegerField()   # 0=月 … 6=日
+    band = models.PositiveSmallIntegerField()  # calibration.HOUR_BANDS の番号
+    payload = models.BinaryField()
+    hours = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("area_slug", "dow", "band")
+
+    def __str__(self):
+        return f"{self.area_slug} dow={self.dow} band={self.band} hours={self.hours:.1f}"
+
+
+class EarningsSample(models.Model):
+    """
+    core.rankings のスケッチの元：記録ごと・バケットごとの (円/h, 時間)。同意に関係なく全記録の分を持つ。
+    記録の編集・削除はこの行を差し替え / 消すだけで、スケッチは RankingDirty を見て build_rankings が作り直す。
+    """
+    record_id = models.BigIntegerField(db_index=True)  # 記録が消えても行を残さないよう signals で消す（FK にしない）
+    user_id = models.BigIntegerField(db_index=True)
+    area_slug = models.CharField(max_length=64)
+    dow = models.PositiveSmallIntegerField()
+    band = models.PositiveSmallIntegerField()
+    yen = models.FloatField()
+    hours = models.FloatField()
+
+    class Meta:
+        indexes = [models.Index(fields=["area_slug", "dow", "band"])]
+
+
+class RankingDirty(models.Model):
+    """作り直しが要るバケット（保存時は追記するだけ。core.rankings.build が読んで消す）。"""
+    area_slug = models.CharField(max_length=64)
+    dow = models.PositiveSmallIntegerField()
+    band = models.PositiveSmallIntegerField()
+
+
+# --- 11. 差分同期（/api/sync） ---
+class SyncState(models.Model):
+    """
+    ユーザーごとの変更番号の最大値と、削除済み（prune 済み）の tombstone の最大番号。
+    ユーザー削除の CASCADE 中にも書くので User への FK にはしない（User の post_delete で消す）。
+    """
+    user_id = models.BigIntegerField(primary_key=True)
+    seq = models.BigIntegerField(default=0)
+    pruned_seq = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user_id} seq={self.seq} pruned={self.pruned_seq}"
+
+
+class SyncTombstone(models.Model):
+    """削除された DeliveryRecord / EntranceInfo / OcrImport の id と、削除時の変更番号。"""
+    user_id = models.BigIntegerField()
+    kind = models.CharField(max_length=16)
+    object_id = models.BigIntegerField()
+    seq = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["user_id", "seq"], name="synctombstone_seq_idx")]
+
+    def __str__(self):
+        return f"{self.kind} #{self.object_id} (user {self.user_id}, seq {self.seq})"
@@ -0,0 +1,176 @@
+# core/page_data.py
+"""
+テンプレート共通の DN_DATA（areas / ward_pos / plan / records）を組み立てる。
+部品ごとに寿命が違うので別々にキャッシュし、JSON 文字列のまま連結する。
+- ward_pos   : エリア定義から。プロセス生存中は不変
+- areas/plan : 現在時刻の予測。次の30分境界まで（plan が30分刻みのため）
+- records    : ユーザーごとの最近の記録。書き込み時に signals で破棄
+- personal   : ログインユーザー向けの補正後の現在時刻の予測（core.calibration）。共有予測＋補正グリッドの足し算のみ
+予測（forecast_for）・エリア平均（_historical_rates）も含め、キャッシュは core.singleflight 経由
+（シフト開始時に全ワーカーが同じ計算を同時にしない）。
+"""
+import datetime
+import json
+import re
+
+from django.db.models import Sum
+from django.utils import timezone
+
+from . import singleflight
+from .areas import AREAS, AREA_INDEX
+from .consent import with_ai_consent
+from .models import DeliveryRecord
+
+RECENT_RECORDS = 20
+PLAN_SLOTS = 6          # 30分刻み × 6 = 3時間
+RECORDS_TTL_SEC = 24 * 3600
+FORECAST_TTL_SEC = 30 * 60
+STATS_TTL_SEC = 10 * 60     # 過去90日のエリア平均。古くても害は小さいので stale を長めに
+STATS_STALE_SEC = 3600
+AREA_TAG_RE = re.compile(r"^\[AREA:[^\]]+\]\s*")
+
+# json_script と同じく </script> などを閉じさせないためのエスケープ
+_JSON_ESCAPES = {ord("<"): "\\u003C", ord(">"): "\\u003E", ord("&"): "\\u0026"}
+
+
+def to_json(value) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str).translate(_JSON_ESCAPES)
+
+
+# ---------- 不変部分 ----------
+WARD_POS = {a["name"]: [a["lat"], a["lng"]] for a in AREAS}
+_WARD_POS_JSON = to_json(WARD_POS)
+
+
+# ---------- 予測（30分境界まで） ----------
+def _seconds_to_next_hour(now) -> int:
+    nxt = now.replace(minute=0, second=0, microsecond=0) + datetime.timedelta(hours=1)
+    return max(1, int((nxt - now).total_seconds()))
+
+
+def _compute_historical_rates() -> dict:
+    since = timezone.localdate() - datetime.timedelta(days=90)
+    # 共有の予測に使うので同意ユーザーの記録だけ（学習データと同じ扱い）
+    rows = (with_ai_consent(DeliveryRecord.objects.filter(date__gte=since, hours_worked__gt=0, area_slug__isnull=False))
+            .values("area_slug").annotate(earn=Sum("earnings"), hours=Sum("hours_worked")))
+    return {r["area_slug"]: float(r["earn"]) / float(r["hours"]) for r in rows if r["hours"]}
+
+
+def _historical_rates() -> dict:
+    """モデルが無いときの代替：直近90日のエリア別 平均円/h。"""
+    return singleflight.get_or_compute(f"dn:stats:rates90:{timezone.localdate():%Y%m%d}",
+                                       _compute_historical_rates, STATS_TTL_SEC, STATS_STALE_SEC)
+
+
+def _compute_forecast(day: datetime.date, hour: int) -> dict:
+    try:
+        from .ml.predictor import LgbmPredictor
+        if LgbmPredictor.available():
+            return LgbmPredictor.predict_for_all(day.weekday(), hour, day=day)
+    except ImportError:
+        pass  # numpy / onnxruntime 未インストール
+    return _historical_rates()
+
+
+def forecast_for(day: datetime.date, hour: int) -> dict:
+    """{slug: 円/h}。ONNX モデルがあればそれを、無ければ過去平均を使う。"""
+    return singleflight.get_or_compute(f"dn:forecast_for:{day:%Y%m%d}:{hour}",
+                                       lambda: _compute_forecast(day, hour), FORECAST_TTL_SEC)
+
+
+def _areas_payload(rates: dict) -> list:
+    return [
+        {"slug": a["slug"], "area": a["name"], "center": [a["lat"], a["lng"]],
+         "wage_per_h": round(rates[a["slug"]]) if a["slug"] in rates else None}
+        for a in AREAS
+    ]
+
+
+def _plan_payload(now, rates_by_hour: dict) -> list:
+    start = now.replace(minute=0 if now.minute < 30 else 30, second=0, microsecond=0)
+    plan, prev = [], None
+    for i in range(PLAN_SLOTS):
+        t = start + datetime.timedelta(minutes=30 * i)
+        rates = rates_by_hour.get(t.hour) or {}
+        if not rates:
+            continue
+        slug = max(rates, key=rates.get)
+        a = AREA_INDEX.get(slug)
+        if a is None:
+            continue
+        plan.append({
+            "time": t.strftime("%H:%M"), "area": a["name"],
+            "to": a["name"] if prev and prev != a["name"] else None,
+            "wage_per_h": round(rates[slug]), "center": [a["lat"], a["lng"]],
+        })
+        prev = a["name"]
+    return plan
+
+
+def forecast_json(now=None) -> tuple:
+    """(areas_json, plan_json)。次の30分境界までキャッシュ。"""
+    now = timezone.localtime(now)
+    key = f"dn:forecast:{now:%Y%m%d%H}:{now.minute // 30}"
+
+    def compute():
+        rates_by_hour = {}
+        for i in range(PLAN_SLOTS // 2 + 1):
+            t = now + datetime.timedelta(hours=i)
+            rates_by_hour[t.hour] = forecast_for(t.date(), t.hour)
+        return (to_json(_areas_payload(rates_by_hour[now.hour])), to_json(_plan_payload(now, rates_by_hour)))
+
+    # キーが30分ごとに変わるので stale は使わない（境界をまたいだ古い予測は出さない）
+    ttl = min(_seconds_to_next_hour(now), max(1, (30 - now.minute % 30) * 60 - now.second))
+    return singleflight.get_or_compute(key, compute, ttl, stale_ttl=0)
+
+
+# ---------- ユーザーの記録（書き込みで破棄） ----------
+def _records_key(user_id) -> str:
+    return f"dn:records:{user_id}"
+
+
+def records_json(user_id) -> str:
+    if not user_id:
+        return "[]"
+    return singleflight.get_or_compute(_records_key(user_id), lambda: _compute_records(user_id),
+                                       RECORDS_TTL_SEC, stale_ttl=0)
+
+
+def _compute_records(user_id) -> str:
+    rows = (DeliveryRecord.objects.filter(user_id=user_id)
+            .order_by("-date", "-start_time")
+            .values("date", "start_time", "area_slug", "note", "earnings")[:RECENT_RECORDS])
+    recs = []
+    for r in rows:
+        a = AREA_INDEX.get(r["area_slug"] or "")
+        dt = r["date"].isoformat() + (f" {r['start_time']:%H:%M}" if r["start_time"] else "")
+        recs.append({
+            "dt": dt, "area": a["name"] if a else (r["area_slug"] or "—"),
+            "note": AREA_TAG_RE.sub("", r["note"] or ""), "earnings": float(r["earnings"]),
+        })
+    return to_json(recs)
+
+
+def invalidate_records(user_id):
+    singleflight.invalidate(_records_key(user_id))
+
+
+# ---------- ユーザー別の補正 ----------
+def personal_json(user_id, now=None) -> str:
+    """{slug: 補正後の円/h}。補正の無いユーザーは null。"""
+    from .calibration import adjustment, personalize
+    grid = adjustment(user_id)
+    if grid is None:
+        return "null"
+    now = timezone.localtime(now)
+    rates = personalize(forecast_for(now.date(), now.hour), grid, now.hour)
+    return to_json({slug: round(v) for slug, v in rates.items()})
+
+
+# ---------- 組み立て ----------
+def dn_data_json(user=None, now=None) -> str:
+    areas, plan = forecast_json(now)
+    user_id = user.pk if (user is not None and user.is_authenticated) else None
+    return ('{"areas":' + areas + ',"ward_pos":' + _WARD_POS_JSON
+            + ',"plan":' + plan + ',"records":' + records_json(user_id)
+            + ',"personal":' + personal_json(user_id, now) + "}")
@@ -0,0 +1,225 @@
+# core/rankings.py
+"""
+「あなたの円/h は 渋谷・平日の夕方で上位 20%」を出すための分位スケッチ。
+- 分布は同意ユーザーの記録の円/h。時間帯ごとに按分し、稼働時間で重み付け（calibration.hourly_portions）
+- バケットは (エリア, 曜日, 時間帯 calibration.HOUR_BANDS)。各バケットに t-digest（core.tdigest）を1つ
+  EarningsSketch に持つ（8×7×6 = 336 行、1行 約 1KB）
+- t-digest は引き算できないので、記録ごと・バケットごとの (円/h, 時間) を EarningsSample に持ち、
+  スケッチはそこから作る。保存・編集・削除（signals）はサンプルを差し替え / 消して、関係するバケットを
+  RankingDirty に追記するだけ（共有行のロックも t-digest の再エンコードも保存経路に載せない）。
+  同意の切り替え・ユーザー削除もそのユーザーのバケットを積む
+- build()（manage.py build_rankings、run_jobs の定期ジョブ）が積まれたバケットを同意ユーザーの
+  サンプルから作り直す。rebuild() はサンプルごと全部作り直す（bulk_create で入れた記録の反映など）
+- 「平日」「全エリア」などの粗いまとまりは該当バケットのスケッチをマージして作り、
+  core.singleflight で RANK_TTL_SEC キャッシュする（リクエストごとに全記録を並べ替えない）
+- 本人の値はその人の記録から同じ按分で出す（同じまとまり・全期間の加重平均）
+"""
+import math
+
+from django.db import transaction
+
+from . import singleflight
+from .calibration import BAND_OF_HOUR, HOUR_BANDS, RECORD_FIELDS, SLOT, SLUGS, hourly_portions
+from .consent import with_ai_consent
+from .models import DeliveryRecord, EarningsSample, EarningsSketch, RankingDirty
+from .tdigest import TDigest
+
+BAND_NAMES = ("late_night", "morning", "lunch", "afternoon", "evening", "night")  # HOUR_BANDS と同じ順
+DOW_GROUPS = {"weekday": (0, 1, 2, 3, 4), "weekend": (5, 6), "all": tuple(range(7))}
+ALL = "all"
+MIN_HOURS = 20.0       # まとまり全体でこれ未満の稼働時間しか無ければ順位を出さない
+RANK_TTL_SEC = 600
+DIRTY_BATCH = 5000     # build() が1回に読む RankingDirty の行数
+QUANTILES = (0.25, 0.5, 0.75, 0.9)
+
+assert len(BAND_NAMES) == len(HOUR_BANDS)
+
+
+def bucket_of(r: dict, hour: int) -> tuple:
+    return r["area_slug"], r["date"].weekday(), BAND_OF_HOUR[hour]
+
+
+# ---------- まとまりの指定 ----------
+def parse_group(area: str = ALL, dow: str = ALL, band: str = ALL) -> tuple:
+    """クエリ文字列 → (エリア slug の組, 曜日の組, 時間帯番号の組)。不正なら ValueError。"""
+    area, dow, band = (area or ALL), (dow or ALL), (band or ALL)
+    if area == ALL:
+        areas = tuple(SLUGS)
+    elif area in SLOT:
+        areas = (area,)
+    else:
+        raise ValueError(f"unknown area: {area}")
+    if dow in DOW_GROUPS:
+        dows = DOW_GROUPS[dow]
+    elif dow.isdigit() and int(dow) < 7:
+        dows = (int(dow),)
+    else:
+        raise ValueError("dow must be 0..6 (0=Mon), weekday, weekend or all")
+    if band == ALL:
+        bands = tuple(range(len(HOUR_BANDS)))
+    elif band in BAND_NAMES:
+        bands = (BAND_NAMES.index(band),)
+    else:
+        raise ValueError(f"band must be one of {', '.join(BAND_NAMES)} or all")
+    return areas, dows, bands
+
+
+def _in_group(group: tuple, bucket: tuple) -> bool:
+    return bucket[0] in group[0] and bucket[1] in group[1] and bucket[2] in group[2]
+
+
+# ---------- サンプル ----------
+def sample_values(r: dict) -> list:
+    """記録1件 → バケットごとの EarningsSample のフィールド（円/h は記録の中で一定なので時間だけ足す）。"""
+    acc = {}
+    for h, portion, yen in hourly_portions(r):
+        b = bucket_of(r, h)
+        if b in acc:
+            acc[b][1] += portion
+        else:
+            acc[b] = [yen, portion]
+    return [{"record_id": r["id"], "user_id": r["user_id"], "area_slug": slug, "dow": dow, "band": band,
+             "yen": yen, "hours": w} for (slug, dow, band), (yen, w) in acc.items()]
+
+
+def _buckets(qs) -> list:
+    return list(qs.order_by().values_list("area_slug", "dow", "band").distinct())
+
+
+def _mark_dirty(buckets):
+    RankingDirty.objects.bulk_create([RankingDirty(area_slug=slug, dow=dow, band=band)
+                                      for slug, dow, band in sorted(set(buckets))])
+
+
+def record_changed(r: dict, created: bool = False):
+    """保存された記録のサンプルを差し替え、前後のバケットを作り直し待ちにする。"""
+    rows = [EarningsSample(**v) for v in sample_values(r)]
+    with transaction.atomic():
+        buckets = [(s.area_slug, s.dow, s.band) for s in rows]
+        if not created:
+            old = EarningsSample.objects.filter(record_id=r["id"])
+            buckets += _buckets(old)
+            old.delete()
+        EarningsSample.objects.bulk_create(rows)
+        _mark_dirty(buckets)
+
+
+def records_removed(record_ids):
+    with transaction.atomic():
+        qs = EarningsSample.objects.filter(record_id__in=record_ids)
+        _mark_dirty(_buckets(qs))
+        qs.delete()
+
+
+def user_changed(user_id):
+    """同意の切り替え：そのユーザーのサンプルがあるバケットを作り直し待ちにする。"""
+    _mark_dirty(_buckets(EarningsSample.objects.filter(user_id=user_id)))
+
+
+def user_removed(user_id):
+    with transaction.atomic():
+        qs = EarningsSample.objects.filter(user_id=user_id)
+        _mark_dirty(_buckets(qs))
+        qs.delete()
+
+
+# ---------- スケッチ ----------
+def _rebuild_buckets(buckets) -> int:
+    """バケットごとに同意ユーザーのサンプルから t-digest を作り直す（サンプルが無くなったバケットは消す）。"""
+    for slug, dow, band in buckets:
+        td = TDigest()
+        qs = with_ai_consent(EarningsSample.objects.filter(area_slug=slug, dow=dow, band=band))
+        for yen, w in qs.order_by("id").values_list("yen", "hours").iterator(chunk_size=5000):
+            td.add(yen, w)
+        if td.total:
+            EarningsSketch.objects.update_or_create(area_slug=slug, dow=dow, band=band,
+                                                    defaults={"payload": td.to_bytes(), "hours": td.total})
+        else:
+            EarningsSketch.objects.filter(area_slug=slug, dow=dow, band=band).delete()
+    return len(buckets)
+
+
+def build(log=None) -> int:
+    """
+    RankingDirty に積まれたバケットを作り直す。作り直したバケット数。
+    読んだ行だけを消す（id の範囲で消すと、遅れてコミットされた小さい id の行を読まずに消してしまう）。
+    """
+    n = 0
+    while True:
+        dirty = list(RankingDirty.objects.order_by("id").values_list("id", "area_slug", "dow", "band")[:DIRTY_BATCH])
+        if not dirty:
+            return n
+        n += _rebuild_buckets(sorted({d[1:] for d in dirty}))
+        RankingDirty.objects.filter(id__in=[d[0] for d in dirty]).delete()
+        if log:
+            log(f"  {n:,} buckets")
+
+
+def rebuild(log=None) -> int:
+    """保存済みの記録からサンプルと全バケットを作り直す。バケット数。"""
+    with transaction.atomic():
+        EarningsSample.objects.all().delete()
+        RankingDirty.objects.all().delete()
+        rows, n = [], 0
+        records = DeliveryRecord.objects.filter(area_slug__in=SLUGS).order_by().values(*RECORD_FIELDS)
+        for r in records.iterator(chunk_size=5000):
+            rows += [EarningsSample(**v) for v in sample_values(r)]
+            if len(rows) >= 5000:
+                EarningsSample.objects.bulk_create(rows)
+                rows = []
+            n += 1
+            if log and n % 100_000 == 0:
+                log(f"  {n:,} records")
+        EarningsSample.objects.bulk_create(rows)
+        EarningsSketch.objects.all().delete()
+        return _rebuild_buckets(sorted(_buckets(EarningsSample.objects.all())))
+
+
+# ---------- 参照 ----------
+def _group_key(group: tuple) -> str:
+    areas, dows, bands = group
+    return "dn:rank:%s:%s:%s" % ("all" if len(areas) == len(SLUGS) else ",".join(areas),
+                                 "".join(map(str, dows)), "".join(map(str, bands)))
+
+
+def merged(group: tuple) -> TDigest:
+    """まとまりに含まれるバケットのスケッチをマージしたもの。"""
+    areas, dows, bands = group
+    td = TDigest()
+    rows = EarningsSketch.objects.filter(area_slug__in=areas, dow__in=dows, band__in=bands).values_list("payload", flat=True)
+    for payload in rows.iterator():
+        td.merge(TDigest.from_bytes(payload))
+    td.cdf(0)  # 折れ線を作っておく（キャッシュから読んだ側で毎回作らない）
+    return td
+
+
+def group_digest(group: tuple) -> TDigest:
+    return singleflight.get_or_compute(_group_key(group), lambda: merged(group), RANK_TTL_SEC)
+
+
+def user_rate(user_id, group: tuple):
+    """本人のそのまとまりでの 円/h（稼働時間の加重平均）と時間。記録が無ければ (None, 0)。"""
+    areas, _dows, _bands = group
+    rows = DeliveryRecord.objects.filter(user_id=user_id, area_slug__in=areas).values(*RECORD_FIELDS)
+    s = w = 0.0
+    for r in rows.iterator():
+        for h, portion, yen in hourly_portions(r):
+            if _in_group(group, bucket_of(r, h)):
+                s += yen * portion
+                w += portion
+    return (s / w if w else None), w
+
+
+def ranking(group: tuple, yen=None) -> dict:
+    """yen の順位（percentile = それ以下の割合 %、top_percent = 上位何 %）と分布の目安。"""
+    td = group_digest(group)
+    out = {"hours": round(td.total, 1), "yen": None if yen is None else round(yen),
+           "percentile": None, "top_percent": None, "quantiles": None}
+    if td.total < MIN_HOURS:
+        return out
+    out["quantiles"] = {f"p{round(q * 100)}": round(td.quantile(q)) for q in QUANTILES}
+    if yen is not None and math.isfinite(yen):
+        pct = td.cdf(yen) * 100
+        out["percentile"] = round(pct, 1)
+        out["top_percent"] = round(max(0.0, 100 - pct), 1)
+    return out
@@ -1,12 +1,112 @@
 # core/signals.py
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
-from .models import UserAiConsent
+from .models import CalibrationResidual, DeliveryRecord, EntranceInfo, OcrImport, UserAiConsent
+from . import archive, calibration, consent, heat, page_data, rankings, sync
 
 User = get_user_model()
 
 @receiver(post_save, sender=User)
-def create_consent_for_new_user(sender, instance, created, **kwargs):
-    if created:
-        UserAiConsent.objects.get_or_create(user=instance)
+def create_consent_for_new_user(sender, instance, created, raw=False, **kwargs):
+    # 新規作成時は行が無いことが確定しているので get_or_create の SELECT を省く
+    if created and not raw:
+        UserAiConsent.objects.create(user=instance)
+
+
+@receiver(post_save, sender=UserAiConsent)
+@receiver(post_delete, sender=UserAiConsent)
+def invalidate_consent_cache(sender, instance, **kwargs):
+    consent.invalidate(instance.user_id)
+
+
+@receiver(pre_save, sender=UserAiConsent)
+def remember_old_consent(sender, instance, raw=False, **kwargs):
+    # 新規（行が無い＝不同意）は SELECT しない
+    instance._old_share = False if raw or instance.pk is None else bool(
+        UserAiConsent.objects.filter(pk=instance.pk).values_list("share_aggregated", flat=True).first())
+
+
+@receiver(post_save, sender=UserAiConsent)
+def apply_consent_change(sender, instance, raw=False, **kwargs):
+    # 切り替わったときだけ。UserAiConsent.save のトランザクションの中で走る
+    if not raw and instance.share_aggregated != getattr(instance, "_old_share", False):
+        heat.consent_changed(instance.user_id, instance.share_aggregated)
+        rankings.user_changed(instance.user_id)  # スケッチは同意ユーザーのサンプルだけから作り直す
+
+
+@receiver(post_delete, sender=UserAiConsent)
+def apply_consent_removal(sender, instance, **kwargs):
+    # 行が無い＝不同意（ユーザー削除ではサンプルごと clear_ranking_samples で消す）
+    if instance.share_aggregated and not sync.is_deleting(instance.user_id):
+        rankings.user_changed(instance.user_id)
+
+
+@receiver(post_save, sender=DeliveryRecord)
+@receiver(post_delete, sender=DeliveryRecord)
+def invalidate_page_records(sender, instance, **kwargs):
+    page_data.invalidate_records(instance.user_id)
+
+
+@receiver(post_save, sender=DeliveryRecord)
+def update_calibration(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # note だけの編集などは補正に関係しないので何もしない
+    if raw or (update_fields is not None and not calibration.AFFECTING_FIELDS & set(update_fields)):
+        return
+    # 編集は保存してある前回の残差を引いてから足す（旧値を SELECT し直さない）
+    calibration.apply_changes(instance.user_id, added=[calibration.record_fields(instance)],
+                              removed=() if created else [instance.pk])
+
+
+@receiver(post_delete, sender=DeliveryRecord)
+def remove_from_calibration(sender, instance, **kwargs):
+    if sync.is_deleting(instance.user_id):
+        return  # ユーザー削除の CASCADE：残差は clear_calibration_residuals でまとめて消す
+    if archive.is_archiving():
+        return  # アーカイブはバッチごとに core.archive がまとめて引く
+    calibration.apply_changes(instance.user_id, removed=[instance.pk], create=False)
+
+
+@receiver(post_save, sender=DeliveryRecord)
+def update_ranking_samples(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # サンプルの差し替えだけ（スケッチは build_rankings がまとめて作り直す）
+    if raw or (update_fields is not None and not calibration.AFFECTING_FIELDS & set(update_fields)):
+        return
+    rankings.record_changed(calibration.record_fields(instance), created)
+
+
+@receiver(post_delete, sender=DeliveryRecord)
+def remove_ranking_samples(sender, instance, **kwargs):
+    if sync.is_deleting(instance.user_id) or archive.is_archiving():
+        return  # ユーザー削除は clear_ranking_samples、アーカイブは core.archive がまとめて消す
+    rankings.records_removed([instance.pk])
+
+
+@receiver(post_delete, sender=DeliveryRecord)
+@receiver(post_delete, sender=EntranceInfo)
+@receiver(post_delete, sender=OcrImport)
+def leave_sync_tombstone(sender, instance, **kwargs):
+    # アーカイブは同期の削除ではない（端末に残った過去分はそのまま）
+    if not archive.is_archiving():
+        sync.record_deletion(instance)
+
+
+@receiver(pre_delete, sender=User)
+def mark_user_deleting(sender, instance, **kwargs):
+    # CASCADE で消える行に tombstone を作らない（post_delete でまとめて片付ける）
+    sync.user_deleting(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def clear_sync_state(sender, instance, **kwargs):
+    sync.user_deleted(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def clear_calibration_residuals(sender, instance, **kwargs):
+    CalibrationResidual.objects.filter(user_id=instance.pk).delete()
+
+
+@receiver(post_delete, sender=User)
+def clear_ranking_samples(sender, instance, **kwargs):
+    rankings.user_removed(instance.pk)
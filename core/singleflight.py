@@ -0,0 +1,267 @@
+# core/singleflight.py
+"""
+重い計算結果のキャッシュ（stampede 対策）。
+- 2層：プロセス内（CACHES["default"]、locmem）→ ワーカー間共有（CACHES["shared"]、ファイル or DB）
+- 単一実行：同じキーの計算はプロセス内ではスレッド間で1回（後続は先行スレッドの結果を待つ）、
+  プロセス間では共有層のロックを取れた1ワーカーだけが計算し、他は共有層に値が入るのを待つ
+- stale-while-revalidate：期限切れ後 stale_ttl 秒までは古い値を即返し、裏で1回だけ再計算
+- 確率的な早期失効（XFetch）：期限が近いほど・計算が重いほど高い確率で、期限前に裏で再計算
+  （期限ちょうどに全ワーカーが揃って取りこぼすのを避ける）
+- プロセス内の層は LOCAL_MAX_SEC で打ち切る（他ワーカーでの invalidate を長く見逃さない）
+- 共有層が壊れていても計算して返す（キャッシュはあくまで最適化）
+"""
+import hashlib
+import logging
+import math
+import os
+import random
+import threading
+import time
+import uuid
+
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+LOCAL_ALIAS, SHARED_ALIAS = "default", "shared"
+LOCAL_MAX_SEC = 5
+STALE_TTL_SEC = 300
+BETA = 1.0                # XFetch の係数（大きいほど早めに再計算）
+LOCK_TTL_SEC = 30         # ロックを持ったワーカーが落ちても、この秒数で他が引き継ぐ
+WAIT_SEC = 10             # 他ワーカーの計算を待つ上限。超えたら自分で計算する
+POLL_SEC = 0.02
+BACKGROUND = True         # 裏の再計算をスレッドで行う（False だと呼び出し元で同期実行）
+
+_MISSING = object()
+
+
+class _Entry:
+    """キャッシュに入れる封筒：値・作成時刻（壁時計）・有効秒数・計算にかかった秒数。"""
+    __slots__ = ("value", "created", "ttl", "delta")
+
+    def __init__(self, value, created, ttl, delta):
+        self.value, self.created, self.ttl, self.delta = value, created, ttl, delta
+
+    def __getstate__(self):
+        return (self.value, self.created, self.ttl, self.delta)
+
+    def __setstate__(self, state):
+        self.value, self.created, self.ttl, self.delta = state
+
+    @property
+    def expires(self) -> float:
+        return self.created + self.ttl
+
+    def fresh(self, now: float, beta: float) -> bool:
+        """XFetch：now - delta·β·ln(rand) が期限を越えたら（確率的に）期限切れ扱い。"""
+        return now - self.delta * beta * math.log(1.0 - random.random()) < self.expires
+
+
+# ---------- 共有層のロック ----------
+class _SharedLock:
+    """
+    キーごとのプロセス間ロック。FileBasedCache は add() が原子的でないので O_EXCL のロックファイル、
+    それ以外（DB / Redis など）は cache.add() を使う。
+    """
+
+    def __init__(self, shared, key: str):
+        self.shared, self.key = shared, "sf:lock:" + key
+        self.token = uuid.uuid4().hex
+        self.path = None
+        if isinstance(shared, FileBasedCache):
+            name = hashlib.md5(self.key.encode()).hexdigest() + ".lock"
+            self.path = os.path.join(shared._dir, name)
+
+    def acquire(self) -> bool:
+        if self.path is None:
+            return self.shared.add(self.key, self.token, LOCK_TTL_SEC)
+        for _ in range(2):
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                os.close(os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return True
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.path) < LOCK_TTL_SEC:
+                        return False
+                    os.unlink(self.path)  # 持ち主が落ちたロック
+                except FileNotFoundError:
+                    pass
+        return False
+
+    def release(self):
+        if self.path is None:
+            if self.shared.get(self.key) == self.token:
+                self.shared.delete(self.key)
+            return
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+# ---------- 本体 ----------
+_flights = {}             # key -> _Flight（プロセス内で計算中のもの）
+_flights_lock = threading.Lock()
+_refreshing = set()       # 裏で再計算中のキー
+stats = {"computed": 0, "local_hits": 0, "shared_hits": 0, "stale": 0, "waited": 0}
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.entry = None
+        self.error = None
+
+
+def _local():
+    return caches[LOCAL_ALIAS]
+
+
+def _shared():
+    return caches[SHARED_ALIAS]
+
+
+def _cache_key(key: str) -> str:
+    return "sf:" + key
+
+
+def _store_local(key: str, entry: _Entry, now: float):
+    _local().set(_cache_key(key), entry, max(1, min(LOCAL_MAX_SEC, int(entry.expires - now) + 1)))
+
+
+def _shared_get(key: str):
+    try:
+        return _shared().get(_cache_key(key))
+    except Exception:
+        logger.warning("shared cache get failed", exc_info=True)
+        return None
+
+
+def _compute(key, compute, ttl, stale_ttl) -> _Entry:
+    t0 = time.time()
+    value = compute()
+    entry = _Entry(value, time.time(), ttl, time.time() - t0)
+    stats["computed"] += 1
+    try:
+        _shared().set(_cache_key(key), entry, int(ttl + stale_ttl) + 1)
+    except Exception:
+        logger.warning("shared cache set failed", exc_info=True)
+    _store_local(key, entry, entry.created)
+    return entry
+
+
+def _compute_coalesced(key, compute, ttl, stale_ttl, beta) -> _Entry:
+    """共有層に値が無い（または使えない）とき：ロックを取れた1ワーカーだけが計算、他は待つ。"""
+    lock = _SharedLock(_shared(), key)
+    deadline = time.monotonic() + WAIT_SEC
+    while True:
+        try:
+            got = lock.acquire()
+        except Exception:
+            logger.warning("shared lock failed", exc_info=True)
+            got = None
+        if got or got is None:
+            try:
+                # ロック待ちの間に他が入れたかもしれない
+                entry = _shared_get(key) if got else None
+                if entry is not None and entry.fresh(time.time(), 0):
+                    return entry
+                return _compute(key, compute, ttl, stale_ttl)
+            finally:
+                if got:
+                    lock.release()
+        stats["waited"] += 1
+        time.sleep(POLL_SEC)
+        entry = _shared_get(key)
+        if entry is not None and entry.fresh(time.time(), 0):
+            return entry
+        if time.monotonic() >= deadline:
+            logger.warning("singleflight: waited %ss for %s, computing locally", WAIT_SEC, key)
+            return _compute(key, compute, ttl, stale_ttl)
+
+
+def _refresh_in_background(key, compute, ttl, stale_ttl):
+    """古い値を返しつつ、ロックを取れたら1回だけ再計算する。"""
+    with _flights_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    def run():
+        lock = _SharedLock(_shared(), key)
+        try:
+            if lock.acquire():
+                try:
+                    _compute(key, compute, ttl, stale_ttl)
+                finally:
+                    lock.release()
+        except Exception:
+            logger.exception("singleflight: background refresh of %s failed", key)
+        finally:
+            with _flights_lock:
+                _refreshing.discard(key)
+            if BACKGROUND:
+                close_old_connections()
+
+    if BACKGROUND:
+        threading.Thread(target=run, name=f"singleflight-{key}", daemon=True).start()
+    else:
+        run()
+
+
+def get_or_compute(key: str, compute, ttl: float, stale_ttl: float = STALE_TTL_SEC, beta: float = BETA):
+    """
+    key の値を返す。無ければ compute() を（全プロセスで1回だけ）呼んで ttl 秒キャッシュする。
+    期限切れ後 stale_ttl 秒までは古い値を返して裏で再計算。
+    """
+    now = time.time()
+    entry = _local().get(_cache_key(key))
+    if entry is not None and entry.fresh(now, beta):
+        stats["local_hits"] += 1
+        return entry.value
+
+    shared = _shared_get(key)
+    if shared is not None:
+        _store_local(key, shared, now)
+        if shared.fresh(now, beta):
+            stats["shared_hits"] += 1
+            return shared.value
+        if now < shared.expires + stale_ttl:
+            # 早期失効 or 期限切れ（stale 許容内）：今は古い値、裏で1回だけ再計算
+            stats["stale"] += 1
+            _refresh_in_background(key, compute, ttl, stale_ttl)
+            return shared.value
+
+    # 値が無い：プロセス内で1スレッドだけが先に進む
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+    if not leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.entry.value
+    try:
+        flight.entry = _compute_coalesced(key, compute, ttl, stale_ttl, beta)
+        return flight.entry.value
+    except BaseException as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            _flights.pop(key, None)
+        flight.done.set()
+
+
+def invalidate(key: str):
+    """両方の層から消す（他プロセスのプロセス内層は LOCAL_MAX_SEC 以内に切れる）。"""
+    _local().delete(_cache_key(key))
+    try:
+        _shared().delete(_cache_key(key))
+    except Exception:
+        logger.warning("shared cache delete failed", exc_info=True)
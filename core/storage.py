@@ -0,0 +1,16 @@
+# core/storage.py
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+
+class ManifestStaticStorage(CompressedManifestStaticFilesStorage):
+    """
+    ハッシュ付きファイル名＋ .gz/.br 生成（Brotli が入っていれば .br も）。
+    manifest にもディスクにも無いパスは 500 にせず素のURLを返す。
+    """
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
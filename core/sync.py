@@ -0,0 +1,183 @@
+# core/sync.py
+"""
+モバイル向けの差分同期（/api/sync?since=<token>）。
+- 対象は本人の DeliveryRecord・EntranceInfo（自分の投稿）・OcrImport（状態のみ。raw_text / parsed_json は送らない）
+- ユーザーごとに単調増加の変更番号（SyncState.seq）。保存のたびに SyncTracked.save が1つ進めて行の sync_seq に入れ、
+  削除は post_delete で SyncTombstone に番号つきで残す（行そのものは消す。unique (user, date) を塞がない）
+- トークンは「ユーザー id と最後に受け取った番号」の署名つき文字列。別ユーザーのトークン・壊れたトークン・
+  prune 済みの範囲より古いトークンは reset（全件を取り直す）
+- 応答は種類ごとに fields + rows（配列）の列指向、番号順に最大 limit 件ずつ。変更の無い種類は省く。
+  more が true なら続きを取る
+- 記録の tombstone を受けたら、それを指す ocr の created_record はクライアント側で null にする
+  （SET_NULL は QuerySet.update で行われ、OcrImport の番号は進まない）
+- bulk_create・QuerySet.update() は番号を進めない。まとめて作るときは stamp_bulk() で振ってから bulk_create する
+- 所有者の付け替え（admin）は旧所有者に tombstone を出さない
+- アーカイブ（core.archive.archiving() の中の削除）は tombstone を出さない（端末に残った過去分はそのまま）
+"""
+import datetime
+import threading
+from decimal import Decimal
+
+from django.core import signing
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import DeliveryRecord, EntranceInfo, OcrImport, SyncState, SyncTombstone
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 2000
+TOMBSTONE_DAYS = 60
+TOKEN_SALT = "dn-sync"
+
+KINDS = {
+    "records": (DeliveryRecord, ("id", "date", "start_time", "end_time", "orders_completed", "earnings",
+                                 "hours_worked", "area_slug", "note", "updated_at")),
+    "entrances": (EntranceInfo, ("id", "address", "latitude", "longitude", "note",
+                                 "photo1", "photo2", "photo3", "updated_at")),
+    "ocr": (OcrImport, ("id", "status", "message", "created_record_id", "created_at", "updated_at")),
+}
+KIND_OF = {model: kind for kind, (model, _fields) in KINDS.items()}
+FILE_FIELDS = {"photo1", "photo2", "photo3"}
+
+_NEXT_SEQ = (
+    "INSERT INTO core_syncstate (user_id, seq, pruned_seq) VALUES (%s, %s, 0) "
+    "ON CONFLICT (user_id) DO UPDATE SET seq = core_syncstate.seq + excluded.seq "
+    "RETURNING seq"
+)
+
+
+# ---------- 番号の確保 ----------
+def next_seq(user_id, n: int = 1) -> int:
+    """n 個確保して最後の番号を返す（行ロックはトランザクションの終わりまで持つ）。"""
+    with connection.cursor() as cur:
+        cur.execute(_NEXT_SEQ, [user_id, n])
+        return cur.fetchone()[0]
+
+
+def stamp_bulk(objs) -> None:
+    """
+    bulk_create する前のインスタンスに番号を振る（ユーザーごとに1クエリ）。
+    bulk_create と同じトランザクションの中で呼ぶこと（番号だけ先にコミットされると同期で取りこぼす）。
+    """
+    by_user = {}
+    for o in objs:
+        by_user.setdefault(o.user_id, []).append(o)
+    for uid, rows in by_user.items():
+        first = next_seq(uid, len(rows)) - len(rows) + 1
+        for i, o in enumerate(rows):
+            o.sync_seq = first + i
+
+
+# ---------- 削除 ----------
+_deleting_users = set()  # 削除中のユーザー（CASCADE で消える行に tombstone を作らない）
+_deleting_lock = threading.Lock()
+
+
+def user_deleting(user_id):
+    with _deleting_lock:
+        _deleting_users.add(user_id)
+
+
+def user_deleted(user_id):
+    with _deleting_lock:
+        _deleting_users.discard(user_id)
+    SyncTombstone.objects.filter(user_id=user_id).delete()
+    SyncState.objects.filter(user_id=user_id).delete()
+
+
+def is_deleting(user_id) -> bool:
+    return user_id in _deleting_users
+
+
+def record_deletion(instance):
+    if is_deleting(instance.user_id):
+        return
+    with transaction.atomic():
+        SyncTombstone.objects.create(user_id=instance.user_id, kind=KIND_OF[type(instance)],
+                                     object_id=instance.pk, seq=next_seq(instance.user_id))
+
+
+def prune_tombstones(days: int = TOMBSTONE_DAYS) -> int:
+    """days より古い tombstone を消す。消した範囲より古いトークンは以後 reset になる。"""
+    cutoff = timezone.now() - datetime.timedelta(days=days)
+    old = SyncTombstone.objects.filter(deleted_at__lt=cutoff)
+    with transaction.atomic():
+        for uid, top in old.order_by().values("user_id").annotate(top=Max("seq")).values_list("user_id", "top"):
+            SyncState.objects.filter(user_id=uid, pruned_seq__lt=top).update(pruned_seq=top)
+        n, _ = old.delete()
+    return n
+
+
+# ---------- トークン ----------
+def make_token(user_id, seq: int) -> str:
+    return signing.Signer(salt=TOKEN_SALT).sign(f"{user_id}.{seq}")
+
+
+def parse_token(user_id, token: str):
+    """番号を返す。空なら 0、他人のもの・壊れたものは None（reset）。"""
+    if not token:
+        return 0
+    try:
+        uid, seq = signing.Signer(salt=TOKEN_SALT).unsign(token).split(".")
+        if int(uid) != user_id:
+            return None
+        return int(seq)
+    except (signing.BadSignature, ValueError):
+        return None
+
+
+# ---------- 読み出し ----------
+def _compact(v):
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, datetime.datetime):
+        return int(v.timestamp())
+    if isinstance(v, datetime.time):
+        return v.strftime("%H:%M")
+    if isinstance(v, datetime.date):
+        return v.isoformat()
+    return v
+
+
+def _row(fields, values) -> list:
+    return [default_storage.url(v) if v and f in FILE_FIELDS else _compact(v) for f, v in zip(fields, values)]
+
+
+def changes(user_id, since, limit: int = DEFAULT_LIMIT) -> dict:
+    """
+    since より後の変更を番号順に最大 limit 件。
+    先に読んだ SyncState.seq（= そこまでの番号はすべてコミット済み）を上限にして、
+    種類ごとの SELECT の間にコミットされた変更を飛ばさないようにする。
+    """
+    top, pruned = SyncState.objects.filter(user_id=user_id).values_list("seq", "pruned_seq").first() or (0, 0)
+    reset = since is None or since < pruned or since > top
+    if reset:
+        since = 0
+    if since == top:  # 変更なし（いちばん多い再同期）は SyncState の1クエリだけ
+        return {"reset": reset, "more": False, "token": make_token(user_id, top)}
+    items = []  # (seq, kind, 行の値 or 削除された id)
+    for kind, (model, fields) in KINDS.items():
+        rows = (model.objects.filter(user_id=user_id, sync_seq__gt=since, sync_seq__lte=top).order_by("sync_seq")
+                .values_list("sync_seq", *fields)[:limit + 1])
+        items += [(r[0], kind, r[1:]) for r in rows]
+    if since:  # 全件取り直しのときは tombstone は要らない
+        items += SyncTombstone.objects.filter(user_id=user_id, seq__gt=since, seq__lte=top).order_by("seq") \
+            .values_list("seq", "kind", "object_id")[:limit + 1]
+    items.sort(key=lambda t: t[0])
+    more = len(items) > limit
+    items = items[:limit]
+
+    out = {"reset": reset, "more": more}
+    deleted = {}
+    for _seq, kind, row in items:
+        if isinstance(row, tuple):
+            fields = KINDS[kind][1]
+            out.setdefault(kind, {"fields": fields, "rows": []})["rows"].append(_row(fields, row))
+        else:
+            deleted.setdefault(kind, []).append(row)
+    if deleted:
+        out["deleted"] = deleted
+    out["token"] = make_token(user_id, items[-1][0] if more else top)
+    return out
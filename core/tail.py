@@ -0,0 +1,58 @@
+# core/tail.py
+"""
+id 昇順のテール読み（core.heat の増分集計・core.live の当日テールで共用）。
+- 連番 id はコミット順ではない（Postgres のシーケンスは INSERT 時に採番するので、先に採番した
+  トランザクションが後からコミットされることがある）。「最後に読んだ id より後」だけを読むと、
+  遅れてコミットされた行を永久に取りこぼす
+- high（読んだ最大 id）に加えて、high より下で読めなかった id を欠番として覚え、次から一緒に読む。
+  欠番はロールバック・削除でも出来るので GAP_SEC 経っても現れなければ諦める。
+  覚えるのは high から GAP_WINDOW 以内だけ（id が大きく飛んでも欠番を展開しない）
+- 状態は (high, [[id, 欠番と見た時刻], ...]) で JSON にそのまま保存できる
+"""
+import time
+
+from django.db.models import Q
+
+GAP_SEC = 600
+GAP_WINDOW = 2000
+
+
+class IdTail:
+    def __init__(self, high: int = 0, gaps=()):
+        self.high = high
+        self.gaps = {int(i): t for i, t in gaps}  # id -> 欠番と見た時刻（epoch 秒）
+
+    def filter(self, qs):
+        """high より後と欠番の行（id 昇順）。"""
+        cond = Q(id__gt=self.high)
+        if self.gaps:
+            cond |= Q(id__in=sorted(self.gaps))
+        return qs.filter(cond).order_by("id")
+
+    def advance(self, ids, now: float = None) -> bool:
+        """filter() で読んだ id（昇順）を反映。状態が変わったら True。"""
+        now = time.time() if now is None else now
+        before = (self.high, len(self.gaps))
+        fresh = []
+        for i in ids:
+            if i > self.high:
+                fresh.append(i)
+            else:
+                self.gaps.pop(i, None)
+        if fresh:
+            floor = fresh[-1] - GAP_WINDOW
+            prev = self.high
+            for i in fresh:
+                for g in range(max(prev + 1, floor), i):
+                    self.gaps[g] = now
+                prev = i
+            self.high = fresh[-1]
+        self.gaps = {i: t for i, t in self.gaps.items() if i > self.high - GAP_WINDOW and now - t < GAP_SEC}
+        return (self.high, len(self.gaps)) != before or bool(fresh)
+
+    def pending(self, i: int) -> bool:
+        """i がまだ読まれていない（high より後か欠番）。"""
+        return i > self.high or i in self.gaps
+
+    def gap_list(self) -> list:
+        return [[i, t] for i, t in sorted(self.gaps.items())]
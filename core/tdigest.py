@@ -0,0 +1,151 @@
+# core/tdigest.py
+"""
+重み付き t-digest（merging 版）。分位点・順位（CDF）の近似とマージ用。
+- 点は (値, 重み) のまま受け取り、BUFFER 件たまったら既存の重心とまとめて並べ直して圧縮する
+- スケール関数は k1（asin）。分布の両端ほど重心を小さく保つので上位・下位 % の誤差が小さい。
+  重心の数は compression の半分前後（既定 100 → 50 前後、保存時 約 0.8KB）
+- merge() は相手の重心を点として足して圧縮するだけ（エリア・曜日をまとめた集計に使う）
+- 保存は live.py と同じ「JSON ヘッダ + 改行 + array('d') のバイト列」
+- numpy 不要
+"""
+import bisect
+import json
+import math
+from array import array
+
+COMPRESSION = 100
+BUFFER = 500
+
+
+def _k(q: float, d: float) -> float:
+    return d / (2 * math.pi) * math.asin(2 * q - 1)
+
+
+def _q(k: float, d: float) -> float:
+    if k >= d / 4:
+        return 1.0
+    return (math.sin(2 * math.pi * k / d) + 1) / 2
+
+
+class TDigest:
+    def __init__(self, compression: float = COMPRESSION):
+        self.compression = compression
+        self.means = array("d")
+        self.weights = array("d")
+        self.buffer = []  # 未圧縮の (値, 重み)
+        self.total = 0.0
+        self.min, self.max = math.inf, -math.inf
+        self._frozen = None
+
+    def __len__(self):
+        self.compress()
+        return len(self.means)
+
+    # ---------- 更新 ----------
+    def add(self, x: float, w: float = 1.0):
+        if w <= 0 or x != x:
+            return
+        self.buffer.append((x, w))
+        self.total += w
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+        self._frozen = None
+        if len(self.buffer) >= BUFFER:
+            self.compress()
+
+    def merge(self, other: "TDigest"):
+        other.compress()
+        if not other.total:
+            return self
+        self.buffer.extend(zip(other.means, other.weights))
+        self.total += other.total
+        self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+        self._frozen = None
+        self.compress()
+        return self
+
+    def compress(self):
+        if not self.buffer:
+            return
+        pts = sorted([*zip(self.means, self.weights), *self.buffer])
+        self.buffer = []
+        d, total = self.compression, self.total
+        means, weights = array("d"), array("d")
+        cur_m, cur_w = pts[0]
+        done = 0.0  # 確定した重心の重みの合計
+        limit = total * _q(_k(0.0, d) + 1, d)
+        for m, w in pts[1:]:
+            if done + cur_w + w <= limit:
+                cur_m += (m - cur_m) * w / (cur_w + w)
+                cur_w += w
+            else:
+                means.append(cur_m)
+                weights.append(cur_w)
+                done += cur_w
+                limit = total * _q(_k(done / total, d) + 1, d)
+                cur_m, cur_w = m, w
+        means.append(cur_m)
+        weights.append(cur_w)
+        self.means, self.weights = means, weights
+
+    # ---------- 参照 ----------
+    def _curve(self):
+        """(値, 累積重み) の折れ線。重心はその重みの中央に置き、両端に min / max を足す。"""
+        if self._frozen is None:
+            self.compress()
+            xs, cs = [self.min], [0.0]
+            acc = 0.0
+            for m, w in zip(self.means, self.weights):
+                xs.append(m)
+                cs.append(acc + w / 2)
+                acc += w
+            xs.append(self.max)
+            cs.append(self.total)
+            self._frozen = (xs, cs)
+        return self._frozen
+
+    def cdf(self, x: float):
+        """x 以下の重みの割合（0..1）。空なら None。"""
+        if not self.total:
+            return None
+        if x < self.min:
+            return 0.0
+        if x >= self.max:
+            return 1.0
+        xs, cs = self._curve()
+        i = bisect.bisect_right(xs, x)
+        x0, x1, c0, c1 = xs[i - 1], xs[i], cs[i - 1], cs[i]
+        c = c0 if x1 == x0 else c0 + (c1 - c0) * (x - x0) / (x1 - x0)
+        return c / self.total
+
+    def quantile(self, q: float):
+        if not self.total:
+            return None
+        xs, cs = self._curve()
+        t = max(0.0, min(1.0, q)) * self.total
+        i = min(len(cs) - 1, max(1, bisect.bisect_left(cs, t)))
+        c0, c1, x0, x1 = cs[i - 1], cs[i], xs[i - 1], xs[i]
+        return x0 if c1 == c0 else x0 + (x1 - x0) * (t - c0) / (c1 - c0)
+
+    # ---------- 保存 ----------
+    def to_bytes(self) -> bytes:
+        self.compress()
+        header = json.dumps({"v": 1, "compression": self.compression, "n": len(self.means),
+                             "total": self.total, "min": self.min if self.total else None,
+                             "max": self.max if self.total else None}).encode()
+        return header + b"\n" + self.means.tobytes() + self.weights.tobytes()
+
+    @classmethod
+    def from_bytes(cls, payload: bytes) -> "TDigest":
+        header, _, body = bytes(payload).partition(b"\n")
+        meta = json.loads(header)
+        td = cls(meta["compression"])
+        n = meta["n"]
+        td.means = array("d", body[:8 * n])
+        td.weights = array("d", body[8 * n:16 * n])
+        td.total = meta["total"]
+        if td.total:
+            td.min, td.max = meta["min"], meta["max"]
+        return td
@@ -1,3 +1,1102 @@
-from django.test import TestCase
+import csv
+import datetime
+import gzip
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import archive, calibration, entrance_search, heat, live, page_data, rankings, singleflight, sync
+from .areas import AREA_INDEX
+from .models import (
+    CalibrationResidual, DeliveryMonthlyStat, DeliveryRecord, EarningsSketch, EntranceInfo, HeatCell, LiveCheckpoint,
+    OcrImport, RankingDirty, SyncState, SyncTombstone, User, UserAiConsent, UserCalibration,
+)
+from .tdigest import TDigest
+
+try:
+    import numpy as np
+    from .ml.features import FEATURE_ORDER, FeatureStore
+except ImportError:  # numpy 未インストール環境
+    np = None
+
+# テストの値（テスト DB 由来）を開発サーバーの共有キャッシュ（既定はファイル）に書かない。
+# すべてのテストクラスに付ける（テストランナーに依存しない）
+TEST_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "dn-test-local"},
+    "shared": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "dn-test-shared"},
+}
+
+
+@override_settings(CACHES=TEST_CACHES)
+class AdminChangelistQueryCountTests(TestCase):
+    """一覧ページのクエリ数が行数に依存しないこと（行ごとの FK 参照が無いこと）。"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", "admin@example.com", "pw")
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def _add_rows(self, n, offset):
+        today = datetime.date.today()
+        for i in range(offset, offset + n):
+            u = User.objects.create(username=f"courier{i}")
+            rec = DeliveryRecord.objects.create(user=u, date=today - datetime.timedelta(days=i % 30), earnings=1000)
+            OcrImport.objects.create(user=u, image="ocr/x.png", raw_text="x" * 1000, created_record=rec)
+
+    def _count(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_constant_queries_per_page(self):
+        for name in ("admin:core_deliveryrecord_changelist", "admin:core_ocrimport_changelist"):
+            with self.subTest(name=name):
+                self._add_rows(3, offset=len(User.objects.all()))
+                few = self._count(reverse(name))
+                self._add_rows(30, offset=len(User.objects.all()))
+                many = self._count(reverse(name))
+                self.assertEqual(few, many)
+
+    def test_username_filter(self):
+        self._add_rows(3, offset=0)
+        resp = self.client.get(reverse("admin:core_deliveryrecord_changelist"), {"username": "courier1"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(list(resp.context["cl"].result_list.values_list("user__username", flat=True)), ["courier1"])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ArchiveRoundTripTests(TestCase):
+    """アーカイブ前後で履歴・月次集計が同じこと。削除で tombstone を作らず、補正はバッチ単位で引くこと。"""
+
+    def setUp(self):
+        caches["default"].clear()
+        caches["shared"].clear()
+        patcher = mock.patch.object(page_data, "_compute_forecast",
+                                    side_effect=lambda day, hour: {slug: 1000.0 for slug in calibration.SLUGS})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create(username="courier")
+        self.cutoff = datetime.date(2026, 6, 1)
+        rng = random.Random(0)
+        for i in range(40):
+            DeliveryRecord.objects.create(
+                user=self.user, date=datetime.date(2026, 3, 1) + datetime.timedelta(days=i * 3),
+                area_slug=rng.choice(["shibuya", "ebisu", None]), orders_completed=rng.randint(1, 9),
+                earnings=Decimal(rng.randint(1000, 9000)), hours_worked=Decimal("2.50"),
+                start_time=datetime.time(18), end_time=datetime.time(20, 30), note=f"#{i}")
+        self.old = DeliveryRecord.objects.filter(date__lt=self.cutoff).order_by("date")
+        self.ocr = OcrImport.objects.create(user=self.user, image="ocr/old.png", raw_text="x",
+                                            created_record=self.old.first())
+
+    @staticmethod
+    def _comparable(rows):
+        keys = [k for k in archive.DELIVERY_FIELDS if k != "created_at"]
+        return [({k: r[k] for k in keys}, r["created_at"].replace(microsecond=r["created_at"].microsecond // 1000 * 1000))
+                for r in rows]
+
+    def test_round_trip(self):
+        before = archive.delivery_history(self.user.pk)
+        old_rows = [r for r in before if r["date"] < self.cutoff]
+        summary = archive.monthly_summary(self.user.pk)
+        n_old = self.old.count()
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(archive.archive_deliveries(self.cutoff, batch_size=1000), n_old)
+        # tombstone は作らず、補正はバッチ・ユーザーごとに1回だけ更新する
+        sqls = [q["sql"] for q in ctx.captured_queries]
+        self.assertFalse([q for q in sqls if "core_sync" in q])
+        self.assertEqual(len([q for q in sqls if q.startswith('UPDATE "core_usercalibration"')]), 1)
+
+        self.assertEqual(self._comparable(archive.delivery_history(self.user.pk)), self._comparable(before))
+        self.assertEqual(self._comparable(archive.iter_archived_deliveries([self.user.pk])),
+                         self._comparable(sorted(old_rows, key=lambda r: r["date"])))
+        self.assertEqual(archive.monthly_summary(self.user.pk), summary)
+        stats = DeliveryMonthlyStat.objects.filter(user=self.user)
+        self.assertEqual(sum(s.records for s in stats), n_old)
+        self.assertEqual(sum(s.earnings for s in stats), sum(r["earnings"] for r in old_rows))
+        self.assertEqual(sum(s.hours_worked for s in stats), sum(r["hours_worked"] for r in old_rows))
+
+        self.ocr.refresh_from_db()
+        self.assertIsNone(self.ocr.created_record_id)
+        self.assertFalse(SyncTombstone.objects.exists())
+        # 補正からはアーカイブした分だけ引く（残りはホットの記録の分）
+        self.assertFalse(CalibrationResidual.objects.filter(record_id__in=[r["id"] for r in old_rows]).exists())
+        hot_hours = sum(2.5 for r in before if r["date"] >= self.cutoff and r["area_slug"])
+        self.assertAlmostEqual(UserCalibration.objects.get(user=self.user).hours, hot_hours)
+
+    def test_ocr_images_deleted_after_commit(self):
+        with mock.patch.object(archive.default_storage, "delete") as delete:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                self.assertEqual(archive.archive_ocr_imports(timezone.now() + datetime.timedelta(days=1)), 1)
+                delete.assert_not_called()
+            self.assertEqual(len(callbacks), 1)
+        delete.assert_called_once_with("ocr/old.png")
+        self.assertFalse(OcrImport.objects.exists())
+        self.assertFalse(SyncTombstone.objects.exists())
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RecordExportTests(TestCase):
+    """/api/records/export：CSV / NDJSON / gzip の往復、アーカイブ＋ホットの結合とユーザーごとの並び、権限と入力チェック。"""
+
+    def setUp(self):
+        caches["default"].clear()
+        caches["shared"].clear()
+        patcher = mock.patch.object(page_data, "_compute_forecast",
+                                    side_effect=lambda day, hour: {slug: 1000.0 for slug in calibration.SLUGS})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.me = User.objects.create(username="me")
+        self.other = User.objects.create(username="other")
+        self.staff = User.objects.create(username="staff", is_staff=True)
+        self.cutoff = datetime.date(2026, 6, 1)
+        for user, offset in ((self.me, 0), (self.other, 1)):
+            for i in range(6):  # 半分はアーカイブ、半分はホット
+                DeliveryRecord.objects.create(
+                    user=user, date=datetime.date(2026, 5, 20 + offset) + datetime.timedelta(days=i * 4),
+                    area_slug="shibuya", orders_completed=i + 1, earnings=Decimal(1000 + 100 * i),
+                    hours_worked=Decimal("2.50"), start_time=datetime.time(18), end_time=datetime.time(20, 30),
+                    note=f"メモ,{i}")
+        archive.archive_deliveries(self.cutoff)
+
+    def _get(self, login, **params):
+        self.client.force_login(login)
+        return self.client.get(reverse("records_export"), params)
+
+    @staticmethod
+    def _body(resp) -> bytes:
+        return b"".join(resp.streaming_content)
+
+    def test_csv_round_trip_includes_archived_rows(self):
+        resp = self._get(self.me, format="csv")
+        self.assertEqual(resp.status_code, 200)
+        text = self._body(resp).decode("utf-8")
+        self.assertTrue(text.startswith("\ufeff"))
+        rows = list(csv.DictReader(io.StringIO(text[1:])))
+        self.assertEqual([r["date"] for r in rows],
+                         [(datetime.date(2026, 5, 20) + datetime.timedelta(days=i * 4)).isoformat() for i in range(6)])
+        self.assertEqual({r["user_id"] for r in rows}, {str(self.me.pk)})
+        self.assertEqual([r["note"] for r in rows], [f"メモ,{i}" for i in range(6)])
+        self.assertEqual([Decimal(r["earnings"]) for r in rows], [Decimal(1000 + 100 * i) for i in range(6)])
+        self.assertEqual(rows[0]["start_time"], "18:00:00")
+        self.assertTrue(any(d < self.cutoff.isoformat() for d in (r["date"] for r in rows)))
+
+    def test_gzip_ndjson_matches_csv(self):
+        plain = list(csv.DictReader(io.StringIO(self._body(self._get(self.me, format="csv")).decode("utf-8")[1:])))
+        resp = self._get(self.me, format="ndjson", gzip="1", since="2026-05-24")
+        self.assertEqual(resp["Content-Type"], "application/gzip")
+        self.assertTrue(resp["Content-Disposition"].endswith('.ndjson.gz"'))
+        rows = [json.loads(line) for line in gzip.decompress(self._body(resp)).decode("utf-8").splitlines()]
+        self.assertEqual([(r["date"], r["earnings"], r["note"]) for r in rows],
+                         [(r["date"], r["earnings"], r["note"]) for r in plain if r["date"] >= "2026-05-24"])
+
+    def test_staff_export_is_grouped_by_user(self):
+        resp = self._get(self.staff, format="ndjson", user="all")
+        rows = [json.loads(line) for line in self._body(resp).decode("utf-8").splitlines()]
+        self.assertEqual(len(rows), 12)
+        keys = [(r["user_id"], r["date"]) for r in rows]
+        self.assertEqual(keys, sorted(keys))  # アーカイブ分とホット分がユーザーごとに連続する
+
+    def test_rejects_other_users_and_bad_input(self):
+        self.assertEqual(self._get(self.me, user="all").status_code, 403)
+        self.assertEqual(self._get(self.me, user=str(self.other.pk)).status_code, 403)
+        self.assertEqual(self._get(self.me, since="2026-13-01").status_code, 400)
+        self.assertEqual(self._get(self.me, format="xlsx").status_code, 400)
+        self.assertEqual(self._get(self.me, area="atlantis").status_code, 400)
+        self.assertEqual(self._get(self.staff, user="1,x").status_code, 400)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class HistoricalRatesConsentTests(TestCase):
+    """予測の代替（エリア平均）に不同意ユーザーの記録を使わないこと。"""
+
+    def test_only_consenting_users(self):
+        day = datetime.date.today() - datetime.timedelta(days=1)
+        yes, no = User.objects.create(username="yes"), User.objects.create(username="no")
+        UserAiConsent.objects.filter(user=no).update(share_aggregated=False)
+        DeliveryRecord.objects.create(user=yes, date=day, area_slug="shibuya", hours_worked=Decimal("2"), earnings=3000)
+        DeliveryRecord.objects.create(user=no, date=day, area_slug="shibuya", hours_worked=Decimal("2"), earnings=9000)
+        DeliveryRecord.objects.create(user=no, date=day - datetime.timedelta(days=1), area_slug="shinjuku",
+                                      hours_worked=Decimal("1"), earnings=2000)
+        self.assertEqual(page_data._compute_historical_rates(), {"shibuya": 1500.0})
+
+
+@override_settings(CACHES=TEST_CACHES)
+@skipUnless(np is not None, "numpy is required")
+class FeatureStoreSkewTests(TestCase):
+    """学習時と推論時で同じ (date, hour, area) の特徴量が一致すること。"""
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.start = datetime.date(2026, 4, 1)
+        self.end = datetime.date(2026, 6, 30)
+        slugs = ["ebisu", "ginza", "shibuya"]
+        self.samples = [
+            {"date": self.start + datetime.timedelta(days=int(d)), "hour": int(h), "area_slug": slugs[int(a)],
+             "y_hourly": float(y), "portion": float(p)}
+            for d, h, a, y, p in zip(rng.integers(0, 91, 3000), rng.integers(8, 23, 3000),
+                                     rng.integers(0, 3, 3000), rng.normal(1800, 300, 3000),
+                                     rng.uniform(0.1, 1.0, 3000))
+        ]
+        self.store = FeatureStore.build(self.samples, self.start, self.end)
+
+    def test_training_and_inference_rows_match(self):
+        for day, hour in ((datetime.date(2026, 5, 4), 12), (datetime.date(2026, 6, 30), 19),
+                          (datetime.date(2026, 4, 2), 9)):
+            slugs = self.store.slugs
+            train = self.store.training_matrix([day] * len(slugs), [hour] * len(slugs), slugs)
+            serve = self.store.inference_matrix(day, hour)
+            np.testing.assert_array_equal(train, serve)
+
+    def test_saved_store_serves_same_features(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "fs.npz")
+            self.store.save(path)
+            loaded = FeatureStore.load(path)
+        day = datetime.date(2026, 6, 1)
+        np.testing.assert_array_equal(self.store.inference_matrix(day, 18), loaded.inference_matrix(day, 18))
+
+    def test_features_use_only_past_days(self):
+        # 当日の実績を変えても当日の特徴量は変わらない（リークなし）
+        day = datetime.date(2026, 6, 10)
+        before = self.store.inference_matrix(day, 12)
+        self.store.refresh([s for s in self.samples if s["date"] < day]
+                           + [{"date": day, "hour": 12, "area_slug": "ginza", "y_hourly": 9999.0, "portion": 1.0}],
+                           since=self.start, end=self.end)
+        np.testing.assert_array_equal(before, self.store.inference_matrix(day, 12))
+
+    def test_holiday_and_dow(self):
+        i_dow, i_hol = FEATURE_ORDER.index("dow"), FEATURE_ORDER.index("is_holiday")
+        row = self.store.inference_matrix(datetime.date(2026, 5, 4), 12)[0]  # みどりの日（月）
+        self.assertEqual(row[i_dow], 0)
+        self.assertEqual(row[i_hol], 1)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class EntranceSearchTests(TestCase):
+    """住所の正規化・検索 API・順位付けと、索引（トリガー）が欠けたときの扱い。"""
+
+    def setUp(self):
+        self.user = User.objects.create(username="courier")
+        self.client.force_login(self.user)
+
+    def _search(self, q, **params):
+        resp = self.client.get(reverse("entrance_search"), {"q": q, **params})
+        self.assertEqual(resp.status_code, 200)
+        return resp.json()
+
+    def test_normalize_address(self):
+        self.assertEqual(entrance_search.normalize_address("東京都渋谷区道玄坂二丁目３番１号 サン桜ハイツ502号室"),
+                         "東京都渋谷区道玄坂2-3-1サン桜ハイツ502号室")
+        self.assertEqual(entrance_search.normalize_address("道玄坂２ー３ー１"), "道玄坂2-3-1")
+        self.assertEqual(entrance_search.normalize_address("十二番地"), "12")
+
+    def test_endpoint_matches_variants(self):
+        e = EntranceInfo.objects.create(user=self.user, address="渋谷区道玄坂2-3-1", note="裏口はオートロック無し")
+        EntranceInfo.objects.create(user=self.user, address="新宿区西新宿1-1-1")
+        for q in ("道玄坂二丁目3番1号", "道玄坂２－３－１", "オートロック"):
+            with self.subTest(q=q):
+                body = self._search(q)
+                self.assertEqual([r["id"] for r in body["results"]], [e.id])
+        self.assertEqual(self.client.get(reverse("entrance_search")).status_code, 400)
+
+    def test_ranking(self):
+        note = EntranceInfo.objects.create(user=self.user, address="港区六本木1-1-1", note="道玄坂の隣のビルと間違えやすい")
+        inner = EntranceInfo.objects.create(user=self.user, address="東京都渋谷区道玄坂2-3-1")
+        prefix = EntranceInfo.objects.create(user=self.user, address="道玄坂2-3-1サンハイツ")
+        ids = [r["id"] for r in self._search("道玄坂")["results"]]
+        self.assertEqual(ids, [prefix.id, inner.id, note.id])
+        if entrance_search.backend() != "scan":  # あいまい一致は索引があるときだけ
+            typo = self._search("道玄坂2-3-l")["results"]  # 数字の 1 を l に打ち間違え
+            self.assertEqual(typo[0]["id"], prefix.id)
+
+    @skipUnless(connection.vendor == "sqlite", "FTS5 triggers are SQLite only")
+    def test_missing_triggers_fall_back_and_are_reinstalled(self):
+        with connection.cursor() as cur:
+            cur.execute(f"DROP TRIGGER {entrance_search.FTS_TABLE}_ai")
+        entrance_search._backend_cache.clear()
+        self.assertFalse(entrance_search.index_ok())
+        self.assertEqual(entrance_search.backend(), "scan")
+        e = EntranceInfo.objects.create(user=self.user, address="渋谷区道玄坂2-3-1")
+        self.assertEqual([r["id"] for r in self._search("道玄坂")["results"]], [e.id])
+
+        self.assertTrue(entrance_search.ensure_index())
+        self.assertEqual(entrance_search.backend(), "fts5")
+        self.assertEqual([r["id"] for r in self._search("道玄坂")["results"]], [e.id])
+        self.assertFalse(entrance_search.ensure_index())
+
+
+ML_DEPS = ("lightgbm", "sklearn", "skl2onnx", "onnxmltools", "onnxruntime")
+
+
+@override_settings(CACHES=TEST_CACHES)
+@skipUnless(np is not None and all(importlib.util.find_spec(m) for m in ML_DEPS), "ML dependencies are required")
+class TrainLgbmExportTests(TestCase):
+    """
+    train_lgbm で学習 → ONNX 出力 → LgbmPredictor で読めること（出力先は一時ディレクトリ）。
+    --search：時系列 fold・プロセスプールの探索・leaderboard の出力。
+    """
+
+    @staticmethod
+    def _records(days=60):
+        user = User.objects.create(username="courier")
+        today = datetime.date.today()
+        rng = random.Random(0)
+        DeliveryRecord.objects.bulk_create([
+            DeliveryRecord(user=user, date=today - datetime.timedelta(days=d), area_slug=rng.choice(["shibuya", "ebisu"]),
+                           start_time=datetime.time(11 + d % 8), end_time=datetime.time(13 + d % 8),
+                           hours_worked=Decimal("2"), earnings=rng.randint(2400, 4400))
+            for d in range(1, days)])
+        return today
+
+    def test_train_and_export(self):
+        from .ml import features, predictor
+        from .management.commands import train_lgbm
+
+        today = self._records()
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = {"MODEL_ONNX": os.path.join(tmp, "m.onnx"), "MODEL_META": os.path.join(tmp, "m.meta.json")}
+            store = os.path.join(tmp, "fs.npz")
+            with mock.patch.multiple(train_lgbm, STORE_PATH=store, **paths), \
+                    mock.patch.multiple(predictor, **paths), mock.patch.object(features, "STORE_PATH", store):
+                call_command("train_lgbm", min_samples=50, stdout=open(os.devnull, "w"))
+                predictor.LgbmPredictor.reload()
+                try:
+                    out = predictor.LgbmPredictor.predict_for_all(today.weekday(), 12, day=today)
+                    # refresh_features がストアを差し替えたら次の確認で読み直す
+                    loaded = predictor.LgbmPredictor._store
+                    os.utime(store, ns=(os.stat(store).st_mtime_ns + 10**9,) * 2)
+                    predictor.LgbmPredictor.predict_for_all(today.weekday(), 12, day=today)
+                    self.assertIs(predictor.LgbmPredictor._store, loaded)  # 確認の間隔内
+                    with mock.patch.object(predictor, "RELOAD_CHECK_SEC", 0):
+                        predictor.LgbmPredictor.predict_for_all(today.weekday(), 12, day=today)
+                    self.assertIsNot(predictor.LgbmPredictor._store, loaded)
+                finally:
+                    predictor.LgbmPredictor.reload()
+        self.assertLessEqual({"ebisu", "shibuya"}, set(out))
+        self.assertTrue(all(1000 < out[slug] < 2500 for slug in ("ebisu", "shibuya")), out)
+
+    def test_time_folds(self):
+        from .ml import search
+
+        day_idx = np.repeat(np.arange(100, 112), 3)  # 12日 × 3行
+        folds = search.time_folds(day_idx, 3)
+        self.assertEqual(len(folds), 3)
+        prev_train = 0
+        for train, val in folds:
+            # 検証は学習より後の日だけ・学習側は fold ごとに広がる（expanding window）
+            self.assertLess(day_idx[train].max(), day_idx[val].min())
+            self.assertGreater(len(train), prev_train)
+            self.assertEqual(len(val), 9)
+            prev_train = len(train)
+        self.assertEqual(day_idx[folds[-1][1]].max(), 111)
+        with self.assertRaises(ValueError):
+            search.time_folds(np.arange(3), 3)
+
+    def test_process_pool_search_matches_serial(self):
+        from .ml import search
+
+        rng = np.random.default_rng(0)
+        n = 600
+        X = rng.normal(size=(n, 3)).astype(np.float32)
+        y = 1500 + 300 * X[:, 0] + rng.normal(scale=50, size=n)
+        day_idx = np.repeat(np.arange(30), n // 30)
+        space = {"num_leaves": [3, 15], "learning_rate": [0.1]}
+        kw = {"n_folds": 2, "early_stopping_rounds": 5}
+        pooled = search.run_search(X, y, np.ones(n), day_idx, space, workers=2, **kw)
+        serial = search.run_search(X, y, np.ones(n), day_idx, space, workers=1, **kw)
+
+        self.assertEqual([r["rank"] for r in pooled], [1, 2])
+        self.assertLessEqual(pooled[0]["mae"], pooled[1]["mae"])
+        self.assertTrue(all(r["pid"] != os.getpid() for r in pooled))  # 試行はワーカープロセスで走る
+        self.assertTrue(all(len(r["fold_mae"]) == 2 for r in pooled))
+        self.assertEqual([(r["trial"], r["mae"]) for r in pooled], [(r["trial"], r["mae"]) for r in serial])
+        self.assertLess(pooled[0]["mae"], 100)
+
+    def test_search_writes_leaderboard_next_to_model(self):
+        from .ml import features, predictor, search
+        from .management.commands import train_lgbm
+
+        self._records()
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = {"MODEL_ONNX": os.path.join(tmp, "m.onnx"), "MODEL_META": os.path.join(tmp, "m.meta.json")}
+            store = os.path.join(tmp, "fs.npz")
+            space = os.path.join(tmp, "space.json")
+            with open(space, "w", encoding="utf-8") as f:
+                json.dump({"num_leaves": [7, 15]}, f)
+            with mock.patch.multiple(train_lgbm, STORE_PATH=store, **paths), \
+                    mock.patch.multiple(predictor, **paths), mock.patch.object(features, "STORE_PATH", store):
+                try:
+                    call_command("train_lgbm", min_samples=50, search=True, search_space=space, folds=2, workers=1,
+                                 early_stopping_rounds=5, stdout=open(os.devnull, "w"))
+                finally:
+                    predictor.LgbmPredictor.reload()
+            with open(os.path.join(tmp, search.LEADERBOARD_NAME), encoding="utf-8") as f:
+                board = json.load(f)
+            self.assertTrue(os.path.exists(paths["MODEL_ONNX"]))
+        self.assertEqual(board["folds"], 2)
+        self.assertEqual(sorted(r["params"]["num_leaves"] for r in board["trials"]), [7, 15])
+        self.assertEqual([r["rank"] for r in board["trials"]], [1, 2])
+        self.assertEqual(board["trials"], sorted(board["trials"], key=lambda r: r["mae"]))
+
+
+N_REQUESTS = 500
+
+
+def _cache_settings(tmp):
+    return {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "sf-test"},
+        "shared": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": tmp},
+    }
+
+
+def _hammer(key, compute, n, barrier=None):
+    """n スレッドを揃えて同時に get_or_compute し、結果のリストを返す。"""
+    start = threading.Barrier(n)
+    results = [None] * n
+
+    def run(i):
+        start.wait()
+        results[i] = singleflight.get_or_compute(key, compute, ttl=60)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    if barrier is not None:
+        barrier.wait()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def _hammer_in_child(key, counter, n, barrier, out):
+    def compute():
+        with counter.get_lock():
+            counter.value += 1
+        time.sleep(0.3)
+        return "value"
+    caches["default"].clear()
+    out.put(_hammer(key, compute, n, barrier))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SingleFlightTests(SimpleTestCase):
+    """同じキーへの同時リクエストで計算が1回だけになること（スレッド間・プロセス間）。"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(CACHES=_cache_settings(tmp.name))
+        override.enable()
+        self.addCleanup(override.disable)
+        caches["default"].clear()  # locmem は LOCATION ごとにプロセス内で共有される
+
+    def _counting(self, value="value", sleep=0.3):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(sleep)
+            return value
+        return compute, calls
+
+    def test_one_recompute_per_key_across_threads(self):
+        compute, calls = self._counting()
+        results = _hammer("k", compute, N_REQUESTS)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(set(results), {"value"})
+
+    @skipUnless("fork" in multiprocessing.get_all_start_methods(), "fork is required")
+    def test_one_recompute_per_key_across_processes(self):
+        ctx = multiprocessing.get_context("fork")
+        n_procs = 4
+        counter, out, barrier = ctx.Value("i", 0), ctx.Queue(), ctx.Barrier(n_procs)
+        procs = [ctx.Process(target=_hammer_in_child, args=("k", counter, N_REQUESTS // n_procs, barrier, out))
+                 for _ in range(n_procs)]
+        for p in procs:
+            p.start()
+        results = [r for _ in procs for r in out.get(timeout=60)]
+        for p in procs:
+            p.join()
+        self.assertEqual(counter.value, 1)
+        self.assertEqual(len(results), N_REQUESTS)
+        self.assertEqual(set(results), {"value"})
+
+    def test_stale_while_revalidate(self):
+        compute, calls = self._counting("old", sleep=0)
+        singleflight.get_or_compute("k", compute, ttl=60)
+        # 期限切れにする（stale 許容内）
+        entry = caches["shared"].get("sf:k")
+        entry.created -= 120
+        caches["shared"].set("sf:k", entry)
+        caches["default"].clear()
+        fresh, fresh_calls = self._counting("new", sleep=0)
+        with mock.patch.object(singleflight, "BACKGROUND", False):
+            self.assertEqual(singleflight.get_or_compute("k", fresh, ttl=60, stale_ttl=300), "old")
+        self.assertEqual(len(fresh_calls), 1)
+        caches["default"].clear()
+        self.assertEqual(singleflight.get_or_compute("k", fresh, ttl=60), "new")
+
+    def test_forecast_path_computes_each_hour_once(self):
+        calls = []
+
+        def fake_forecast(day, hour):
+            calls.append((day, hour))
+            time.sleep(0.2)
+            return {"shibuya": 1800.0 + hour}
+
+        now = page_data.timezone.make_aware(datetime.datetime(2026, 10, 19, 17, 5))
+        with mock.patch.object(page_data, "_compute_forecast", fake_forecast):
+            results = _hammer("unused", lambda: page_data.forecast_json(now), N_REQUESTS)
+        self.assertEqual(sorted(calls), sorted(set(calls)))
+        self.assertEqual(len(calls), page_data.PLAN_SLOTS // 2 + 1)
+        self.assertEqual(len(set(results)), 1)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CalibrationTests(TestCase):
+    """保存・編集・削除での残差統計の足し引き、縮小推定、DN_DATA の personal。共有予測は全エリア 1000 円/h に固定。"""
+
+    def setUp(self):
+        caches["default"].clear()
+        caches["shared"].clear()
+        patcher = mock.patch.object(page_data, "_compute_forecast",
+                                    side_effect=lambda day, hour: {slug: self.forecast for slug in calibration.SLUGS})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.forecast = 1000.0
+        self.user = User.objects.create(username="courier")
+        self.day = datetime.date(2026, 10, 5)
+
+    def _record(self, hours=2, yen_per_h=1500, slug="shibuya", day=None, start=18, user=None):
+        return DeliveryRecord.objects.create(
+            user=user or self.user, date=day or self.day, area_slug=slug, start_time=datetime.time(start),
+            end_time=datetime.time(start + hours), hours_worked=Decimal(hours), earnings=yen_per_h * hours)
+
+    def _cal(self, user=None):
+        return calibration.Calibration.from_bytes(UserCalibration.objects.get(user=user or self.user).payload)
+
+    def test_add_then_remove_returns_to_zero(self):
+        rec = self._record()
+        cal = self._cal()
+        i = calibration.SLOT["shibuya"]
+        self.assertAlmostEqual(cal.area_w[i], 2)
+        self.assertAlmostEqual(cal.area_s[i], 2 * 500)
+
+        # 共有予測が変わっても、引くのは足したときの残差（日付を変えて新しい予測を使わせる）
+        self.forecast = 1300.0
+        rec.date, rec.earnings = self.day + datetime.timedelta(days=1), 2 * 1800
+        rec.save(update_fields=["date", "earnings"])
+        cal = self._cal()
+        self.assertAlmostEqual(cal.area_w[i], 2)
+        self.assertAlmostEqual(cal.area_s[i], 2 * 500)
+
+        self.forecast = 700.0
+        rec.delete()
+        cal = self._cal()
+        for name in ("area_w", "area_s", "area_q", "band_w", "band_s", "band_q"):
+            self.assertEqual(sum(abs(v) for v in getattr(cal, name)), 0, name)
+        self.assertFalse(CalibrationResidual.objects.exists())
+
+    def test_unrelated_edit_does_not_touch_calibration(self):
+        rec = self._record()
+        rec.note = "メモ"
+        with CaptureQueriesContext(connection) as ctx:
+            rec.save(update_fields=["note"])
+        self.assertFalse([q for q in ctx.captured_queries if "calibration" in q["sql"]])
+
+    def test_owner_change_moves_residuals(self):
+        rec = self._record()
+        other = User.objects.create(username="other")
+        rec.user = other
+        rec.save()
+        self.assertEqual(self._cal().hours, 0)
+        self.assertAlmostEqual(self._cal(other).hours, 2)
+        self.assertEqual(CalibrationResidual.objects.get().user_id, other.pk)
+
+    def test_shrinkage_with_sparse_data(self):
+        i, h = calibration.SLOT["shibuya"], 18
+        self.assertIsNone(calibration.adjustment(self.user.pk))
+
+        rec = self._record(hours=1)  # +500 円/h を1時間だけ
+        sparse = calibration.adjustment(self.user.pk)
+        self.assertTrue(0 < sparse[i * 24 + h] < 500 * 0.4, sparse[i * 24 + h])
+        self.assertLess(sparse[calibration.SLOT["ginza"] * 24 + 9], sparse[i * 24 + h])  # 別エリア・別時間帯はさらに弱く
+        rec.delete()
+
+        for d in range(40):
+            self._record(hours=4, day=self.day - datetime.timedelta(days=d + 1), start=17)
+        dense = calibration.adjustment(self.user.pk)
+        self.assertGreater(dense[i * 24 + h], 500 * 0.9)
+
+    def test_min_hours(self):
+        DeliveryRecord.objects.create(user=self.user, date=self.day, area_slug="shibuya", start_time=datetime.time(18),
+                                      end_time=datetime.time(18, 30), hours_worked=Decimal("0.5"), earnings=750)
+        self.assertIsNone(calibration.adjustment(self.user.pk))
+
+    def test_personal_in_dn_data(self):
+        now = timezone.make_aware(datetime.datetime(2026, 10, 12, 18, 10))
+        self.assertIsNone(json.loads(page_data.dn_data_json(self.user, now))["personal"])
+        for d in range(10):
+            self._record(hours=3, day=self.day - datetime.timedelta(days=d))
+        grid = calibration.adjustment(self.user.pk)
+        personal = json.loads(page_data.dn_data_json(self.user, now))["personal"]
+        self.assertEqual(personal["shibuya"], round(1000 + grid[calibration.SLOT["shibuya"] * 24 + 18]))
+        self.assertGreater(personal["shibuya"], personal["ginza"])
+        self.assertGreater(personal["ginza"], 1000)
+
+    def test_rebuild_only_stale_users(self):
+        self._record()
+        UserCalibration.objects.update(model_version="")
+        self.assertEqual(calibration.rebuild(stale_only=True), 1)
+        self.assertEqual(calibration.rebuild(stale_only=True), 0)
+        self.assertEqual(CalibrationResidual.objects.count(), 1)
+
+
+def _exact_cdf(points, x):
+    return sum(w for v, w in points if v <= x) / sum(w for _, w in points)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class QuantileSketchTests(SimpleTestCase):
+    """t-digest の CDF が厳密な加重分布から大きくずれないこと・マージしても変わらないこと。"""
+
+    def setUp(self):
+        rng = random.Random(0)
+        self.points = [(rng.lognormvariate(7.4, 0.3), rng.uniform(0.1, 1.0)) for _ in range(20_000)]
+        xs = sorted(v for v, _ in self.points)
+        self.probes = [xs[int(len(xs) * q / 100)] for q in range(1, 100)]
+
+    def _max_error(self, td):
+        return max(abs(td.cdf(x) - _exact_cdf(self.points, x)) for x in self.probes)
+
+    def test_cdf_accuracy(self):
+        td = TDigest()
+        for v, w in self.points:
+            td.add(v, w)
+        self.assertLess(self._max_error(td), 0.01)
+        self.assertLessEqual(len(td), TDigest().compression)
+
+    def test_merge_and_roundtrip(self):
+        parts = [TDigest() for _ in range(16)]
+        for i, (v, w) in enumerate(self.points):
+            parts[i % 16].add(v, w)
+        merged = TDigest()
+        for p in parts:
+            merged.merge(TDigest.from_bytes(p.to_bytes()))
+        self.assertLess(self._max_error(merged), 0.01)
+        restored = TDigest.from_bytes(merged.to_bytes())
+        self.assertAlmostEqual(restored.total, sum(w for _, w in self.points), places=6)
+        self.assertEqual(restored.quantile(0.5), merged.quantile(0.5))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RankingApiTests(TestCase):
+    """保存・編集・削除・同意の変更が build 後のスケッチに反映され、同意ユーザーだけが順位を見られること。"""
+
+    def setUp(self):
+        caches["default"].clear()
+        caches["shared"].clear()
+        self.me = User.objects.create(username="me")
+        self.other = User.objects.create(username="other")
+        UserAiConsent.objects.filter(user=self.other).update(share_aggregated=False)
+        monday = datetime.date(2026, 10, 12)
+        for i, yen in enumerate([1200, 1500, 1800, 2100, 2400]):
+            DeliveryRecord.objects.create(user=self.me, date=monday + datetime.timedelta(days=7 * i), area_slug="shibuya",
+                                          start_time=datetime.time(18), end_time=datetime.time(23),
+                                          hours_worked=Decimal("5"), earnings=yen * 5)
+        DeliveryRecord.objects.create(user=self.other, date=monday, area_slug="shibuya", start_time=datetime.time(18),
+                                      end_time=datetime.time(23), hours_worked=Decimal("5"), earnings=99999)
+        rankings.build()
+
+    def test_ranking_for_consenting_user(self):
+        self.client.force_login(self.me)
+        resp = self.client.get(reverse("rankings"), {"area": "shibuya", "dow": "weekday", "yen": 2000})
+        self.assertEqual(resp.status_code, 200)
+        body = resp.json()
+        self.assertEqual(body["hours"], 25.0)  # 不同意ユーザーの記録は入らない
+        self.assertGreater(body["percentile"], 50)
+        self.assertAlmostEqual(body["percentile"] + body["top_percent"], 100, places=0)
+        own = self.client.get(reverse("rankings"), {"area": "shibuya", "dow": "weekday"}).json()
+        self.assertEqual(own["yen"], 1800)
+        self.assertEqual(own["own_hours"], 25.0)
+
+    def _hours(self):
+        return rankings.merged(rankings.parse_group("shibuya", "weekday")).total
+
+    def test_edits_deletes_and_consent_are_applied_by_build(self):
+        self.assertEqual(self._hours(), 25.0)
+        rec = DeliveryRecord.objects.filter(user=self.me).order_by("date").first()
+        rec.note = "メモ"
+        rec.save(update_fields=["note"])  # 順位に関係しない編集は何も積まない
+        self.assertFalse(RankingDirty.objects.exists())
+        rec.end_time = datetime.time(20)
+        rec.save()
+        self.assertEqual(self._hours(), 25.0)  # スケッチは build まで変わらない
+        rankings.build()
+        self.assertEqual(self._hours(), 22.0)
+        rec.delete()
+        rankings.build()
+        self.assertEqual(self._hours(), 20.0)
+        self.assertFalse(RankingDirty.objects.exists())
+
+        consent = UserAiConsent.objects.get(user=self.other)
+        consent.share_aggregated = True
+        consent.save()
+        rankings.build()
+        self.assertEqual(self._hours(), 25.0)
+        consent = UserAiConsent.objects.get(user=self.me)
+        consent.share_aggregated = False
+        consent.save()
+        rankings.build()
+        self.assertEqual(self._hours(), 5.0)
+        self.assertEqual(rankings.merged(rankings.parse_group("shibuya", "weekday")).max, 99999 / 5)
+
+    def test_rebuild_matches_incremental(self):
+        before = {(r.area_slug, r.dow, r.band): r.payload for r in EarningsSketch.objects.all()}
+        rankings.rebuild()
+        after = {(r.area_slug, r.dow, r.band): r.payload for r in EarningsSketch.objects.all()}
+        self.assertEqual(after, before)
+
+    def test_requires_consent_and_valid_group(self):
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.get(reverse("rankings")).status_code, 403)
+        self.client.force_login(self.me)
+        self.assertEqual(self.client.get(reverse("rankings"), {"band": "brunch"}).status_code, 400)
+        self.assertEqual(self.client.get(reverse("rankings"), {"yen": "inf"}).status_code, 400)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RunJobsTests(TestCase):
+    """run_jobs：1つのジョブが落ちても残りは走り、DB 全体に効くジョブは間隔内に1回だけ走ること。"""
+
+    def setUp(self):
+        caches["shared"].clear()
+        # テストはトランザクションの中で走るので、周期ごとの接続の後始末はしない（テストクライアントと同じ）
+        patcher = mock.patch("core.management.commands.run_jobs.close_old_connections")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        user = User.objects.create(username="jobs")
+        DeliveryRecord.objects.create(user=user, date=datetime.date(2026, 10, 12), area_slug="shibuya",
+                                      start_time=datetime.time(18), end_time=datetime.time(23),
+                                      hours_worked=Decimal("5"), earnings=9000)
+
+    def test_failure_is_logged_and_other_jobs_run(self):
+        self.assertTrue(RankingDirty.objects.exists())
+        with mock.patch.object(heat, "build", side_effect=RuntimeError("boom")), \
+                self.assertLogs("core.jobs", "INFO") as logs:
+            call_command("run_jobs", once=True, only=["heat", "rankings"])
+        self.assertTrue(any("heat failed" in line and "boom" in line for line in logs.output))
+        self.assertFalse(RankingDirty.objects.exists())
+        self.assertTrue(EarningsSketch.objects.exists())
+
+    def test_cluster_jobs_run_once_per_interval(self):
+        with mock.patch.object(rankings, "build", return_value=0) as build:
+            call_command("run_jobs", once=True, only=["rankings"])
+            call_command("run_jobs", once=True, only=["rankings"])  # 別のレプリカ（共有キャッシュの印で見送る）
+        self.assertEqual(build.call_count, 1)
+        caches["shared"].clear()
+        with mock.patch.dict(os.environ, {"HEAT_BUILD_SEC": "0"}), \
+                mock.patch.object(rankings, "build") as build:
+            call_command("run_jobs", once=True, only=["rankings"])
+        build.assert_not_called()
+
+
+@override_settings(CACHES=TEST_CACHES)
+class HeatPyramidTests(TestCase):
+    """ヒートマップのタイル：符号化・ピラミッドの足し上げ・少数セルの時給の非表示・同意・ETag。"""
+
+    def setUp(self):
+        caches["default"].clear()
+        heat._generation_cache.update(value=None, checked_at=0.0)
+        self.me = User.objects.create(username="me")
+        self.other = User.objects.create(username="other")
+        UserAiConsent.objects.filter(user=self.other).update(share_aggregated=False)
+        self.area = AREA_INDEX["shibuya"]
+        self.day = datetime.date(2026, 10, 1)
+
+    def _record(self, user, i, **kw):
+        return DeliveryRecord.objects.create(user=user, date=self.day + datetime.timedelta(days=i), area_slug="shibuya",
+                                             hours_worked=Decimal("2"), earnings=3000, **kw)
+
+    def _tile_of(self, z):
+        cx, cy = heat.cell_of(self.area["lat"], self.area["lng"], z)
+        return z, cx // heat.GRID, cy // heat.GRID
+
+    def _area_cell(self, z=heat.Z_MAX):
+        cx, cy = heat.cell_of(self.area["lat"], self.area["lng"], z)
+        return HeatCell.objects.get(z=z, cx=cx, cy=cy)
+
+    @staticmethod
+    def _decode(payload: bytes) -> tuple:
+        magic, version, grid, z, n = heat._HEADER.unpack_from(payload)
+        pos, vals = heat._HEADER.size, []
+        while pos < len(payload):
+            v = shift = 0
+            while True:
+                b = payload[pos]
+                pos += 1
+                v |= (b & 0x7F) << shift
+                shift += 7
+                if b < 0x80:
+                    break
+            vals.append(v)
+        cells, idx = [], 0
+        for k in range(0, len(vals), 4):
+            idx += vals[k]
+            cells.append((idx, *vals[k + 1:k + 4]))
+        return (magic, version, grid, z, n), cells
+
+    def test_encode_decode(self):
+        cells = [(0, 0, 1, 0), (5, 1234, 3, 2), (1023, 98765, 200, 40000)]
+        header, decoded = self._decode(heat.encode_binary(14, cells))
+        self.assertEqual(header, (heat.MAGIC, heat.VERSION, heat.GRID, 14, len(cells)))
+        self.assertEqual(decoded, cells)
+        body = json.loads(heat.encode_json(14, cells))
+        idx, flat = 0, body["cells"]
+        for k, cell in enumerate(cells):
+            idx += flat[4 * k]
+            self.assertEqual((idx, *flat[4 * k + 1:4 * k + 4]), cell)
+
+    def test_pyramid_sums_consenting_records_and_entrances(self):
+        for i in range(3):
+            self._record(self.me, i)
+        self._record(self.other, 0)
+        EntranceInfo.objects.create(user=self.other, address="a", latitude=self.area["lat"], longitude=self.area["lng"])
+        EntranceInfo.objects.create(user=self.other, address="b")  # 座標なし
+        heat.build()
+        for z in range(heat.Z_MIN, heat.Z_MAX + 1):
+            cells = HeatCell.objects.filter(z=z)
+            self.assertEqual(sum(c.records for c in cells), 3)  # 不同意ユーザーの記録は入らない
+            self.assertEqual(sum(c.entrances for c in cells), 1)
+            self.assertAlmostEqual(sum(c.earnings for c in cells), 9000)
+        for child in HeatCell.objects.filter(z=heat.Z_MAX):
+            parent = HeatCell.objects.get(z=heat.Z_MAX - 1, cx=child.cx >> 1, cy=child.cy >> 1)
+            kids = HeatCell.objects.filter(z=heat.Z_MAX, cx__in=[parent.cx * 2, parent.cx * 2 + 1],
+                                           cy__in=[parent.cy * 2, parent.cy * 2 + 1])
+            self.assertEqual(parent.records, sum(k.records for k in kids))
+            self.assertEqual(parent.entrances, sum(k.entrances for k in kids))
+        self.assertEqual(heat.step(), 0)  # 新着なし
+
+    def test_wage_hidden_below_min_records(self):
+        for i in range(heat.MIN_RECORDS - 1):
+            self._record(self.me, i)
+        heat.build()
+        z, x, y = self._tile_of(heat.Z_MAX)
+        self.assertEqual([c[1:3] for c in heat.tile_cells(z, x, y)], [(0, heat.MIN_RECORDS - 1)])
+        self._record(self.me, heat.MIN_RECORDS)
+        heat.build()
+        self.assertEqual([c[1:3] for c in heat.tile_cells(z, x, y)], [(1500, heat.MIN_RECORDS)])
+
+    def test_late_commit_is_picked_up(self):
+        early, late = self._record(self.me, 0), self._record(self.me, 1)
+        early_id = early.pk
+        early.delete()  # 先に採番されたがまだコミットされていない行の代わり
+        heat.build()
+        self.assertEqual(self._area_cell().records, 1)
+        self._record(self.me, 0, id=early_id)  # 同じ id で後からコミット
+        heat.build()
+        self.assertEqual(self._area_cell().records, 2)
+        self.assertEqual(late.pk, heat._tail(heat.CURSOR_RECORDS).high)
+
+    def test_consent_change_adds_and_removes_counted_records(self):
+        self._record(self.other, 0)
+        self._record(self.me, 0)
+        heat.build()
+        self.assertEqual(self._area_cell().records, 1)
+        row = UserAiConsent.objects.get(user=self.other)
+        row.share_aggregated = True
+        row.save()
+        self.assertEqual(self._area_cell().records, 2)
+        for z in range(heat.Z_MIN, heat.Z_MAX + 1):
+            self.assertEqual(self._area_cell(z).records, 2)
+        heat.build()  # 同意後にテールが同じ行を二重に数えない
+        self.assertEqual(self._area_cell().records, 2)
+        row.share_aggregated = False
+        row.save()
+        self.assertEqual(self._area_cell().records, 1)
+        self.assertAlmostEqual(self._area_cell().earnings, 3000)
+
+    def test_etag_and_not_modified_without_writes(self):
+        for i in range(3):
+            self._record(self.me, i)
+        heat.build()
+        url = reverse("heat_tile", args=self._tile_of(heat.Z_MAX))
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(self._decode(first.content)[1][0][1:3], (1500, 3))
+        with CaptureQueriesContext(connection) as ctx:
+            again = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(again.status_code, 304)
+        self.assertFalse([q for q in ctx.captured_queries if not q["sql"].lstrip().upper().startswith("SELECT")])
+        self._record(self.me, 3)
+        heat.build()
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], first["ETag"])
+        self.assertEqual(self.client.get(url, {"format": "xml"}).status_code, 400)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class LiveTailTests(TestCase):
+    """当日テール：遅れてコミットされた行・不同意ユーザー・チェックポイントの欠番と、オーバーレイの予測。"""
+
+    def setUp(self):
+        caches["default"].clear()
+        caches["shared"].clear()
+        live.reset()
+        self.addCleanup(live.reset)
+        self.users = [User.objects.create(username=f"courier{i}") for i in range(3)]
+        UserAiConsent.objects.filter(user=self.users[2]).update(share_aggregated=False)
+        self.today = timezone.localdate()
+
+    def _record(self, user, hour, **kw):
+        return DeliveryRecord.objects.create(user=user, date=self.today, area_slug="shibuya",
+                                             start_time=datetime.time(hour), end_time=datetime.time(hour + 1),
+                                             hours_worked=Decimal("1"), earnings=1500, orders_completed=2, **kw)
+
+    def test_late_commit_is_picked_up_across_checkpoint(self):
+        early = self._record(self.users[0], 10)
+        self._record(self.users[1], 11)
+        self._record(self.users[2], 12)  # 不同意
+        early_id = early.pk
+        early.delete()  # 先に採番されたがまだコミットされていない行の代わり
+        self.assertEqual(live.current_stats().n_observed, 1)
+        live.checkpoint(force=True)
+        self.assertIn(early_id, [i for i, _t in LiveCheckpoint.objects.get().gaps])
+
+        self._record(self.users[0], 10, id=early_id)
+        live.reset()  # 再起動：チェックポイントの欠番から続きを読む
+        stats = live.current_stats()
+        now = time.time()
+        self.assertGreater(stats.slot("shibuya", 10, now)["weight"], 0)
+        self.assertEqual(stats.slot("shibuya", 12, now)["weight"], 0)
+        self.assertNotIn(early_id, live._state["tail"].gaps)
+
+    def test_overlay_uses_shared_forecast(self):
+        with mock.patch.object(page_data, "_compute_forecast",
+                               side_effect=lambda day, hour: {slug: 1200.0 for slug in live.SLUGS}) as compute:
+            for _ in range(2):
+                body = live.overlay()
+        self.assertEqual({a["forecast_wage_per_h"] for a in body["areas"]}, {1200})
+        self.assertEqual(compute.call_count, 1)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SyncApiTests(TestCase):
+    """/api/sync が前回のトークン以降の変更・削除だけを番号順に返すこと。"""
+
+    def setUp(self):
+        self.user = User.objects.create(username="courier")
+        self.client.force_login(self.user)
+        self.day = datetime.date(2026, 10, 1)
+        self.recs = [DeliveryRecord.objects.create(user=self.user, date=self.day + datetime.timedelta(days=i),
+                                                   earnings=1000 + i) for i in range(3)]
+        self.entrance = EntranceInfo.objects.create(user=self.user, address="渋谷区道玄坂2-3-1")
+
+    def _sync(self, since=None, **params):
+        if since is not None:
+            params["since"] = since
+        resp = self.client.get(reverse("sync"), params)
+        self.assertEqual(resp.status_code, 200)
+        return resp.json()
+
+    def _ids(self, body, kind):
+        if kind not in body:
+            return []
+        return [row[body[kind]["fields"].index("id")] for row in body[kind]["rows"]]
+
+    def test_full_then_delta(self):
+        full = self._sync()
+        self.assertFalse(full["reset"] or full["more"])
+        self.assertEqual(self._ids(full, "records"), [r.id for r in self.recs])
+        self.assertEqual(self._ids(full, "entrances"), [self.entrance.id])
+
+        self.recs[0].earnings = 5000
+        self.recs[0].save(update_fields=["earnings"])
+        gone = self.recs[1].id
+        self.recs[1].delete()
+        new = DeliveryRecord.objects.create(user=self.user, date=self.day + datetime.timedelta(days=9), earnings=1)
+        DeliveryRecord.objects.create(user=User.objects.create(username="other"), date=self.day, earnings=1)
+
+        delta = self._sync(full["token"])
+        self.assertEqual(self._ids(delta, "records"), [self.recs[0].id, new.id])
+        self.assertEqual(delta["deleted"]["records"], [gone])
+        self.assertNotIn("entrances", delta)
+        self.assertNotIn("records", self._sync(delta["token"]))
+
+    def test_pagination_and_reset(self):
+        token, seen = "", []
+        for _ in range(10):
+            page = self._sync(token, limit=1)
+            seen += self._ids(page, "records") + self._ids(page, "entrances")
+            token = page["token"]
+            if not page["more"]:
+                break
+        self.assertEqual(seen, [r.id for r in self.recs] + [self.entrance.id])
+
+        other = User.objects.create(username="other")
+        self.assertTrue(self._sync(sync.make_token(other.pk, 1))["reset"])
+        self.assertTrue(self._sync("garbage")["reset"])
+
+        old = token
+        self.recs[2].delete()
+        SyncTombstone.objects.update(deleted_at=datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc))
+        self.assertEqual(sync.prune_tombstones(), 1)
+        reset = self._sync(old)
+        self.assertTrue(reset["reset"])
+        self.assertEqual(self._ids(reset, "records"), [r.id for r in self.recs[:2]])
+
+    def test_archiving_leaves_no_tombstones(self):
+        full = self._sync()
+        OcrImport.objects.create(user=self.user, image="", raw_text="x", created_record=self.recs[0])
+        ocr_token = self._sync(full["token"])["token"]
+        archive.archive_deliveries(self.day + datetime.timedelta(days=1))
+        self.assertFalse(SyncTombstone.objects.exists())
+        self.assertEqual(self._sync(ocr_token), {"reset": False, "more": False, "token": ocr_token})
+        self.assertEqual(self._ids(self._sync(), "records"), [r.id for r in self.recs[1:]])
+
+    def test_user_deletion_leaves_no_sync_rows(self):
+        self.user.delete()
+        self.assertFalse(SyncState.objects.filter(user_id=self.user.pk).exists())
+        self.assertFalse(SyncTombstone.objects.exists())
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SyncMigrationTests(TransactionTestCase):
+    """0014 の後も入口の検索索引（SQLite のトリガー）が生きていること。post_migrate に頼らずに確かめる。"""
+
+    def test_entrance_found_after_migrate(self):
+        executor = MigrationExecutor(connection)
+        leaf = executor.loader.graph.leaf_nodes("core")
+        executor.migrate([("core", "0013_earningssketch")])
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(leaf)
+        if connection.vendor == "sqlite":  # Postgres で pg_trgm が無い環境は走査になる
+            self.assertTrue(entrance_search.index_ok())
+
+        user = User.objects.create(username="courier")
+        e = EntranceInfo.objects.create(user=user, address="渋谷区道玄坂2-3-1", note="裏口")
+        self.client.force_login(user)
+        body = self.client.get(reverse("entrance_search"), {"q": "道玄坂二丁目3番1号"}).json()
+        self.assertEqual([r["id"] for r in body["results"]], [e.id])
@@ -2,6 +2,12 @@ from django.urls import path
 from django.views.generic import TemplateView
 from django.contrib.auth import views as auth_views
 from .views_auth import SignupView
+from .views_entrances import entrance_search_view
+from .views_export import export_records
+from .views_heat import heat_tile
+from .views_live import live_overlay
+from .views_rankings import ranking_view
+from .views_sync import sync_view
 
 urlpatterns = [
     path("", TemplateView.as_view(template_name="home.html"), name="home"),
@@ -10,4 +16,22 @@ urlpatterns = [
     path("accounts/login/",  auth_views.LoginView.as_view(template_name="registration/login.html"), name="login"),
     path("accounts/logout/", auth_views.LogoutView.as_view(next_page="home"), name="logout"),
     path("accounts/signup/", SignupView.as_view(), name="signup"),
+
+    # エクスポート（ストリーミング）
+    path("records/export", export_records, name="records_export"),
+
+    # 当日の実績によるライブ補正（surge / slump）
+    path("live/overlay", live_overlay, name="live_overlay"),
+
+    # ヒートマップのグリッドタイル
+    path("heat/<int:z>/<int:x>/<int:y>", heat_tile, name="heat_tile"),
+
+    # 入口情報の住所・メモ検索
+    path("entrances/search", entrance_search_view, name="entrance_search"),
+
+    # 同意ユーザーの中での 円/h の順位
+    path("rankings", ranking_view, name="rankings"),
+
+    # モバイル向けの差分同期
+    path("sync", sync_view, name="sync"),
 ]
@@ -0,0 +1,40 @@
+# core/views_entrances.py
+from django.contrib.auth.decorators import login_required
+from django.http import HttpResponseBadRequest, JsonResponse
+from django.views.decorators.http import require_GET
+
+from . import entrance_search
+
+MAX_LIMIT = 50
+
+
+def _photo_url(f):
+    return f.url if f else None
+
+
+@require_GET
+@login_required
+def entrance_search_view(request):
+    """
+    GET /api/entrances/search?q=<住所・メモの一部>&limit=20
+    全角半角・丁目/番地/号・漢数字の揺れを正規化し、部分一致 → あいまい一致の順にスコア付きで返す。
+    """
+    q = (request.GET.get("q") or "").strip()
+    if not q:
+        return HttpResponseBadRequest("q is required")
+    try:
+        limit = max(1, min(MAX_LIMIT, int(request.GET.get("limit", 20))))
+    except ValueError:
+        return HttpResponseBadRequest("limit must be an integer")
+
+    rows = entrance_search.search(q, limit=limit)
+    results = [{
+        "id": e.id, "address": e.address, "note": e.note or "",
+        "latitude": e.latitude, "longitude": e.longitude,
+        "photos": [u for u in (_photo_url(e.photo1), _photo_url(e.photo2), _photo_url(e.photo3)) if u],
+        "posted_by": e.user.username, "created_at": e.created_at.isoformat(timespec="seconds"),
+        "score": round(e.score, 3),
+    } for e in rows]
+    return JsonResponse({"query": q, "normalized": entrance_search.normalize_address(q),
+                         "backend": entrance_search.backend(), "results": results},
+                        json_dumps_params={"ensure_ascii": False})
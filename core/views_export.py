@@ -0,0 +1,64 @@
+# core/views_export.py
+import datetime
+
+from django.contrib.auth.decorators import login_required
+from django.http import HttpResponseBadRequest, HttpResponseForbidden, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.http import require_GET
+
+from .areas import AREA_INDEX
+from .export import ENCODERS, FORMATS, gzip_stream, iter_rows, parquet_available
+
+
+def _parse_date(value):
+    return datetime.date.fromisoformat(value) if value else None
+
+
+@require_GET
+@login_required
+def export_records(request):
+    """
+    GET /api/records/export?format=csv|ndjson|parquet&since=YYYY-MM-DD&until=...&area=<slug>&gzip=1
+    staff のみ user=<id> / user=all で他ユーザー・全ユーザーを出力できる。
+    """
+    fmt = request.GET.get("format", "csv")
+    if fmt not in ENCODERS:
+        return HttpResponseBadRequest("format must be csv, ndjson or parquet")
+    if fmt == "parquet" and not parquet_available():
+        return HttpResponseBadRequest("parquet export is not available (pyarrow not installed)")
+    try:
+        since = _parse_date(request.GET.get("since"))
+        until = _parse_date(request.GET.get("until"))
+    except ValueError:
+        return HttpResponseBadRequest("since / until must be YYYY-MM-DD")
+    area = request.GET.get("area") or None
+    if area and area not in AREA_INDEX:
+        return HttpResponseBadRequest("unknown area")
+
+    target = request.GET.get("user")
+    if target and target != str(request.user.pk):
+        if not request.user.is_staff:
+            return HttpResponseForbidden("staff only")
+        if target == "all":
+            user_ids = None
+        else:
+            try:
+                user_ids = [int(x) for x in target.split(",")]
+            except ValueError:
+                return HttpResponseBadRequest("user must be an id list or 'all'")
+    else:
+        user_ids = [request.user.pk]
+
+    content_type, ext = FORMATS[fmt]
+    stream = ENCODERS[fmt](iter_rows(user_ids, since, until, area))
+    filename = f"delivery_records_{timezone.localdate():%Y%m%d}.{ext}"
+    # Parquet は列ごとに zstd 圧縮済みなので gzip しない
+    if request.GET.get("gzip") in ("1", "true") and fmt != "parquet":
+        stream = gzip_stream(stream)
+        content_type, filename = "application/gzip", filename + ".gz"
+
+    resp = StreamingHttpResponse(stream, content_type=content_type)
+    resp["Content-Disposition"] = f'attachment; filename="{filename}"'
+    resp["X-Accel-Buffering"] = "no"  # リバースプロキシでバッファさせない
+    resp["Cache-Control"] = "private, no-store"
+    return resp
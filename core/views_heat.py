@@ -0,0 +1,33 @@
+# core/views_heat.py
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseNotFound
+from django.views.decorators.http import condition, require_GET
+
+from . import heat
+
+
+def _fmt(request):
+    return "json" if request.GET.get("format") == "json" else "bin"
+
+
+def _tile_etag(request, z, x, y):
+    if not heat.valid_tile(z, x, y) or request.GET.get("format", "bin") not in heat.ENCODERS:
+        return None
+    return heat.tile(z, x, y, _fmt(request))[1]
+
+
+@require_GET
+@condition(etag_func=_tile_etag)
+def heat_tile(request, z, x, y):
+    """
+    GET /api/heat/{z}/{x}/{y}[?format=json]
+    グリッドセルごとの 円/h・実績件数・入口件数。バイナリの形式は core.heat（_HEADER と encode_binary）を参照。
+    """
+    if request.GET.get("format", "bin") not in heat.ENCODERS:
+        return HttpResponseBadRequest("format must be bin or json")
+    if not heat.valid_tile(z, x, y):
+        return HttpResponseNotFound(f"zoom must be {heat.Z_MIN}..{heat.Z_MAX}")
+    fmt = _fmt(request)
+    payload, _etag = heat.tile(z, x, y, fmt)
+    resp = HttpResponse(payload, content_type=heat.ENCODERS[fmt][0])
+    resp["Cache-Control"] = f"public, max-age={heat.MAX_AGE_SEC}"
+    return resp
@@ -0,0 +1,16 @@
+# core/views_live.py
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+
+from . import live
+
+
+@require_GET
+def live_overlay(request):
+    """
+    GET /api/live/overlay
+    当日の実績から推定したエリア別の現在時給と、予測に対する surge / slump 判定。
+    """
+    resp = JsonResponse(live.overlay(), json_dumps_params={"ensure_ascii": False})
+    resp["Cache-Control"] = f"public, max-age={int(live.TAIL_INTERVAL_SEC)}"
+    return resp
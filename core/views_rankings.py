@@ -0,0 +1,38 @@
+# core/views_rankings.py
+import math
+
+from django.contrib.auth.decorators import login_required
+from django.http import HttpResponseBadRequest, HttpResponseForbidden, JsonResponse
+from django.views.decorators.http import require_GET
+
+from . import rankings
+from .consent import has_ai_consent
+
+
+@require_GET
+@login_required
+def ranking_view(request):
+    """
+    GET /api/rankings?area=<slug|all>&dow=<0-6|weekday|weekend|all>&band=<時間帯|all>[&yen=1800]
+    同意ユーザーの 円/h の分布の中での順位。yen を省くと本人の記録（同じまとまり）の加重平均で出す。
+    集計データの提供に同意しているユーザーのみ。
+    """
+    if not has_ai_consent(request.user.pk):
+        return HttpResponseForbidden("rankings are available to users who share aggregated data")
+    area, dow, band = (request.GET.get(k, rankings.ALL) for k in ("area", "dow", "band"))
+    try:
+        group = rankings.parse_group(area, dow, band)
+        yen = float(request.GET["yen"]) if request.GET.get("yen") else None
+        if yen is not None and not math.isfinite(yen):
+            raise ValueError("yen must be a finite number")
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    own_hours = None
+    if yen is None:
+        yen, own_hours = rankings.user_rate(request.user.pk, group)
+    body = {"area": area, "dow": dow, "band": band, **rankings.ranking(group, yen)}
+    if own_hours is not None:
+        body["own_hours"] = round(own_hours, 1)
+    resp = JsonResponse(body, json_dumps_params={"ensure_ascii": False})
+    resp["Cache-Control"] = "private, max-age=60"
+    return resp
@@ -0,0 +1,25 @@
+# core/views_sync.py
+from django.contrib.auth.decorators import login_required
+from django.http import HttpResponseBadRequest, JsonResponse
+from django.views.decorators.http import require_GET
+
+from . import sync
+
+
+@require_GET
+@login_required
+def sync_view(request):
+    """
+    GET /api/sync?since=<token>&limit=500
+    前回の token 以降に変わった本人の記録・入口・OCR 状態と削除された id。
+    token を省くと全件。more が true の間は返ってきた token で続きを取る。reset が true なら手元を捨てて入れ替える。
+    """
+    try:
+        limit = max(1, min(sync.MAX_LIMIT, int(request.GET.get("limit", sync.DEFAULT_LIMIT))))
+    except ValueError:
+        return HttpResponseBadRequest("limit must be an integer")
+    since = sync.parse_token(request.user.pk, request.GET.get("since", ""))
+    resp = JsonResponse(sync.changes(request.user.pk, since, limit),
+                        json_dumps_params={"ensure_ascii": False, "separators": (",", ":")})
+    resp["Cache-Control"] = "private, no-store"
+    return resp
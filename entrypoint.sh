@@ -10,8 +10,29 @@ if [ -n "$VISION_SA_JSON" ]; then
 fi
 
 # 静的ファイルとDB
-python manage.py collectstatic --noinput
-python manage.py migrate --noinput || true
+# ビルド時のスタンプ（.build_stamp.json）と変わっていなければ collectstatic / migrate は省略
+# 強制したいときは BOOT_FORCE_PREPARE=1
+if [ "${BOOT_FORCE_PREPARE:-0}" = "1" ]; then
+  python manage.py boot_prepare --force
+else
+  python manage.py boot_prepare
+fi
+
+# 定期ジョブ（予測補正・特徴量ストア・ヒートマップ・順位）：manage.py run_jobs がひとつの長寿命プロセスで回す
+# - 間隔は FEATURE_REFRESH_SEC / HEAT_BUILD_SEC（0 でそのジョブを無効）。失敗はジョブごとにログへ出して続ける
+# - 特徴量ストアはこのコンテナのファイルなので、既定では gunicorn と同じコンテナで回す。
+#   プロセスが落ちたらここで起こし直す
+# - DB 全体に効くジョブは共有キャッシュで間隔内1回に絞る（複数ホストなら DN_SHARED_CACHE=db）
+# - 別のワーカーサービスで `python manage.py run_jobs` を動かすなら RUN_JOBS=0
+if [ "${RUN_JOBS:-1}" = "1" ]; then
+  (
+    while true; do
+      python manage.py run_jobs && break
+      echo "[entrypoint] run_jobs exited ($?), restarting in 10s" >&2
+      sleep 10
+    done
+  ) &
+fi
 
 # 起動
 exec gunicorn config.wsgi:application --bind 0.0.0.0:${PORT:-8000} --workers 3 --timeout 120
@@ -0,0 +1,105 @@
+// static/js/home.js
+// ホーム：エリア地図＋おすすめルート
+(function(){
+  const WARD_POS = DN_DATA.ward_pos || {};
+  const routeColor = () => getComputedStyle(document.documentElement).getPropertyValue('--brand-2').trim() || '#00a36c';
+
+  let map, heatMarkers=[], routeLine=null, routeStops=[];
+  (function initMap(){
+    map = DNMap.createMap(document.getElementById('leafletMap'));
+    DNMap.heatLayer().addTo(map);
+
+    drawHeat(DN_DATA.areas || []);
+    fitToHeat();
+
+    const sel = document.getElementById('jumpSelect');
+    Object.keys(WARD_POS).forEach(w=>{const o=document.createElement('option');o.value=w;o.textContent=w;sel.appendChild(o);});
+    document.getElementById('btnJump').addEventListener('click', ()=>{const w=sel.value;const pos=WARD_POS[w];if(pos) map.setView(pos,13,{animate:true});});
+    document.getElementById('btnLocate').addEventListener('click', ()=>{
+      if(!navigator.geolocation) return alert('位置情報が使えません');
+      navigator.geolocation.getCurrentPosition(p=>{
+        const pt=[p.coords.latitude,p.coords.longitude]; map.setView(pt,15,{animate:true});
+        L.circleMarker(pt,{radius:8,color:'#22c55e',fillColor:'#22c55e',fillOpacity:.9,weight:2}).addTo(map).bindPopup('現在地');
+      }, ()=>alert('現在地を取得できませんでした'));
+    });
+    document.getElementById('btnReload').addEventListener('click', loadLive);
+
+    loadRoute();
+  })();
+
+  function drawHeat(items, clear=false){
+    if (clear||heatMarkers.length){ heatMarkers.forEach(m=>map.removeLayer(m)); heatMarkers=[]; }
+    heatMarkers=DNMap.drawAreaMarkers(map, items, WARD_POS);
+    document.getElementById('mapInfo').textContent=`表示件数：${heatMarkers.length}`;
+  }
+  // 当日の実績によるライブ補正（/api/live/overlay）。判定できないエリアは予測のまま
+  const LIVE_MARK={surge:' ↑', slump:' ↓'};
+  function loadLive(){
+    fetch('/api/live/overlay',{credentials:'same-origin'})
+      .then(r=>r.ok?r.json():Promise.reject(r.status))
+      .then(d=>{
+        const next=(d.areas||[]).map(a=>({
+          ...a,
+          area:a.area+(LIVE_MARK[a.status]||''),
+          wage_per_h:(a.status==='insufficient'?a.forecast_wage_per_h:a.live_wage_per_h)||a.forecast_wage_per_h,
+        }));
+        drawHeat(next,true);
+        const n=next.filter(a=>a.status==='surge'||a.status==='slump').length;
+        document.getElementById('mapInfo').textContent+=`　ライブ補正：${d.generated_at.slice(11,16)}${n?`（変動 ${n} エリア）`:''}`;
+      })
+      .catch(()=>{ document.getElementById('mapInfo').textContent+='　ライブ補正を取得できませんでした'; });
+  }
+  function fitToHeat(){ if(!heatMarkers.length) return; map.fitBounds(L.featureGroup(heatMarkers).getBounds().pad(0.2)); }
+
+  function loadRoute(){
+    const list=document.getElementById('routeList');
+    const items = Array.isArray(DN_DATA.plan)? DN_DATA.plan : [];
+    list.innerHTML = items.map((it,i)=>`
+      <li class="route-card" data-idx="${i}">
+        <div class="route-time">${it.time}</div>
+        <div class="route-area">${it.area||'—'}${it.to?` <span class="muted">→ ${it.to}</span>`:''} ${it.note?`<div class="small muted">${it.note}</div>`:''}</div>
+        <div class="route-wage">${it.wage_per_h?('¥'+it.wage_per_h):'—'}/h</div>
+      </li>`).join('');
+
+    const coords = items.map(it=>{
+      if (Array.isArray(it.center)&&it.center.length===2) return it.center;
+      if (it.lat!=null && it.lng!=null) return [Number(it.lat),Number(it.lng)];
+      return WARD_POS[it.area||'']||null;
+    }).filter(Boolean);
+
+    if (routeLine){ map.removeLayer(routeLine); routeLine=null; }
+    routeStops.forEach(m=>map.removeLayer(m)); routeStops=[];
+    if (coords.length>=2){
+      routeLine=L.polyline(coords,{ color:routeColor(), weight:5, opacity:.9 }).addTo(map);
+      coords.forEach((pt,i)=>{
+        const m=L.circleMarker(pt,{ radius:7, color:routeColor(), fillColor:routeColor(), fillOpacity:.9, weight:2 })
+          .addTo(map)
+          .bindPopup(`<div><strong>${items[i].time}</strong>　${items[i].area||'—'}${items[i].to?` → ${items[i].to}`:''}<br>${items[i].wage_per_h?`目安：¥${items[i].wage_per_h}/h`:'目安：—'}</div>`);
+        routeStops.push(m);
+      });
+      map.fitBounds(routeLine.getBounds().pad(0.25));
+    }
+
+    list.addEventListener('click',(e)=>{
+      const li=e.target.closest('.route-card'); if(!li) return;
+      const i=Number(li.dataset.idx); const pt=coords[i]; if(!pt) return;
+      list.querySelectorAll('.route-card').forEach(x=>x.classList.remove('active'));
+      li.classList.add('active');
+      map.setView(pt, Math.max(map.getZoom(), 13), { animate:true });
+      if (routeStops[i]) routeStops[i].openPopup();
+    });
+
+    document.getElementById('btnGPX').addEventListener('click', ()=>{
+      if (!coords.length) return alert('ルートがありません');
+      const head=`<?xml version="1.0" encoding="UTF-8"?><gpx version="1.1" creator="DN" xmlns="http://www.topografix.com/GPX/1/1"><trk><name>DN Route</name><trkseg>`;
+      const body=coords.map(c=>`<trkpt lat="${c[0]}" lon="${c[1]}"></trkpt>`).join('');
+      const foot=`</trkseg></trk></gpx>`;
+      const blob=new Blob([head+body+foot],{type:'application/gpx+xml'});
+      const a=document.createElement('a'); a.href=URL.createObjectURL(blob); a.download='dn_route.gpx'; a.click(); URL.revokeObjectURL(a.href);
+    });
+    document.getElementById('btnCopy').addEventListener('click', ()=>{
+      const text = items.map(it=>`${it.time}  ${it.area||'—'}${it.to?` → ${it.to}`:''}  ${it.wage_per_h?('¥'+it.wage_per_h+'/h'):''}  ${it.note||''}`).join('\n');
+      navigator.clipboard.writeText(text).then(()=> alert('コピーしました'));
+    });
+  }
+})();
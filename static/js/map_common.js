@@ -0,0 +1,64 @@
+// static/js/map_common.js
+// home / map ページ共通の Leaflet 処理
+(function(){
+  const CENTER_TOKYO = [35.681236,139.767125];
+  const levelColor = (w)=> (w>=1800 ? '#18a058' : (w>=1600 ? '#c4852e' : '#9ca3af'));
+
+  function createMap(el){
+    const map = L.map(el, { zoomControl:true }).setView(CENTER_TOKYO, 12);
+    L.tileLayer('https://{s}.basemaps.cartocdn.com/dark_all/{z}/{x}/{y}{r}.png',{
+      attribution:'&copy; OpenStreetMap & Carto',maxZoom:19
+    }).addTo(map);
+    return map;
+  }
+
+  // DN_DATA.areas の各エントリを色付き circleMarker として描画し、marker 配列を返す
+  function drawAreaMarkers(map, items, wardPos){
+    const markers=[];
+    (items||[]).forEach(it=>{
+      const name=it.area||'エリア'; const wage=Number(it.wage_per_h||0);
+      const center=Array.isArray(it.center)&&it.center.length===2 ? it.center : ((wardPos||{})[name]||null);
+      if(!center) return;
+      const color=levelColor(wage);
+      const m=L.circleMarker(center,{radius:10,color,fillColor:color,fillOpacity:.6,weight:2}).addTo(map);
+      const mine=((window.DN_DATA||{}).personal||{})[it.slug];
+      m.bindPopup(`<strong>${name}</strong><br>${wage?`目安：¥${wage}/h`:'目安：—'}${mine?`<br>あなたの目安：¥${mine}/h`:''}`);
+      markers.push(m);
+    });
+    return markers;
+  }
+
+  // /api/heat/{z}/{x}/{y} のグリッドセルを canvas タイルとして描く（形式は core/heat.py）
+  // 時給が出ているセルは levelColor、入口情報だけのセルは青。濃さは件数の対数
+  const HEAT_MIN_ZOOM=10, HEAT_MAX_ZOOM=16;
+  function drawHeatTile(canvas, buf){
+    const v=new DataView(buf); const bytes=new Uint8Array(buf);
+    const grid=v.getUint8(5); const n=v.getUint32(8,true);
+    let off=12;
+    const varint=()=>{ let x=0, s=0, b; do{ b=bytes[off++]; x+=(b&0x7f)*2**s; s+=7; }while(b&0x80); return x; };
+    const ctx=canvas.getContext('2d'); const px=canvas.width/grid;
+    for(let i=0,idx=0;i<n;i++){
+      idx+=varint(); const wage=varint(), records=varint(), entrances=varint();
+      const count=wage?records:entrances;
+      ctx.globalAlpha=Math.min(.75, .2+Math.log10(1+count)*.18);
+      ctx.fillStyle=wage?levelColor(wage):'#3b82f6';
+      ctx.fillRect((idx%grid)*px,Math.floor(idx/grid)*px,px,px);
+    }
+  }
+  function heatLayer(){
+    const Layer=L.GridLayer.extend({
+      createTile(coords, done){
+        const tile=document.createElement('canvas'); const size=this.getTileSize();
+        tile.width=size.x; tile.height=size.y;
+        fetch(`/api/heat/${coords.z}/${coords.x}/${coords.y}`,{credentials:'same-origin'})
+          .then(r=>r.ok?r.arrayBuffer():Promise.reject(r.status))
+          .then(buf=>{ drawHeatTile(tile, buf); done(null, tile); })
+          .catch(e=>done(e, tile));
+        return tile;
+      }
+    });
+    return new Layer({minNativeZoom:HEAT_MIN_ZOOM, maxNativeZoom:HEAT_MAX_ZOOM, minZoom:HEAT_MIN_ZOOM-2, opacity:.85});
+  }
+
+  window.DNMap = { CENTER_TOKYO, levelColor, createMap, drawAreaMarkers, heatLayer };
+})();
@@ -0,0 +1,9 @@
+// static/js/map_page.js
+// /map/ ページ
+(function(){
+  const WARD_POS = DN_DATA.ward_pos || {};
+  const map = DNMap.createMap('mapFull');
+  DNMap.heatLayer().addTo(map);
+  const markers = DNMap.drawAreaMarkers(map, DN_DATA.areas || [], WARD_POS);
+  if (markers.length) map.fitBounds(L.featureGroup(markers).getBounds().pad(0.2));
+})();